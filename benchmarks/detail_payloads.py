@@ -0,0 +1,80 @@
+"""
+Size and serialize/deserialize cost of cached movie details, per storage format.
+
+Each sample is a movie details cache entry as ``cached_fetch`` stores it,
+encoded the way django-redis writes it to Redis:
+
+- ``pickle/raw``: the full TMDb document, pickled (the previous behaviour);
+- ``pickle/record``: the ``MovieRecord`` projection, pickled;
+- ``msgpack/record``: the projection as msgpack;
+- ``msgpack+zlib/record``: as above, zlib-compressed above
+  ``CACHE_COMPRESS_MIN_BYTES`` (the current settings).
+
+Sizes are the bytes Redis stores per value; the per-key overhead is the same
+for every format. The documents come from the TMDb stub, which mimics the
+shape and field sizes of real ``/movie/{id}`` responses.
+
+    python -m benchmarks.detail_payloads --movies 2000
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django_redis.compressors.identity import IdentityCompressor  # noqa: E402
+from django_redis.exceptions import CompressorError  # noqa: E402
+from django_redis.serializers.msgpack import MSGPackSerializer  # noqa: E402
+from django_redis.serializers.pickle import PickleSerializer  # noqa: E402
+
+from benchmarks.tmdb_stub import movie_details  # noqa: E402
+from movies.cache_compression import ThresholdZlibCompressor  # noqa: E402
+from movies.records import MovieRecord  # noqa: E402
+
+
+def formats():
+    options = {'COMPRESS_MIN_LENGTH': settings.CACHE_COMPRESS_MIN_BYTES}
+    pickle_serializer, msgpack_serializer = PickleSerializer({}), MSGPackSerializer({})
+    identity, zlib = IdentityCompressor({}), ThresholdZlibCompressor(options)
+    return [
+        ('pickle/raw', pickle_serializer, identity, lambda document: document),
+        ('pickle/record', pickle_serializer, identity, lambda document: MovieRecord.from_tmdb(document).to_dict()),
+        ('msgpack/record', msgpack_serializer, identity, lambda document: MovieRecord.from_tmdb(document).to_dict()),
+        ('msgpack+zlib/record', msgpack_serializer, zlib, lambda document: MovieRecord.from_tmdb(document).to_dict()),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=2000, help='Number of sample detail payloads')
+    args = parser.parse_args()
+
+    documents = [movie_details(movie_id) for movie_id in range(1, args.movies + 1)]
+    baseline = None
+    for label, serializer, compressor, project in formats():
+        entries = [{'value': project(document), 'fresh_until': time.time()} for document in documents]
+
+        started = time.perf_counter()
+        encoded = [compressor.compress(serializer.dumps(entry)) for entry in entries]
+        dumps_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for value in encoded:
+            try:
+                value = compressor.decompress(value)
+            except CompressorError:
+                pass  # Stored uncompressed (below the threshold); django-redis reads it the same way
+            serializer.loads(value)
+        loads_elapsed = time.perf_counter() - started
+
+        total = sum(len(value) for value in encoded)
+        baseline = baseline or total
+        print(f"{label:<20} {total / len(encoded):>8.0f} B/entry  {total / 2 ** 20:>7.2f} MB total "
+              f"({total / baseline:>6.1%})  dumps {dumps_elapsed / len(encoded) * 1e6:>6.1f} us  "
+              f"loads {loads_elapsed / len(encoded) * 1e6:>6.1f} us")
+
+
+if __name__ == '__main__':
+    main()
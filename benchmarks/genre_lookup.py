@@ -0,0 +1,62 @@
+"""
+Cost of mapping genre names to TMDb ids: ORM query per call vs. in-memory index.
+
+The ORM path is the query ``map_genres_to_ids`` ran before the genre index
+existed (a case-insensitive ``IN`` lookup on the genre table).
+
+    python -m benchmarks.genre_lookup --iterations 20000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.utils import setup_django
+
+setup_django()
+
+from django.core.management import call_command  # noqa: E402
+from django.db.models.functions import Lower  # noqa: E402
+
+from benchmarks.tmdb_stub import GENRES  # noqa: E402
+from movies.genre_index import get_genre_index  # noqa: E402
+from movies.models import Genre  # noqa: E402
+
+
+def orm_lookup(names):
+    lowered = [name.lower() for name in names]
+    return list(Genre.objects.annotate(name_lower=Lower('name')).filter(name_lower__in=lowered)
+                .values_list('tmdb_id', flat=True))
+
+
+def index_lookup(names):
+    return get_genre_index().ids_for(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    Genre.objects.bulk_create([Genre(tmdb_id=tmdb_id, name=name) for tmdb_id, name in GENRES], ignore_conflicts=True)
+
+    rng = random.Random(args.seed)
+    names = [name for _, name in GENRES]
+    queries = [
+        [rng.choice([name, name.lower(), name.upper()]) for name in rng.sample(names, rng.randint(1, 3))]
+        for _ in range(args.iterations)
+    ]
+    get_genre_index()  # Exclude the one-off load from the timing
+
+    for label, lookup in (('orm', orm_lookup), ('index', index_lookup)):
+        started = time.perf_counter()
+        for query in queries:
+            lookup(query)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<6} {args.iterations:>7} lookups  {elapsed / args.iterations * 1e6:>9.2f} us/lookup  "
+              f"{args.iterations / elapsed:>12.0f} lookups/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Request latency with synchronous vs. queued logging.
+
+Drives the movie detail view (served from cache, so logging is a large part
+of each request) from a thread pool under each logging setup, with the log
+files in a temporary directory and the console sent to /dev/null:
+
+- ``sync``: the previous setup, ``FileHandler``s written and flushed by the
+  request threads;
+- ``queued``: the project ``LOGGING`` (``movieapp.logging_handlers``);
+- ``queued+sampled``: the same, keeping 10% of the records below WARNING.
+
+``--flush-latency`` adds a delay to every flush of a log file, as on a busy
+or network disk; the sync setup pays it on every record, in the request.
+
+    python -m benchmarks.logging_overhead --requests 20000 --threads 8 --flush-latency 0.001
+"""
+import argparse
+import copy
+import logging
+import logging.config
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.utils import setup_django, summarize
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+import movieapp.settings as project_settings  # noqa: E402
+from benchmarks.tmdb_stub import StubTMDbServer  # noqa: E402
+from movieapp.logging_handlers import BatchingFileHandler  # noqa: E402
+from movies.views import MovieDetailView  # noqa: E402
+
+
+def slow_flush(handler_class, latency):
+    class SlowFlushHandler(handler_class):
+        def flush(self):
+            super().flush()
+            time.sleep(latency)
+
+    return SlowFlushHandler
+
+
+def logging_config(variant, log_dir, console, flush_latency):
+    config = copy.deepcopy(project_settings.LOGGING)
+    handlers = config['handlers']
+    for handler in handlers.values():
+        if 'filename' in handler:
+            handler['filename'] = os.path.join(log_dir, os.path.basename(handler['filename']))
+    handlers['console']['stream'] = console
+
+    for name in ('application_file', 'error_file'):
+        handler_class = logging.FileHandler if variant == 'sync' else BatchingFileHandler
+        handlers[name]['()'] = slow_flush(handler_class, flush_latency)
+        del handlers[name]['class']
+    if variant == 'sync':
+        for name in [name for name in handlers if name.startswith('queue_')]:
+            del handlers[name]
+        config['loggers']['application']['handlers'] = ['application_file', 'console']
+        config['loggers']['error']['handlers'] = ['error_file', 'console']
+        config['root']['handlers'] = ['application_file', 'error_file', 'console']
+    elif variant == 'queued+sampled':
+        config['filters']['sampling']['rate'] = 0.1
+    return config
+
+
+def run(requests, threads):
+    view = MovieDetailView.as_view()
+    factory = RequestFactory()
+
+    def call(movie_id):
+        started = time.perf_counter()
+        response = view(factory.get(f'/api/movie/{movie_id}/'), movie_id=movie_id)
+        response.render()
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    movie_ids = [1 + i % 100 for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, movie_ids))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--flush-latency', type=float, default=0.0, help='Seconds added to each log file flush')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    stub = StubTMDbServer(latency=0)
+    settings.TMDB_API_URL = stub.start()
+    run(100, 1)  # Fill the cache: every measured request is a hit
+
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as console:
+        for variant in ('sync', 'queued', 'queued+sampled'):
+            logging.config.dictConfig(logging_config(variant, log_dir, console, args.flush_latency))
+            run(1000, args.threads)  # Warm up
+            latencies, elapsed = run(args.requests, args.threads)
+            logging.shutdown()  # Flush what is still queued before the next variant
+            summarize(variant, latencies, elapsed)
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Sustained rating writes/sec: one transaction per submission vs. write-behind buffer.
+
+Submits ratings from several threads through ``RatingView``, first saving each
+one synchronously, then with ``RATINGS_WRITE_BEHIND`` on while a drainer
+thread saves the buffered ratings in batches. For the buffered mode both the
+rate at which submissions are accepted and the end-to-end rate (until every
+rating is in the database) are reported.
+
+Needs Redis streams: runs against an in-process fakeredis server unless
+BENCHMARK_REDIS is set to a Redis URL.
+
+    python -m benchmarks.rating_writes --requests 5000 --threads 8
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('BENCHMARK_REDIS', 'fake')
+
+from benchmarks.utils import setup_django, summarize  # noqa: E402
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django_redis import get_redis_connection  # noqa: E402
+from rest_framework.test import APIRequestFactory, force_authenticate  # noqa: E402
+
+from movies.models import MovieRating, MovieRatingStats  # noqa: E402
+from movies.rating_buffer import drain  # noqa: E402
+from movies.views import RatingView  # noqa: E402
+
+
+def submit_all(user, count, threads, expected_status):
+    view = RatingView.as_view()
+    factory = APIRequestFactory()
+    rng = random.Random(42)
+    payloads = [{'movie_id': rng.randint(1, 5000), 'rating': rng.randint(1, 10) / 2} for _ in range(count)]
+    errors = []
+
+    def call(payload):
+        started = time.perf_counter()
+        request = factory.post('/api/ratings/', payload, format='json')
+        force_authenticate(request, user=user)
+        try:
+            response = view(request)
+            if response.status_code != expected_status:
+                errors.append(response.status_code)
+        except Exception as e:  # e.g. "database is locked" under write contention
+            errors.append(type(e).__name__)
+        finally:
+            connections.close_all()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, payloads))
+    return latencies, time.perf_counter() - started, errors
+
+
+def reset():
+    MovieRating.objects.all().delete()
+    MovieRatingStats.objects.all().delete()
+    get_redis_connection('default').delete(settings.RATINGS_STREAM)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    user, _ = User.objects.get_or_create(username='benchmark')
+
+    reset()
+    settings.RATINGS_WRITE_BEHIND = False
+    latencies, elapsed, errors = submit_all(user, args.requests, args.threads, 201)
+    summarize('sync (201)', latencies, elapsed)
+    print(f"{'':<28} saved {MovieRating.objects.count()}  errors {len(errors)}")
+
+    reset()
+    settings.RATINGS_WRITE_BEHIND = True
+    submitting = threading.Event()
+    submitting.set()
+
+    def drainer():
+        while submitting.is_set():
+            if not drain():
+                time.sleep(0.05)
+        connections.close_all()
+
+    thread = threading.Thread(target=drainer)
+    started = time.perf_counter()
+    thread.start()
+    latencies, elapsed, errors = submit_all(user, args.requests, args.threads, 202)
+    submitting.clear()
+    thread.join()
+    drain()
+    total = time.perf_counter() - started
+    summarize('buffered (202)', latencies, elapsed)
+    saved = MovieRating.objects.count()
+    print(f"{'':<28} saved {saved}  errors {len(errors)}  end-to-end {saved / total:.1f} ratings/s")
+
+
+if __name__ == '__main__':
+    main()
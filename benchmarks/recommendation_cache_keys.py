@@ -0,0 +1,100 @@
+"""
+Recommendation cache hit ratio with raw vs. normalized cache keys.
+
+Replays a mix of recommendation request bodies through an unbounded cache and
+compares the old key (``f"recommendations_{request.data}"``) with the key of
+the normalized preferences. A recorded mix can be given as a JSONL file with
+one request body per line; otherwise a synthetic mix is generated in which
+clients ask for a Zipf-distributed set of queries, each phrased in varying
+ways (key order, genre order, names vs. ids, casing, extra fields).
+
+    python -m benchmarks.recommendation_cache_keys --requests 20000
+    python -m benchmarks.recommendation_cache_keys --requests-file recorded.jsonl
+"""
+import argparse
+import json
+import random
+
+from benchmarks.utils import setup_django
+
+setup_django()
+
+from django.core.management import call_command  # noqa: E402
+from rest_framework.exceptions import ValidationError  # noqa: E402
+
+from benchmarks.tmdb_stub import GENRES  # noqa: E402
+from movies.models import Genre  # noqa: E402
+from movies.preferences import RecommendationPreferences  # noqa: E402
+
+EXTRA_FIELDS = [{}, {}, {'client': 'ios'}, {'client': 'web', 'session': 'abc'}, {'page_hint': 1}]
+
+
+def phrase(rng, genre_ids, language, release_year):
+    """
+    One of the many ways a client may phrase the same query.
+    """
+    names = dict(GENRES)
+    genres = [
+        rng.choice([str(genre_id), names[genre_id], names[genre_id].lower(), names[genre_id].upper()])
+        for genre_id in genre_ids
+    ]
+    rng.shuffle(genres)
+    fields = [
+        ('genres', genres),
+        ('language', rng.choice([language, language.upper()])),
+        ('release_year', rng.choice([release_year, str(release_year)])),
+    ]
+    fields += list(rng.choice(EXTRA_FIELDS).items())
+    rng.shuffle(fields)
+    return dict(fields)
+
+
+def synthetic_mix(count, queries, seed):
+    rng = random.Random(seed)
+    genre_ids = [genre_id for genre_id, _ in GENRES]
+    pool = [
+        (rng.sample(genre_ids, rng.randint(1, 3)), rng.choice(['en', 'fr', 'de', 'es']), rng.randint(1970, 2024))
+        for _ in range(queries)
+    ]
+    weights = [1 / rank for rank in range(1, queries + 1)]
+    return [phrase(rng, *query) for query in rng.choices(pool, weights=weights, k=count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests-file', help='JSONL file with one recommendation request body per line')
+    parser.add_argument('--requests', type=int, default=20_000, help='Size of the synthetic mix')
+    parser.add_argument('--queries', type=int, default=500, help='Distinct queries in the synthetic mix')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    Genre.objects.bulk_create([Genre(tmdb_id=tmdb_id, name=name) for tmdb_id, name in GENRES], ignore_conflicts=True)
+
+    if args.requests_file:
+        with open(args.requests_file) as f:
+            mix = [json.loads(line) for line in f if line.strip()]
+    else:
+        mix = synthetic_mix(args.requests, args.queries, args.seed)
+
+    for name in ('raw', 'normalized'):
+        seen, hits, key_bytes, invalid = set(), 0, 0, 0
+        for data in mix:
+            if name == 'raw':
+                key = f"recommendations_{data}"
+            else:
+                try:
+                    key = RecommendationPreferences.from_request_data(data).cache_key()
+                except ValidationError:
+                    invalid += 1
+                    continue
+            hits += key in seen
+            seen.add(key)
+            key_bytes += len(key)
+        served = max(len(mix) - invalid, 1)
+        print(f"{name:<11} hit ratio {hits / served:6.1%}  distinct keys {len(seen):>7}  "
+              f"avg key {key_bytes / served:6.1f} bytes  rejected {invalid}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Django settings for running the benchmarks on a developer machine.
+
+Extends the project settings with an in-process cache and a throwaway SQLite
+database, so benchmarks need neither Redis nor the project database (unless
+BENCHMARK_REDIS is set, see below). The TMDb
+base URL is pointed at the stub server by each benchmark at start-up.
+"""
+import os
+import tempfile
+
+# Placeholders for the variables movieapp.settings reads without defaults.
+for name, value in {
+    'TMDB_API_KEY': 'benchmark',
+    'REDIS_HOST': 'localhost',
+    'REDIS_PORT': '6379',
+    'REDIS_PASSWORD': '',
+    'ACCESS_TOKEN_LIFETIME': '1',
+    'REFRESH_TOKEN_LIFETIME': '1',
+}.items():
+    os.environ.setdefault(name, value)
+
+from movieapp.settings import *  # noqa: E402,F401,F403
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    }
+}
+
+# Benchmarks that need Redis itself (e.g. streams) run with BENCHMARK_REDIS set to
+# a Redis URL, or to "fake" for an in-process fakeredis server.
+BENCHMARK_REDIS = os.environ.get('BENCHMARK_REDIS')
+if BENCHMARK_REDIS:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://fakeredis:6379/0' if BENCHMARK_REDIS == 'fake' else BENCHMARK_REDIS,
+            'OPTIONS': {**CACHE_OPTIONS},  # noqa: F405
+        }
+    }
+    if BENCHMARK_REDIS == 'fake':
+        import fakeredis
+        CACHES['default']['OPTIONS']['CONNECTION_POOL_KWARGS'] = {'connection_class': fakeredis.FakeConnection}
+
+# Background tasks (stale refreshes, prefetches) are queued in memory and never run,
+# so requests pay for enqueuing them as in production, without a broker.
+CELERY_BROKER_URL = 'memory://localhost/'
+CELERY_RESULT_BACKEND = 'cache+memory://localhost/'
+
+# The fake TMDb server has no quota; benchmarks measure MovieApp, not the rate limit
+TMDB_RATE_LIMIT = 0
+
+# Host of the requests made with django.test.Client
+ALLOWED_HOSTS = [*ALLOWED_HOSTS, 'testserver']  # noqa: F405
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'movieapp_benchmark.sqlite3'),
+    }
+}
+
+# Only warnings and errors, on the console; file logging would dominate the numbers.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'level': 'WARNING'},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+}
@@ -0,0 +1,244 @@
+"""
+Load-test suite: throughput, latency percentiles and allocations per endpoint.
+
+Drives each scenario through the whole Django stack (middleware, URL routing,
+JWT authentication, rendering) from a fixed number of threads, against the
+fake TMDb server running in its own process:
+
+- ``recommendations``: ``POST /api/recommendations/`` over a pool of preferences;
+- ``detail``: ``GET /api/movie/<id>/`` over a pool of movie ids;
+- ``ratings_list``: ``GET /api/ratings/``, first page of a user with ``--ratings`` ratings;
+- ``rating_create``: ``POST /api/ratings/``.
+
+Request sequences are seeded, and the cache and ratings are reset first, so
+runs are comparable. Every scenario starts cold: the first requests for each
+preference or movie miss the cache, the rest hit it; the hit ratio is reported.
+Each scenario then runs again for ``--alloc-requests`` requests under
+``tracemalloc`` (which is slow, so it is not timed) to measure the memory
+allocated at peak and kept afterwards.
+
+Uses an in-process fakeredis server as the cache unless BENCHMARK_REDIS is set
+to a Redis URL. ``--output`` writes the results as JSON; ``--compare`` prints
+the change against an earlier ``--output`` file.
+
+    python -m benchmarks.suite --requests 2000 --threads 8 --output before.json
+    python -m benchmarks.suite --requests 2000 --threads 8 --compare before.json
+    python -m benchmarks.suite --latency 0.1 --error-rate 0.02 --scenarios detail recommendations
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('BENCHMARK_REDIS', 'fake')
+
+from benchmarks.utils import percentile, setup_django, summarize  # noqa: E402
+
+setup_django()
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from benchmarks.tmdb_stub import GENRES, start_stub_process  # noqa: E402
+from movies.caching import cache_stats  # noqa: E402
+from movies.models import MovieRating, MovieRatingStats  # noqa: E402
+from movies.ratings import upsert_ratings  # noqa: E402
+from movies.tiered_cache import tiered_cache  # noqa: E402
+
+SCENARIOS = ('recommendations', 'detail', 'ratings_list', 'rating_create')
+
+
+def scenario_requests(name, count, args, rng):
+    """
+    The ``(method, path, json body)`` of ``count`` requests of scenario ``name``.
+    """
+    if name == 'recommendations':
+        genre_ids = [genre_id for genre_id, _ in GENRES]
+        pool = [
+            {'genres': sorted(rng.sample(genre_ids, 2)), 'language': rng.choice(['en', 'fr', 'es']),
+             'release_year': rng.randint(1990, 2024)}
+            for _ in range(args.preferences)
+        ]
+        return [('post', '/api/recommendations/', rng.choice(pool)) for _ in range(count)]
+    if name == 'detail':
+        # Outside the range of the mirror and the ratings, so details come from cache or TMDb
+        return [('get', f'/api/movie/{100_000 + rng.randrange(args.movies)}/', None) for _ in range(count)]
+    if name == 'ratings_list':
+        return [('get', '/api/ratings/', None)] * count
+    if name == 'rating_create':
+        return [
+            ('post', '/api/ratings/', {'movie_id': rng.randint(1, 50_000), 'rating': rng.randint(1, 10) / 2})
+            for _ in range(count)
+        ]
+    raise ValueError(f"Unknown scenario {name}")
+
+
+def drive(requests, threads, token):
+    """
+    Send ``requests`` from ``threads`` threads, each with its own client.
+
+    :return: ``(latencies, elapsed, statuses)``
+    """
+    clients = threading.local()
+
+    def call(request):
+        method, path, body = request
+        client = getattr(clients, 'client', None)
+        if client is None:
+            client = clients.client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {token}')
+        started = time.perf_counter()
+        if body is None:
+            response = getattr(client, method)(path)
+        else:
+            response = getattr(client, method)(path, body, content_type='application/json')
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(call, requests))
+    elapsed = time.perf_counter() - started
+    return [latency for latency, _ in results], elapsed, Counter(status for _, status in results)
+
+
+def reset(user, ratings):
+    """
+    Empty the cache and give ``user`` exactly ``ratings`` ratings.
+    """
+    cache.clear()
+    tiered_cache.local.clear()
+    MovieRating.objects.all().delete()
+    MovieRatingStats.objects.all().delete()
+    rng = random.Random(0)
+    upsert_ratings([
+        {'user': user, 'movie_id': movie_id, 'rating': rng.randint(1, 10) / 2}
+        for movie_id in range(1, ratings + 1)
+    ])
+
+
+def run_scenario(name, args, user, token):
+    reset(user, args.ratings)
+    before = cache_stats()
+    latencies, elapsed, statuses = drive(scenario_requests(name, args.requests, args, random.Random(args.seed)),
+                                         args.threads, token)
+    after = cache_stats()
+    summarize(name, latencies, elapsed)
+
+    # Allocations, on a fresh start of the same scenario
+    reset(user, args.ratings)
+    requests = scenario_requests(name, args.alloc_requests, args, random.Random(args.seed))
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    drive(requests, args.threads, token)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    lookups = sum(after[state] - before[state] for state in ('hit', 'stale', 'miss'))
+    hits = sum(after[state] - before[state] for state in ('hit', 'stale'))
+    result = {
+        'requests': len(latencies),
+        'threads': args.threads,
+        'elapsed_s': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'cache_hit_ratio': round(hits / lookups, 4) if lookups else None,
+        'alloc_peak_kib': round((peak - baseline) / 1024, 1),
+        'alloc_retained_kib_per_request': round((current - baseline) / 1024 / len(requests), 3),
+    }
+    print(f"{'':<28} statuses {result['statuses']}  cache hit ratio {result['cache_hit_ratio']}  "
+          f"alloc peak {result['alloc_peak_kib']} KiB  retained {result['alloc_retained_kib_per_request']} KiB/req")
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """
+    Print the change of each scenario's throughput and latency percentiles against an earlier run.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    for name, result in results.items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        changes = '  '.join(
+            f"{metric} {(result[metric] - previous[metric]) / previous[metric]:>+7.1%}"
+            for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'alloc_peak_kib')
+            if previous[metric]
+        )
+        print(f"{name:<28} {changes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=2000, help='Timed requests per scenario')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent requests')
+    parser.add_argument('--alloc-requests', type=int, default=200, help='Requests per scenario under tracemalloc')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake TMDb response delay in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of TMDb requests that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of the failed TMDb requests')
+    parser.add_argument('--preferences', type=int, default=50, help='Distinct recommendation preferences')
+    parser.add_argument('--movies', type=int, default=500, help='Distinct movie ids asked for details')
+    parser.add_argument('--ratings', type=int, default=200, help='Ratings of the benchmark user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    stub, settings.TMDB_API_URL = start_stub_process(
+        latency=args.latency, error_rate=args.error_rate, error_status=args.error_status,
+    )
+    user, _ = User.objects.get_or_create(username='benchmark')
+    token = str(AccessToken.for_user(user))
+
+    drive(scenario_requests('detail', 50, args, random.Random(0)), args.threads, token)  # Warm up
+    results = {name: run_scenario(name, args, user, token) for name in args.scenarios}
+    stub.terminate()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cache': settings.CACHES['default']['LOCATION'] if 'LOCATION' in settings.CACHES['default'] else 'locmem',
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
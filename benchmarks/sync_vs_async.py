@@ -0,0 +1,95 @@
+"""
+Throughput of the sync (WSGI-style) and async (ASGI) movie detail views.
+
+Every request asks for a different movie, so each one misses the cache and
+waits on the fake TMDb server. The sync stack is driven from a thread pool the
+size of a gunicorn worker's thread count; the async stack is driven from a
+single event loop with many requests in flight, as one uvicorn worker would be.
+
+    python -m benchmarks.sync_vs_async --requests 2000 --latency 0.25 --threads 16 --concurrency 1000
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.utils import setup_django, summarize
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import AsyncRequestFactory, RequestFactory  # noqa: E402
+
+from benchmarks.tmdb_stub import start_stub_process  # noqa: E402
+from movies.async_views import AsyncMovieDetailView  # noqa: E402
+from movies.views import MovieDetailView  # noqa: E402
+
+
+def run_sync(movie_ids, threads):
+    view = MovieDetailView.as_view()
+    factory = RequestFactory()
+
+    def call(movie_id):
+        started = time.perf_counter()
+        response = view(factory.get(f'/api/movie/{movie_id}/'), movie_id=movie_id)
+        response.render()
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, movie_ids))
+    return latencies, time.perf_counter() - started
+
+
+async def run_async(movie_ids, concurrency):
+    view = AsyncMovieDetailView.as_view()
+    factory = AsyncRequestFactory()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(movie_id):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await view(factory.get(f'/api/async/movie/{movie_id}/'), movie_id=movie_id)
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(call(movie_id) for movie_id in movie_ids))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per stack')
+    parser.add_argument('--latency', type=float, default=0.25, help='Fake TMDb response delay in seconds')
+    parser.add_argument('--threads', type=int, default=16, help='Threads driving the sync view')
+    parser.add_argument('--concurrency', type=int, default=1000, help='Requests in flight for the async view')
+    parser.add_argument('--tmdb-url', help='Use an already running stub instead of starting one')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)  # The detail views check the local movie mirror first
+
+    stub = None
+    if args.tmdb_url:
+        settings.TMDB_API_URL = args.tmdb_url
+    else:
+        stub, settings.TMDB_API_URL = start_stub_process(latency=args.latency)
+    settings.TMDB_POOL_SIZE = max(settings.TMDB_POOL_SIZE, args.threads)
+
+    print(f"TMDb latency {args.latency * 1000:.0f} ms, {args.requests} requests per stack")
+    sync_ids = range(1, args.requests + 1)
+    async_ids = range(args.requests + 1, 2 * args.requests + 1)  # Disjoint, so nothing is cached
+
+    latencies, elapsed = run_sync(sync_ids, args.threads)
+    summarize(f"sync ({args.threads} threads)", latencies, elapsed)
+    latencies, elapsed = asyncio.run(run_async(async_ids, args.concurrency))
+    summarize(f"async ({args.concurrency} in flight)", latencies, elapsed)
+
+    if stub is not None:
+        stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
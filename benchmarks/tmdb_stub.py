@@ -0,0 +1,294 @@
+"""
+Local fake of the TMDb API used by the benchmarks.
+
+Serves the endpoints MovieApp calls with deterministic, realistically sized
+JSON after a configurable delay, optionally failing a fraction of requests
+(``error_rate``) with ``error_status``, as TMDb does when throttling (429) or
+degraded (5xx). It is built on asyncio streams so it can hold
+thousands of concurrent keep-alive connections without a thread per socket.
+
+Run it standalone and point ``TMDB_API_URL`` at it to load-test a real server:
+
+    python -m benchmarks.tmdb_stub --port 8001 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import random
+import threading
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = '/3'
+
+GENRES = [
+    (28, 'Action'), (12, 'Adventure'), (16, 'Animation'), (35, 'Comedy'), (80, 'Crime'),
+    (99, 'Documentary'), (18, 'Drama'), (10751, 'Family'), (14, 'Fantasy'), (36, 'History'),
+    (27, 'Horror'), (10402, 'Music'), (9648, 'Mystery'), (10749, 'Romance'), (878, 'Science Fiction'),
+    (10770, 'TV Movie'), (53, 'Thriller'), (10752, 'War'), (37, 'Western'),
+]
+
+CHANGES_PER_DAY = 150
+CHANGES_PAGE_SIZE = 100
+
+REASONS = {
+    200: 'OK', 404: 'Not Found', 429: 'Too Many Requests', 500: 'Internal Server Error', 502: 'Bad Gateway',
+    503: 'Service Unavailable',
+}
+
+
+def movie_summary(movie_id):
+    """
+    Discover-style list entry for ``movie_id``; identical across calls.
+    """
+    rng = random.Random(movie_id)
+    genre_ids = sorted(rng.sample([genre_id for genre_id, _ in GENRES], 2))
+    return {
+        'adult': False,
+        'backdrop_path': f'/backdrop{movie_id}.jpg',
+        'genre_ids': genre_ids,
+        'id': movie_id,
+        'original_language': 'en',
+        'original_title': f'Movie {movie_id}',
+        'overview': ' '.join(['A story about movie', str(movie_id)] * 20),
+        'popularity': round(rng.uniform(1, 500), 3),
+        'poster_path': f'/poster{movie_id}.jpg',
+        'release_date': f'{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'title': f'Movie {movie_id}',
+        'video': False,
+        'vote_average': round(rng.uniform(1, 10), 1),
+        'vote_count': rng.randint(0, 30000),
+    }
+
+
+def movie_details(movie_id):
+    """
+    ``/movie/{id}`` document for ``movie_id``, including the fields MovieApp never renders.
+    """
+    rng = random.Random(movie_id)
+    summary = movie_summary(movie_id)
+    genre_names = dict(GENRES)
+    details = {key: value for key, value in summary.items() if key != 'genre_ids'}
+    details.update({
+        'belongs_to_collection': None,
+        'budget': rng.randint(0, 300_000_000),
+        'genres': [{'id': genre_id, 'name': genre_names[genre_id]} for genre_id in summary['genre_ids']],
+        'homepage': f'https://example.com/movies/{movie_id}',
+        'imdb_id': f'tt{movie_id:07d}',
+        'origin_country': ['US'],
+        'production_companies': [
+            {'id': rng.randint(1, 10000), 'logo_path': f'/logo{i}.png', 'name': f'Studio {i}', 'origin_country': 'US'}
+            for i in range(rng.randint(1, 5))
+        ],
+        'production_countries': [{'iso_3166_1': 'US', 'name': 'United States of America'}],
+        'revenue': rng.randint(0, 2_000_000_000),
+        'runtime': rng.randint(70, 200),
+        'spoken_languages': [{'english_name': 'English', 'iso_639_1': 'en', 'name': 'English'}],
+        'status': 'Released',
+        'tagline': f'The tagline of movie {movie_id}.',
+    })
+    return details
+
+
+class StubTMDbServer:
+    """
+    Fake TMDb server running on its own event loop in a background thread.
+
+    :param latency: Seconds to wait before answering each request
+    :param error_rate: Fraction of requests (0 to 1) answered with ``error_status`` instead
+    :param error_status: HTTP status of the injected errors
+    :param seed: Seed of the injected errors, so runs fail the same requests
+    :param retry_after: ``Retry-After`` seconds sent with the injected errors, if any
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, error_rate=0.0, error_status=503, seed=0,
+                 retry_after=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.errors_injected = 0
+        self.connections_opened = 0
+        self._rng = random.Random(seed)
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self._writers = set()  # Of the open connections
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    def route(self, path, params):
+        """
+        Return ``(status, payload)`` for a request path relative to the API prefix.
+        """
+        if path == '/genre/movie/list':
+            return 200, {'genres': [{'id': genre_id, 'name': name} for genre_id, name in GENRES]}
+        if path == '/discover/movie':
+            page = int(params.get('page', '1'))
+            seed = zlib.crc32(json.dumps(sorted(params.items())).encode())
+            first_id = 1 + (seed % 50_000) + (page - 1) * 20
+            return 200, {
+                'page': page,
+                'results': [movie_summary(movie_id) for movie_id in range(first_id, first_id + 20)],
+                'total_pages': 500,
+                'total_results': 10_000,
+            }
+        if path == '/movie/changes':
+            return 200, self.changes(params)
+        if path.startswith('/movie/'):
+            movie_id = path[len('/movie/'):]
+            if movie_id.isdigit():
+                return 200, movie_details(int(movie_id))
+        return 404, {'success': False, 'status_code': 34, 'status_message': 'The resource you requested could not be found.'}
+
+    def changes(self, params):
+        """
+        ``/movie/changes`` page: a fixed set of changed movie ids per day.
+        """
+        today = datetime.date.today()
+        start = datetime.date.fromisoformat(params.get('start_date', (today - datetime.timedelta(days=1)).isoformat()))
+        end = datetime.date.fromisoformat(params.get('end_date', today.isoformat()))
+        page = int(params.get('page', '1'))
+        movie_ids = []
+        for offset in range((end - start).days + 1):
+            day = (start + datetime.timedelta(days=offset)).toordinal()
+            movie_ids.extend((day * 7919 + n * 104729) % 900_000 + 1 for n in range(CHANGES_PER_DAY))
+        movie_ids = list(dict.fromkeys(movie_ids))
+        total_pages = max(1, -(-len(movie_ids) // CHANGES_PAGE_SIZE))
+        first = (page - 1) * CHANGES_PAGE_SIZE
+        return {
+            'results': [{'id': movie_id, 'adult': False} for movie_id in movie_ids[first:first + CHANGES_PAGE_SIZE]],
+            'page': page,
+            'total_pages': total_pages,
+            'total_results': len(movie_ids),
+        }
+
+    async def _respond(self, target):
+        url = urlsplit(target)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        params = {key: values[-1] for key, values in parse_qs(url.query).items() if key != 'api_key'}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors_injected += 1
+            return self.error_status, {'success': False, 'status_code': 0, 'status_message': 'Injected error.'}
+        return self.route(path, params)
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        self.connections_opened += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                # Drain the headers; requests are bodiless GETs.
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                _, target, _ = request_line.decode('latin-1').split(' ', 2)
+                status_code, payload = await self._respond(target)
+                body = json.dumps(payload).encode()
+                headers = (
+                    f"HTTP/1.1 {status_code} {REASONS.get(status_code, 'Error')}\r\n"
+                    f"Content-Type: application/json;charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: keep-alive\r\n"
+                )
+                if status_code == self.error_status and self.retry_after is not None:
+                    headers += f"Retry-After: {self.retry_after}\r\n"
+                self.requests_served += 1  # Before answering, so clients never see a stale count
+                writer.write(f"{headers}\r\n".encode('latin-1') + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            # Close the open keep-alive connections while the loop still runs: their handlers
+            # would otherwise be closed at interpreter exit, after the loop ("Event loop is closed")
+            handlers = asyncio.all_tasks() - {asyncio.current_task()}
+            for writer in list(self._writers):
+                writer.close()  # The handler reads EOF and returns
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+    def start(self):
+        """
+        Start serving in a background thread and return the API base URL.
+        """
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._task = self._loop.create_task(self._serve())
+            try:
+                self._loop.run_until_complete(self._task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='tmdb-stub', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():  # Stopping twice is harmless
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            self._thread.join(timeout=5)
+
+
+def _serve_in_child(queue, host, port, latency, error_rate, error_status):
+    server = StubTMDbServer(host, port, latency, error_rate, error_status)
+    queue.put(server.start())
+    server._thread.join()
+
+
+def start_stub_process(host='127.0.0.1', port=0, latency=0.05, error_rate=0.0, error_status=503):
+    """
+    Run the stub in a separate process, so it does not compete with the code
+    under test for the GIL. Returns ``(process, base_url)``; terminate the
+    process when done.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_serve_in_child, args=(queue, host, port, latency, error_rate, error_status),
+                              daemon=True)
+    process.start()
+    return process, queue.get(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds to wait before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of the injected errors')
+    args = parser.parse_args()
+
+    server = StubTMDbServer(args.host, args.port, args.latency, args.error_rate, args.error_status)
+    print(f"Fake TMDb API listening on {server.start()}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import math
+import os
+
+
+def setup_django():
+    """
+    Configure Django with the benchmark settings unless a settings module is already set.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of ``values`` (0 < pct <= 100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[rank]
+
+
+def summarize(name, latencies, elapsed):
+    """
+    Print one result line with throughput and latency percentiles (milliseconds).
+    """
+    count = len(latencies)
+    print(
+        f"{name:<28} {count:>7} req  {count / elapsed:>9.1f} req/s  "
+        f"p50 {percentile(latencies, 50) * 1000:>8.1f}  "
+        f"p95 {percentile(latencies, 95) * 1000:>8.1f}  "
+        f"p99 {percentile(latencies, 99) * 1000:>8.1f} ms"
+    )
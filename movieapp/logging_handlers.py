@@ -0,0 +1,186 @@
+"""
+Non-blocking logging for request threads.
+
+Loggers hand their records to a ``QueueHandler`` (built by ``queue_handler``),
+which only puts them on an in-memory queue. A single listener thread takes
+them off in batches, formats them and passes them to the real handlers; the
+file handlers (``BatchingFileHandler``) write a whole batch before flushing
+once, instead of flushing after every record.
+
+Records are formatted on the listener thread, so the arguments of a log call
+should not be mutated after the call (pass ids and small values, not live
+objects).
+
+``SamplingFilter`` and ``RateLimitFilter`` thin out chatty records below
+WARNING before they are even queued; warnings and errors always get through.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+def _handler_by_name(name):
+    getter = getattr(logging, 'getHandlerByName', None)  # Python 3.12+
+    return getter(name) if getter else logging._handlers.get(name)
+
+
+class BatchingFileHandler(logging.FileHandler):
+    """
+    ``FileHandler`` that leaves flushing to its caller (``BatchingQueueListener``
+    flushes after each batch), so a batch costs one write system call instead of
+    one per record.
+    """
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    ``QueueListener`` that drains up to ``batch_size`` records at a time and
+    flushes its handlers once per batch. A batch ends as soon as the queue is
+    empty, so records are never held back waiting for more.
+    """
+
+    def __init__(self, log_queue, *handlers, batch_size=500):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        while True:
+            record = self.dequeue(True)
+            batch = [record]
+            while record is not self._sentinel and len(batch) < self.batch_size:
+                try:
+                    record = self.dequeue(False)
+                except queue.Empty:
+                    break
+                batch.append(record)
+
+            for record in batch:
+                if record is not self._sentinel:
+                    self.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+            if batch[-1] is self._sentinel:
+                return
+
+
+class DeferredFormattingQueueHandler(QueueHandler):
+    """
+    ``QueueHandler`` that queues records as they are. The stock handler merges
+    the message and its arguments (and renders tracebacks) on the calling
+    thread; with an in-process queue, the listener thread can do that instead.
+
+    Closing it (e.g. in ``logging.shutdown`` at exit) stops its listener, which
+    writes out the records still queued.
+    """
+    listener = None
+
+    def prepare(self, record):
+        return record
+
+    def restart_after_fork(self):
+        # Forked workers (gunicorn, Celery prefork) inherit the listener but not its thread.
+        # They get a fresh queue: records still queued in the parent stay the parent's.
+        if self.listener is not None:
+            self.queue = self.listener.queue = queue.SimpleQueue()
+            self.listener._thread = None
+            self.listener.start()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+def queue_handler(handlers, batch_size=500):
+    """
+    ``logging.config`` factory for a ``QueueHandler`` feeding a background
+    ``BatchingQueueListener`` that owns the named ``handlers``::
+
+        'queue_application': {
+            '()': 'movieapp.logging_handlers.queue_handler',
+            'handlers': ['application_file', 'error_file', 'console'],
+        }
+
+    The named handlers must be configured too, but not attached to loggers.
+    ``logging.config`` configures handlers in name order, so they must sort
+    before the queue handler's name (e.g. name it ``queue_*``).
+    """
+    targets = [_handler_by_name(name) for name in handlers]
+    missing = [name for name, target in zip(handlers, targets) if target is None]
+    if missing:
+        raise ValueError(f"Handlers {missing} must be configured before the queue handler that uses them")
+
+    log_queue = queue.SimpleQueue()
+    listener = BatchingQueueListener(log_queue, *targets, batch_size=batch_size)
+    listener.start()
+
+    handler = DeferredFormattingQueueHandler(log_queue)
+    handler.listener = listener
+    os.register_at_fork(after_in_child=handler.restart_after_fork)
+    return handler
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through a ``rate`` fraction (0 to 1) of the records below WARNING.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most ``per_second`` records below WARNING per second for
+    each message template (logger name and unformatted message), so a hot
+    loop logging the same line cannot flood the logs. The first record let
+    through after some were dropped says how many.
+
+    ``per_second`` of 0 disables the limit.
+    """
+
+    def __init__(self, per_second=0):
+        super().__init__()
+        self.per_second = int(per_second)
+        self._windows = {}  # (logger, template) -> [second, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.per_second <= 0:
+            return True
+        key = (record.name, record.msg)
+        second = int(time.monotonic())
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] != second:
+                suppressed = window[2] if window else 0
+                if len(self._windows) > 10_000:
+                    self._windows.clear()  # Bound the memory used by one-off templates
+                window = self._windows[key] = [second, 0, suppressed]
+            if window[1] >= self.per_second:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
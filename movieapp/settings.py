@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.middleware.MetricsMiddleware',  # First, so its timings cover the other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,17 +93,127 @@ REDIS_HOST = config("REDIS_HOST")
 REDIS_PORT = config("REDIS_PORT", cast=int)
 REDIS_PASSWORD = config("REDIS_PASSWORD")
 
+# Cache values are stored as msgpack, zlib-compressed when longer than CACHE_COMPRESS_MIN_BYTES
+CACHE_COMPRESS_MIN_BYTES = config("CACHE_COMPRESS_MIN_BYTES", default=512, cast=int)
+CACHE_OPTIONS = {
+    'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+    'SERIALIZER': 'django_redis.serializers.msgpack.MSGPackSerializer',
+    'COMPRESSOR': 'movies.cache_compression.ThresholdZlibCompressor',
+    'COMPRESS_MIN_LENGTH': CACHE_COMPRESS_MIN_BYTES,
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            **CACHE_OPTIONS,
             'PASSWORD': REDIS_PASSWORD,
-        }
+        },
+        # Bumped when the stored format changes (2: msgpack instead of pickle), so old entries are never read
+        'VERSION': 2,
     }
 }
 
+# TMDb-backed cache entries are served fresh for CACHE_SOFT_TIMEOUT seconds, then served
+# stale (while a background task refreshes them) until CACHE_HARD_TIMEOUT seconds
+CACHE_SOFT_TIMEOUT = config("CACHE_SOFT_TIMEOUT", default=600, cast=int)
+CACHE_HARD_TIMEOUT = config("CACHE_HARD_TIMEOUT", default=86400, cast=int)
+
+# Movie details and recommendations (GET) carry an ETag and may be cached by browsers and
+# CDNs for HTTP_CACHE_MAX_AGE seconds; after that they are revalidated with If-None-Match
+HTTP_CACHE_MAX_AGE = config("HTTP_CACHE_MAX_AGE", default=60, cast=int)
+
+# In-process LRU tier in front of Redis for hot entries; set LOCAL_CACHE_MAX_BYTES=0 to disable.
+# Entries count at their size as stored in Redis (compressed), not at their size in memory.
+LOCAL_CACHE_MAX_BYTES = config("LOCAL_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int)
+LOCAL_CACHE_TIMEOUT = config("LOCAL_CACHE_TIMEOUT", default=60, cast=int)  # Seconds
+
+# Seconds a process may hold the single-flight lock while fetching a missing cache entry
+SINGLEFLIGHT_LOCK_LEASE = config("SINGLEFLIGHT_LOCK_LEASE", default=10, cast=int)
+
+# TMDb API client configuration
+TMDB_API_URL = config("TMDB_API_URL", default="https://api.themoviedb.org/3")
+TMDB_API_KEY = config("TMDB_API_KEY")
+TMDB_POOL_SIZE = config("TMDB_POOL_SIZE", default=20, cast=int)  # Keep-alive connections per process
+# Async TMDb calls in flight per ASGI event loop (the rate limit below still caps calls per second),
+# over httpx pools of TMDB_ASYNC_POOL_SHARD_SIZE connections each
+TMDB_ASYNC_POOL_SIZE = config("TMDB_ASYNC_POOL_SIZE", default=500, cast=int)
+TMDB_ASYNC_POOL_SHARD_SIZE = config("TMDB_ASYNC_POOL_SHARD_SIZE", default=10, cast=int)
+TMDB_CONNECT_TIMEOUT = config("TMDB_CONNECT_TIMEOUT", default=3.05, cast=float)  # Seconds
+TMDB_READ_TIMEOUT = config("TMDB_READ_TIMEOUT", default=10, cast=float)  # Seconds
+TMDB_MAX_RETRIES = config("TMDB_MAX_RETRIES", default=3, cast=int)  # Retries on connection errors, 429 and 5xx
+TMDB_RETRY_BACKOFF = config("TMDB_RETRY_BACKOFF", default=0.5, cast=float)  # Exponential backoff factor
+# Longest wait (Retry-After or backoff) before a retry; a call asked to wait longer fails with a 503 instead
+TMDB_MAX_RETRY_DELAY = config("TMDB_MAX_RETRY_DELAY", default=2, cast=float)
+TMDB_VERIFY_SSL = config("TMDB_VERIFY_SSL", default=False, cast=bool)
+TMDB_GENRE_LANGUAGES = config("TMDB_GENRE_LANGUAGES", default="en", cast=Csv())  # First one provides Genre.name
+TMDB_FANOUT_CONCURRENCY = config("TMDB_FANOUT_CONCURRENCY", default=10, cast=int)  # Parallel TMDb calls per batch request
+
+# Rate limit shared by every process (see movies/resilience.py): at most TMDB_RATE_LIMIT TMDb calls
+# per second (0: no limit), in bursts of up to TMDB_RATE_LIMIT_BURST; a call that would wait longer
+# than TMDB_RATE_LIMIT_MAX_WAIT seconds for its turn fails instead. TMDb allows about 50 per second.
+TMDB_RATE_LIMIT = config("TMDB_RATE_LIMIT", default=40, cast=float)
+TMDB_RATE_LIMIT_BURST = config("TMDB_RATE_LIMIT_BURST", default=40, cast=int)
+TMDB_RATE_LIMIT_MAX_WAIT = config("TMDB_RATE_LIMIT_MAX_WAIT", default=2, cast=float)
+
+# Circuit breaker: after TMDB_BREAKER_FAILURE_THRESHOLD consecutive failed TMDb calls (0: never),
+# calls fail fast for TMDB_BREAKER_RESET_TIMEOUT seconds before a trial call is let through
+TMDB_BREAKER_FAILURE_THRESHOLD = config("TMDB_BREAKER_FAILURE_THRESHOLD", default=5, cast=int)
+TMDB_BREAKER_RESET_TIMEOUT = config("TMDB_BREAKER_RESET_TIMEOUT", default=30, cast=float)
+
+# Maximum number of movie IDs accepted by the batch details endpoint
+MOVIE_BATCH_MAX_IDS = config("MOVIE_BATCH_MAX_IDS", default=50, cast=int)
+
+# Recommendations pagination ("page_size" may ask for up to the maximum)
+RECOMMENDATIONS_PAGE_SIZE = config("RECOMMENDATIONS_PAGE_SIZE", default=20, cast=int)
+RECOMMENDATIONS_MAX_PAGE_SIZE = config("RECOMMENDATIONS_MAX_PAGE_SIZE", default=100, cast=int)
+
+# Ratings list pagination (?page_size= may ask for up to the maximum)
+RATINGS_PAGE_SIZE = config("RATINGS_PAGE_SIZE", default=100, cast=int)
+RATINGS_MAX_PAGE_SIZE = config("RATINGS_MAX_PAGE_SIZE", default=1000, cast=int)
+
+# Bulk rating ingestion: rows per batch request, and rows per INSERT statement
+RATINGS_BATCH_MAX_ROWS = config("RATINGS_BATCH_MAX_ROWS", default=1000, cast=int)
+RATINGS_BULK_BATCH_SIZE = config("RATINGS_BULK_BATCH_SIZE", default=500, cast=int)
+
+# Write-behind mode: rating submissions are appended to a Redis stream and answered with
+# 202; Celery beat runs drain_ratings_task every RATINGS_DRAIN_INTERVAL seconds to save them
+RATINGS_WRITE_BEHIND = config("RATINGS_WRITE_BEHIND", default=False, cast=bool)
+RATINGS_DRAIN_INTERVAL = config("RATINGS_DRAIN_INTERVAL", default=5, cast=float)
+RATINGS_STREAM = config("RATINGS_STREAM", default="movies:ratings")
+RATINGS_STREAM_BATCH = config("RATINGS_STREAM_BATCH", default=500, cast=int)  # Entries saved per transaction
+RATINGS_STREAM_CLAIM_IDLE = config("RATINGS_STREAM_CLAIM_IDLE", default=60, cast=int)  # Seconds before a crashed drainer's entries are retried
+# Entries that still fail after RATINGS_STREAM_MAX_DELIVERIES deliveries (or cannot be parsed)
+# are moved to RATINGS_DEAD_LETTER_STREAM, so that they do not hold up the rest of the stream
+RATINGS_STREAM_MAX_DELIVERIES = config("RATINGS_STREAM_MAX_DELIVERIES", default=5, cast=int)
+RATINGS_DEAD_LETTER_STREAM = config("RATINGS_DEAD_LETTER_STREAM", default="movies:ratings:dead")
+
+# Item-item recommender: build_recommender_task writes the neighbor table here (each
+# web worker memory-maps it, so it must be on a filesystem the workers share)
+RECOMMENDER_DIR = config("RECOMMENDER_DIR", default=str(BASE_DIR / 'var' / 'recommender'))
+RECOMMENDER_NEIGHBORS = config("RECOMMENDER_NEIGHBORS", default=50, cast=int)  # Most similar movies kept per movie
+RECOMMENDER_RESULTS = config("RECOMMENDER_RESULTS", default=20, cast=int)  # Personalized recommendations returned
+
+# Movie embeddings for similar-movie lookups, written by build_embeddings_task (memory-mapped like the recommender)
+EMBEDDINGS_DIR = config("EMBEDDINGS_DIR", default=str(BASE_DIR / 'var' / 'embeddings'))
+EMBEDDING_RATING_DIMENSIONS = config("EMBEDDING_RATING_DIMENSIONS", default=32, cast=int)  # SVD factors of rating co-occurrence
+SIMILAR_MOVIES_RESULTS = config("SIMILAR_MOVIES_RESULTS", default=20, cast=int)
+
+# Precomputed recommendations: every PRECOMPUTE_INTERVAL seconds (keep it below CACHE_SOFT_TIMEOUT),
+# the PRECOMPUTE_WARM_SET_SIZE most requested preferences of the last PRECOMPUTE_WINDOW_HOURS
+# hours are fetched ahead of time, at most PRECOMPUTE_CONCURRENCY at once
+PRECOMPUTE_WARM_SET_SIZE = config("PRECOMPUTE_WARM_SET_SIZE", default=200, cast=int)
+PRECOMPUTE_WINDOW_HOURS = config("PRECOMPUTE_WINDOW_HOURS", default=24, cast=int)
+PRECOMPUTE_INTERVAL = config("PRECOMPUTE_INTERVAL", default=300, cast=int)
+PRECOMPUTE_CONCURRENCY = config("PRECOMPUTE_CONCURRENCY", default=5, cast=int)
+
+# Metrics (served at /metrics in the Prometheus text format): scrapers must send METRICS_TOKEN
+# as a bearer token when it is set; without it, only admin users may read them. METRICS_SERVER_TIMING
+# adds a Server-Timing header (time spent in the database, cache, TMDb and rendering) to every response
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+METRICS_SERVER_TIMING = config("METRICS_SERVER_TIMING", default=False, cast=bool)
+
 
 # Celery configuration
 CELERY_BROKER_URL = f"redis://{config('REDIS_HOST')}:{config('REDIS_PORT')}/0"
@@ -112,6 +223,20 @@ CELERY_TASK_SERIALIZER = 'json'
 # Optional: Celery results backend (using Redis as well)
 CELERY_RESULT_BACKEND = f"redis://{config('REDIS_HOST')}:{config('REDIS_PORT')}/1"
 
+CELERY_BEAT_SCHEDULE = {
+    'precompute-recommendations': {
+        'task': 'movies.tasks.precompute_recommendations_task',
+        'schedule': PRECOMPUTE_INTERVAL,
+    },
+}
+if RATINGS_WRITE_BEHIND:
+    CELERY_BEAT_SCHEDULE['drain-ratings'] = {
+        'task': 'movies.tasks.drain_ratings_task',
+        'schedule': RATINGS_DRAIN_INTERVAL,
+        # Drains queued while the workers were down would only pile up: the next one saves everything
+        'options': {'expires': RATINGS_DRAIN_INTERVAL},
+    }
+
 
 
 REST_FRAMEWORK = {
@@ -121,6 +246,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'movies.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 from datetime import timedelta
@@ -181,6 +310,15 @@ import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Per-environment log volume: the level of the application loggers, the fraction of records
+# below WARNING that are kept, and the most records per second kept for each message (0: no limit)
+LOG_LEVEL = config("LOG_LEVEL", default="DEBUG")
+LOG_SAMPLE_RATE = config("LOG_SAMPLE_RATE", default=1.0, cast=float)
+LOG_RATE_LIMIT = config("LOG_RATE_LIMIT", default=0, cast=int)
+
+# Loggers only enqueue their records (the "queue_*" handlers); one listener thread per
+# queue formats them and writes them to the file and console handlers in batches.
+# Handlers are configured in name order, so "queue_*" ones come after their targets.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -194,16 +332,26 @@ LOGGING = {
             'style': '{',
         },
     },
+    'filters': {
+        'sampling': {
+            '()': 'movieapp.logging_handlers.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
+        'rate_limit': {
+            '()': 'movieapp.logging_handlers.RateLimitFilter',
+            'per_second': LOG_RATE_LIMIT,
+        },
+    },
     'handlers': {
         'application_file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
+            'class': 'movieapp.logging_handlers.BatchingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'application.log'),
             'formatter': 'verbose',
         },
         'error_file': {
             'level': 'ERROR',
-            'class': 'logging.FileHandler',
+            'class': 'movieapp.logging_handlers.BatchingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'error.log'),
             'formatter': 'verbose',
         },
@@ -212,15 +360,29 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
+        'queue_application': {
+            '()': 'movieapp.logging_handlers.queue_handler',
+            'handlers': ['application_file', 'console'],
+            'filters': ['sampling', 'rate_limit'],
+        },
+        'queue_error': {
+            '()': 'movieapp.logging_handlers.queue_handler',
+            'handlers': ['error_file', 'console'],
+        },
+        'queue_root': {
+            '()': 'movieapp.logging_handlers.queue_handler',
+            'handlers': ['application_file', 'error_file', 'console'],
+            'filters': ['sampling', 'rate_limit'],
+        },
     },
     'loggers': {
         'application': {  # Custom logger for application-specific logs
-            'handlers': ['application_file', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['queue_application'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'error': {  # Custom logger for errors
-            'handlers': ['error_file', 'console'],
+            'handlers': ['queue_error'],
             'level': 'ERROR',
             'propagate': False,
         },
@@ -231,7 +393,7 @@ LOGGING = {
         },
     },
     'root': {
-        'handlers': ['application_file', 'error_file', 'console'],
-        'level': 'DEBUG',
+        'handlers': ['queue_root'],
+        'level': LOG_LEVEL,
     },
 }
@@ -1,7 +1,27 @@
 from django.contrib import admin
-from.models import MovieRating, Genre
+from.models import MovieRating, MovieRatingStats, Genre, Movie, SyncCheckpoint
+
+
+@admin.register(MovieRatingStats)
+class MovieRatingStatsAdmin(admin.ModelAdmin):
+    """
+    Read-only: the stats are kept in step with the ratings (see ``movies.ratings``),
+    so editing a rating updates them.
+    """
+    list_display = ['movie_id', 'count', 'mean', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 # Register your models here.
 admin.site.register(MovieRating)
 admin.site.register(Genre)
+admin.site.register(Movie)
+admin.site.register(SyncCheckpoint)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
+
+    def ready(self):
+        from . import metrics  # noqa: F401  Connects the connection_created receiver (query timing)
+        from . import genre_index  # noqa: F401  Connects the genres_updated receiver
+        from . import ratings  # noqa: F401  Connects the User pre_delete receiver (deletes ratings with their stats)
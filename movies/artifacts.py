@@ -0,0 +1,49 @@
+"""
+Versioned on-disk builds of precomputed indexes (recommender, embeddings).
+
+Each build is written to a fresh ``build-*`` directory; when it is complete,
+the ``CURRENT`` file is switched to it atomically. Readers memory-map the
+build ``CURRENT`` names and pick up a new one the next time they look, while
+the previous build stays on disk for workers that still have it mapped.
+"""
+import datetime
+import os
+import shutil
+
+CURRENT = 'CURRENT'
+KEEP_BUILDS = 2  # The current build and the one before
+
+
+def current_build(directory):
+    """
+    Path of the current build in ``directory``, or ``None`` if there is none yet.
+    """
+    try:
+        with open(os.path.join(directory, CURRENT)) as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def new_build(directory):
+    """
+    Create and return an empty build directory; fill it, then ``publish`` it.
+    """
+    name = f"build-{datetime.datetime.now(datetime.timezone.utc):%Y%m%d%H%M%S%f}-{os.getpid()}"
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    return path
+
+
+def publish(path):
+    """
+    Make the build at ``path`` the current one and remove older builds.
+    """
+    directory, name = os.path.split(path)
+    pointer = os.path.join(directory, f"{CURRENT}.{os.getpid()}")
+    with open(pointer, 'w') as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+    builds = sorted(entry for entry in os.listdir(directory) if entry.startswith('build-'))
+    for old in builds[:-KEEP_BUILDS]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .caching import HIT, MISS, STALE, acached_etags, acached_fetch
+from .conditional import cache_headers, etag_matches, not_modified, request_etags, response_etag
+from .models import Movie
+from .pagination import recommendations_page, tmdb_pages
+from .precompute import record_request
+from .recommender import recommend_for_user
+from .preferences import RecommendationPreferences
+from .records import MovieRecord, parse_fields
+from .serializers import RecommendationPageSerializer
+from .services import TMDbUnavailableError, afetch_movie_recommendations, afetch_movie_details
+from .tasks import refresh_movie_details_task, refresh_recommendations_task
+from .tiered_cache import in_thread_pool
+from .views import (
+    RecommendationView, fetch_failure, mirrored_movie_etag, prefetch_recommendation_pages, recommendation_query,
+    recommendations_etag,
+)
+
+# Configure loggers for the async views module
+application_logger = logging.getLogger('application')  # For general application logs
+error_logger = logging.getLogger('error')              # For error-specific logs
+
+
+async def authenticate(request):
+    """
+    Authenticate the request with the same JWT scheme DRF uses for the sync views.
+    Returns the user, or ``None`` if no valid token was supplied.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncRecommendationView(View):
+    """
+    Async mirror of ``RecommendationView`` for ASGI deployments.
+    Shares cache entries with the sync view, so either can serve the other's entries.
+    """
+    http_method_names = ['get', 'post']
+
+    async def get(self, request, *args, **kwargs):
+        user = await authenticate(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+        return await self.recommend(request, user, recommendation_query(request.GET), conditional=True)
+
+    async def post(self, request, *args, **kwargs):
+        user = await authenticate(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"error": "Request body must be valid JSON."}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Request body must be a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+        return await self.recommend(request, user, data)
+
+    async def recommend(self, request, user, data, conditional=False):
+        """
+        See ``RecommendationView.recommend``.
+        """
+        if data.get('personalized') in (True, 'true', '1', 1):
+            recommendations = await sync_to_async(recommend_for_user)(user)
+            if recommendations or 'genres' not in data:
+                application_logger.info("Served %s personalized recommendations to user %s", len(recommendations), user.pk)
+                response = await sync_to_async(RecommendationView.personalized_response)(recommendations)
+                return JsonResponse(response, headers=cache_headers(public=False) if conditional else None)
+            # No ratings from this user (or no recommender build yet): fall back to the given preferences
+
+        # Equivalent requests normalize to the same preferences, and so share cache entries
+        try:
+            preferences = await sync_to_async(RecommendationPreferences.from_request_data)(data)
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        paging = RecommendationPageSerializer(data=data)
+        if not paging.is_valid():
+            return JsonResponse(paging.errors, status=status.HTTP_400_BAD_REQUEST)
+        page, page_size = paging.validated_data['page'], paging.validated_data['page_size']
+        await in_thread_pool(record_request, preferences)  # Popular preferences are precomputed ahead of time
+
+        # Clients revalidating a page that is still cached get a 304, without the pages being read
+        pages, offset = tmdb_pages(page, page_size)
+        refreshes = {
+            preferences.cache_key(tmdb_page): partial(refresh_recommendations_task.delay, *preferences, tmdb_page)
+            for tmdb_page in pages
+        }
+        etags = request_etags(request) if conditional else []
+        if etags:
+            cached = await acached_etags(refreshes)
+            if len(cached) == len(refreshes):
+                etag = recommendations_etag([cached[cache_key] for cache_key in refreshes], page, page_size)
+                if etag_matches(etag, etags):
+                    application_logger.info("Recommendations not modified for preferences: %s, page %s", preferences, page)
+                    return not_modified(etag, public=False)
+
+        # Each TMDb page is cached on its own, served from cache while fresh, or stale while
+        # a background task refreshes it. On a miss, concurrent requests share one TMDb call.
+        try:
+            fetched = await asyncio.gather(*(
+                acached_fetch(
+                    cache_key,
+                    partial(afetch_movie_recommendations, *preferences, tmdb_page),
+                    refresh=refreshes[cache_key],
+                    with_etag=True,
+                )
+                for cache_key, tmdb_page in zip(refreshes, pages)
+            ))
+        except Exception as e:
+            error_logger.error("Error fetching recommendations: %s", e, exc_info=not isinstance(e, TMDbUnavailableError))
+            failure_status, headers = fetch_failure(e)
+            return JsonResponse({"error": "Failed to fetch movie recommendations. Please try again later."}, status=failure_status, headers=headers)
+        states = [state for _, state, _ in fetched]
+        recommendations = recommendations_page([value for value, _, _ in fetched], page, page_size, offset)
+
+        # Clients usually page on, so the next page is fetched in the background
+        if page < recommendations['total_pages']:
+            next_pages, _ = tmdb_pages(page + 1, page_size)
+            await in_thread_pool(
+                prefetch_recommendation_pages, preferences, [tmdb_page for tmdb_page in next_pages if tmdb_page not in pages],
+            )
+
+        if MISS in states:
+            application_logger.info("Successfully fetched and cached movie recommendations for preferences: %s, page %s", preferences, page)
+        else:
+            application_logger.info("Cache %s for recommendations with preferences: %s, page %s", STALE if STALE in states else HIT, preferences, page)
+        if not conditional:
+            return JsonResponse(recommendations)
+        etag = recommendations_etag([page_etag for _, _, page_etag in fetched], page, page_size)
+        # Private: the endpoint requires authentication, so shared caches must not serve it to other clients
+        if etag_matches(etag, etags):
+            return not_modified(etag, public=False)
+        return JsonResponse(recommendations, headers=cache_headers(etag, public=False))
+
+
+class AsyncMovieDetailView(View):
+    """
+    Async mirror of ``MovieDetailView`` for ASGI deployments.
+    """
+    http_method_names = ['get']
+
+    async def get(self, request, *args, **kwargs):
+        movie_id = kwargs["movie_id"]
+        try:
+            fields = parse_fields(request.GET.get('fields'))  # Sparse fieldset, e.g. ?fields=title,overview
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        etags = request_etags(request)
+
+        # Movies in the local mirror are served without touching the cache or TMDb
+        movie = await Movie.objects.filter(tmdb_id=movie_id).afirst()
+        if movie is not None:
+            etag = mirrored_movie_etag(movie, fields)
+            if etag_matches(etag, etags):
+                return not_modified(etag)
+            application_logger.info("Served movie details for ID %s from the local mirror", movie_id)
+            return JsonResponse(MovieRecord.from_movie(movie).to_dict(fields), headers=cache_headers(etag))
+
+        cache_key = f"movie_{movie_id}"
+        refresh = partial(refresh_movie_details_task.delay, movie_id)
+
+        # Clients revalidating details that are still cached get a 304, without the details being read
+        if etags:
+            entry_etag = (await acached_etags({cache_key: refresh})).get(cache_key)
+            etag = response_etag(entry_etag, fields) if entry_etag is not None else None
+            if etag is not None and etag_matches(etag, etags):
+                application_logger.info("Movie details not modified for ID: %s", movie_id)
+                return not_modified(etag)
+
+        # Served from cache while fresh, or stale while a background task refreshes it.
+        # On a miss, concurrent requests for the same movie share one TMDb call.
+        try:
+            movie_details, state, entry_etag = await acached_fetch(
+                cache_key,
+                lambda: afetch_movie_details(movie_id),
+                refresh=refresh,
+                with_etag=True,
+            )
+        except Exception as e:
+            error_logger.error("Error fetching movie details for ID %s: %s", movie_id, e, exc_info=not isinstance(e, TMDbUnavailableError))
+            failure_status, headers = fetch_failure(e)
+            return JsonResponse({"error": "Failed to fetch movie details. Please try again later."}, status=failure_status, headers=headers)
+
+        if state == MISS:
+            application_logger.info("Successfully fetched and cached details for movie ID: %s", movie_id)
+        else:
+            application_logger.info("Cache %s for movie details with ID: %s", state, movie_id)
+        etag = response_etag(entry_etag, fields)
+        if etag_matches(etag, etags):
+            return not_modified(etag)
+        return JsonResponse(MovieRecord.from_dict(movie_details).to_dict(fields), headers=cache_headers(etag))
@@ -0,0 +1,16 @@
+"""
+Compressor for django-redis that leaves small values uncompressed.
+"""
+from django_redis.compressors.zlib import ZlibCompressor
+
+
+class ThresholdZlibCompressor(ZlibCompressor):
+    """
+    zlib-compresses values longer than the cache's ``COMPRESS_MIN_LENGTH``
+    option (in bytes). Smaller values, such as locks and counters, are stored
+    as-is: compressing them saves little and costs CPU on every read.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get('COMPRESS_MIN_LENGTH', self.min_length)
@@ -0,0 +1,308 @@
+"""
+Stale-while-revalidate caching for TMDb-backed responses.
+
+Entries are stored with two expiries:
+
+- a soft expiry (``CACHE_SOFT_TIMEOUT``), after which the entry is stale;
+- a hard expiry (``CACHE_HARD_TIMEOUT``), the cache timeout itself.
+
+Fresh entries are served as-is. Stale entries are still served immediately,
+while a Celery task refreshes them in the background. Only missing entries
+make the user wait for TMDb, and those fetches are coalesced per key.
+Entries are read and written through the two-tier cache (see ``tiered_cache``).
+
+Every entry is stored with a hash of its value (its ETag), which is also
+written on its own under ``<key>:etag``, so that conditional requests can be
+answered without reading (and deserializing) the value (see ``cached_etags``).
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .singleflight import afetch_once, fetch_once
+from .tiered_cache import in_thread_pool, tiered_cache
+
+application_logger = logging.getLogger('application')  # For general application logs
+error_logger = logging.getLogger('error')              # For error-specific logs
+
+HIT = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+ERROR = 'error'
+
+# How long a scheduled refresh suppresses further refreshes of the same key
+REFRESH_LOCK_TIMEOUT = 60
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(state):
+    with _stats_lock:
+        _stats[state] += 1
+
+
+def cache_stats():
+    """
+    Hit/stale/miss counters for this process, with the ratio of requests served from cache.
+    """
+    with _stats_lock:
+        stats = {state: _stats[state] for state in (HIT, STALE, MISS)}
+    total = sum(stats.values())
+    stats['hit_ratio'] = (stats[HIT] + stats[STALE]) / total if total else 0.0
+    return stats
+
+
+def content_etag(value):
+    """
+    Stable hash of a cached value: the same content always hashes the same, whatever its key order.
+    """
+    content = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
+
+
+def etag_key(cache_key):
+    return f"{cache_key}:etag"
+
+
+def _make_entry(value, soft_timeout):
+    return {'value': value, 'fresh_until': time.time() + soft_timeout, 'etag': content_etag(value)}
+
+
+def _with_validators(entries):
+    """
+    ``entries`` and, under ``<key>:etag``, each entry's ETag and soft expiry, to be written together.
+    """
+    items = dict(entries)
+    items.update({etag_key(cache_key): [entry['etag'], entry['fresh_until']] for cache_key, entry in entries.items()})
+    return items
+
+
+def _is_entry(entry):
+    return isinstance(entry, dict) and 'fresh_until' in entry
+
+
+def _entry_etag(entry):
+    # Entries written before they carried an ETag are hashed on read
+    return entry.get('etag') or content_etag(entry['value'])
+
+
+def is_fresh(entry, at=None):
+    """
+    Whether ``entry`` is a cache entry that is still fresh at time ``at`` (default: now).
+    """
+    return _is_entry(entry) and (at or time.time()) < entry['fresh_until']
+
+
+def store(cache_key, value, soft_timeout=None, hard_timeout=None):
+    """
+    Store a freshly fetched value, e.g. from a background refresh.
+    """
+    soft_timeout = soft_timeout or settings.CACHE_SOFT_TIMEOUT
+    hard_timeout = hard_timeout or settings.CACHE_HARD_TIMEOUT
+    tiered_cache.set_many(_with_validators({cache_key: _make_entry(value, soft_timeout)}), timeout=hard_timeout)
+
+
+def _schedule_refresh(cache_key, refresh):
+    if not cache.add(f"refreshing:{cache_key}", 1, timeout=REFRESH_LOCK_TIMEOUT):
+        return  # Another request already scheduled it
+    try:
+        refresh()
+    except Exception as e:
+        # Serving the stale value matters more than refreshing it.
+        error_logger.error("Could not schedule refresh of %s: %s", cache_key, e, exc_info=True)
+
+
+def prefetch(cache_key, refresh):
+    """
+    Schedule ``refresh`` to fill ``cache_key`` before anyone asks for it,
+    unless it is fresh in the cache or already scheduled.
+    """
+    if not is_fresh(tiered_cache.get(cache_key)):
+        _schedule_refresh(cache_key, refresh)
+
+
+def cached_fetch(cache_key, fetch, refresh, soft_timeout=None, hard_timeout=None, with_etag=False):
+    """
+    Return the value for ``cache_key``, fetching it on a miss and refreshing it in the background when stale.
+
+    :param cache_key: Cache key of the entry
+    :param fetch: Callable returning a fresh value (called synchronously on a miss)
+    :param refresh: Callable that schedules a background refresh (e.g. a task's ``delay``)
+    :param with_etag: Also return the ETag of the value (see ``content_etag``)
+    :return: Tuple of ``(value, state)`` where state is ``HIT``, ``STALE`` or ``MISS``;
+             ``(value, state, etag)`` with ``with_etag``
+    """
+    soft_timeout = soft_timeout or settings.CACHE_SOFT_TIMEOUT
+    hard_timeout = hard_timeout or settings.CACHE_HARD_TIMEOUT
+
+    entry = tiered_cache.get(cache_key)
+    if _is_entry(entry):
+        if time.time() < entry['fresh_until']:
+            _record(HIT)
+            state = HIT
+        else:
+            _record(STALE)
+            _schedule_refresh(cache_key, refresh)
+            state = STALE
+        return (entry['value'], state, _entry_etag(entry)) if with_etag else (entry['value'], state)
+    if entry is not None:
+        tiered_cache.delete(cache_key)  # Written before entries carried a soft expiry
+
+    _record(MISS)
+
+    def fetch_entry():
+        entry = _make_entry(fetch(), soft_timeout)
+        tiered_cache.set(etag_key(cache_key), [entry['etag'], entry['fresh_until']], timeout=hard_timeout)
+        return entry
+
+    entry = fetch_once(cache_key, fetch_entry, timeout=hard_timeout)
+    return (entry['value'], MISS, entry['etag']) if with_etag else (entry['value'], MISS)
+
+
+def cached_fetch_many(fetches, max_concurrency, soft_timeout=None, hard_timeout=None, with_etag=False):
+    """
+    Batch version of ``cached_fetch``: one cache read for all keys, concurrent
+    fetches for the misses, and one cache write for everything fetched.
+
+    :param fetches: Dict mapping each cache key to a ``(fetch, refresh)`` pair
+    :param max_concurrency: Maximum number of fetches running at once
+    :param with_etag: Also return the ETag of each value (``None`` for failed fetches)
+    :return: Dict mapping each cache key to ``(value, state)``, or ``(value, state, etag)``
+             with ``with_etag``; for failed fetches the state is ``ERROR`` and the value is the exception
+    """
+    soft_timeout = soft_timeout or settings.CACHE_SOFT_TIMEOUT
+    hard_timeout = hard_timeout or settings.CACHE_HARD_TIMEOUT
+
+    results = {}
+    now = time.time()
+    for cache_key, entry in tiered_cache.get_many(list(fetches)).items():
+        if not _is_entry(entry):
+            continue
+        if now < entry['fresh_until']:
+            _record(HIT)
+            results[cache_key] = (entry['value'], HIT)
+        else:
+            _record(STALE)
+            _schedule_refresh(cache_key, fetches[cache_key][1])
+            results[cache_key] = (entry['value'], STALE)
+        if with_etag:
+            results[cache_key] += (_entry_etag(entry),)
+    missing = [cache_key for cache_key in fetches if cache_key not in results]
+    if not missing:
+        return results
+
+    def fetch(cache_key):
+        _record(MISS)
+        try:
+            return cache_key, fetches[cache_key][0](), MISS
+        except Exception as e:
+            return cache_key, e, ERROR
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(missing))) as executor:
+        # Each fetch runs in a copy of the caller's context, so its TMDb time counts towards the request
+        futures = [executor.submit(contextvars.copy_context().run, fetch, cache_key) for cache_key in missing]
+        fetched = [future.result() for future in futures]
+
+    entries = {}
+    for cache_key, value, state in fetched:
+        results[cache_key] = (value, state)
+        if state == MISS:
+            entries[cache_key] = _make_entry(value, soft_timeout)
+        if with_etag:
+            results[cache_key] += (entries[cache_key]['etag'] if state == MISS else None,)
+    if entries:
+        tiered_cache.set_many(_with_validators(entries), timeout=hard_timeout)
+    return results
+
+
+async def acached_fetch(cache_key, afetch, refresh, soft_timeout=None, hard_timeout=None, with_etag=False):
+    """
+    Async version of ``cached_fetch``; ``afetch`` is a coroutine function.
+    """
+    soft_timeout = soft_timeout or settings.CACHE_SOFT_TIMEOUT
+    hard_timeout = hard_timeout or settings.CACHE_HARD_TIMEOUT
+
+    entry = await tiered_cache.aget(cache_key)
+    if _is_entry(entry):
+        if time.time() < entry['fresh_until']:
+            _record(HIT)
+            state = HIT
+        else:
+            _record(STALE)
+            await in_thread_pool(_schedule_refresh, cache_key, refresh)
+            state = STALE
+        return (entry['value'], state, _entry_etag(entry)) if with_etag else (entry['value'], state)
+    if entry is not None:
+        await tiered_cache.adelete(cache_key)  # Written before entries carried a soft expiry
+
+    _record(MISS)
+
+    async def afetch_entry():
+        entry = _make_entry(await afetch(), soft_timeout)
+        await tiered_cache.aset(etag_key(cache_key), [entry['etag'], entry['fresh_until']], timeout=hard_timeout)
+        return entry
+
+    entry = await afetch_once(cache_key, afetch_entry, timeout=hard_timeout)
+    return (entry['value'], MISS, entry['etag']) if with_etag else (entry['value'], MISS)
+
+
+def cached_etags(refreshes):
+    """
+    ETags of cached values, read from their ``<key>:etag`` items without
+    loading the values. Stale entries are refreshed in the background, as
+    ``cached_fetch`` would.
+
+    :param refreshes: Dict mapping each cache key to the callable that schedules its refresh
+    :return: Dict mapping each cache key found to its ETag
+    """
+    found = tiered_cache.get_many([etag_key(cache_key) for cache_key in refreshes])
+    etags = {}
+    now = time.time()
+    for cache_key, refresh in refreshes.items():
+        validator = found.get(etag_key(cache_key))
+        if validator is None:
+            continue
+        etag, fresh_until = validator
+        if now >= fresh_until:
+            _schedule_refresh(cache_key, refresh)
+        etags[cache_key] = etag
+    return etags
+
+
+async def acached_etags(refreshes):
+    """
+    Async version of ``cached_etags``.
+    """
+    etags = {}
+    now = time.time()
+    for cache_key, refresh in refreshes.items():
+        validator = await tiered_cache.aget(etag_key(cache_key))
+        if validator is None:
+            continue
+        etag, fresh_until = validator
+        if now >= fresh_until:
+            await in_thread_pool(_schedule_refresh, cache_key, refresh)
+        etags[cache_key] = etag
+    return etags
+
+
+def _collect_metrics():
+    stats = cache_stats()
+    return [
+        ('movieapp_cache_requests_total', 'counter', 'Cached TMDb lookups, by hit, stale or miss.', [
+            ({'result': state}, stats[state]) for state in (HIT, STALE, MISS)
+        ]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,65 @@
+"""
+HTTP conditional requests (``ETag`` / ``If-None-Match``) for responses built
+from cached TMDb values.
+
+The ETag of a response is derived from the ETags of the cache entries it is
+built from (see ``caching.content_etag``) and from whatever else shapes it
+(sparse fieldset, paging). Checking ``If-None-Match`` therefore only reads the
+small ``<key>:etag`` items: a 304 is sent without reading, deserializing or
+rendering the cached value.
+
+ETags are weak: equal ETags mean equal content, not byte-identical bodies
+(the same content may be rendered as JSON or as the browsable API).
+"""
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+
+def response_etag(*parts):
+    """
+    Weak ETag of a response built from ``parts`` (entry ETags, fields, paging, ...).
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def request_etags(request):
+    """
+    ETags of the request's ``If-None-Match`` header (``['*']`` for any); empty without one.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    return parse_etags(header) if header else []
+
+
+def etag_matches(etag, etags):
+    """
+    Whether ``etag`` is one of ``etags``, compared weakly as ``If-None-Match`` requires.
+    """
+    if '*' in etags:
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.removeprefix('W/') == opaque for candidate in etags)
+
+
+def cache_headers(etag=None, public=True):
+    """
+    ``Cache-Control`` (and ``ETag``) headers of a cacheable response. Public responses
+    may be stored by shared caches (CDNs, proxies); private ones only by the client.
+    """
+    headers = {'Cache-Control': f"{'public' if public else 'private'}, max-age={settings.HTTP_CACHE_MAX_AGE}"}
+    if etag:
+        headers['ETag'] = etag
+    return headers
+
+
+def not_modified(etag, public=True):
+    """
+    304 response for a request whose ``If-None-Match`` matched ``etag``.
+    """
+    response = HttpResponseNotModified()
+    for header, value in cache_headers(etag, public).items():
+        response[header] = value
+    return response
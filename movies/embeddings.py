@@ -0,0 +1,198 @@
+"""
+Memory-mapped movie embeddings for "more like this" lookups.
+
+``build`` (run by ``build_embeddings_task``) gives every movie we know of
+(the local mirror plus every rated movie) a vector made of two halves, each
+scaled to unit length before the whole vector is normalized:
+
+- its genres, one dimension per ``Genre``;
+- its rating co-occurrence: the movie's factor in a truncated SVD of the
+  user x movie "has rated" matrix, so movies rated by the same users point
+  the same way.
+
+The vectors are stored as one flat float32 file (``embeddings.f32``, rows in
+``movie_ids.npy`` order) and published with ``movies.artifacts``. Workers map
+the file with ``np.memmap``, so the OS shares one copy between all workers on
+a host, and answer cosine top-k queries with batched matrix products.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+from .artifacts import current_build, new_build, publish
+from .models import Genre, Movie, MovieRating
+
+application_logger = logging.getLogger('application')  # For general application logs
+
+QUERY_BATCH_ROWS = 1 << 16  # Embedding rows multiplied per step of a query
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _genre_vectors(movie_ids):
+    genre_ids = list(Genre.objects.order_by('tmdb_id').values_list('tmdb_id', flat=True))
+    column = {genre_id: i for i, genre_id in enumerate(genre_ids)}
+    row = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+    vectors = np.zeros((len(movie_ids), len(genre_ids)), dtype=np.float32)
+    for movie_id, genres in Movie.objects.values_list('tmdb_id', 'genres').iterator(chunk_size=10_000):
+        for genre in genres:
+            if genre.get('id') in column:
+                vectors[row[movie_id], column[genre['id']]] = 1
+    return _normalize_rows(vectors)
+
+
+def _rating_vectors(movie_ids, dimensions):
+    pairs = np.fromiter(
+        MovieRating.objects.filter(user__isnull=False).values_list('user_id', 'movie_id').iterator(chunk_size=10_000),
+        dtype=[('user', np.int64), ('movie', np.int64)],
+    )
+    if not len(pairs):
+        return np.zeros((len(movie_ids), 0), dtype=np.float32)
+    users, user_index = np.unique(pairs['user'], return_inverse=True)
+    movie_index = np.searchsorted(movie_ids, pairs['movie'])
+    rated = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, movie_index)), shape=(len(users), len(movie_ids)),
+    )
+    rank = min(dimensions, min(rated.shape) - 1)
+    if rank < 1:
+        return np.zeros((len(movie_ids), 0), dtype=np.float32)
+    _, singular_values, vt = svds(rated, k=rank)
+    return _normalize_rows((vt.T * singular_values).astype(np.float32))
+
+
+def build():
+    """
+    Rebuild the embeddings of all known movies and publish them.
+
+    :return: Path of the new build
+    """
+    started = time.monotonic()
+    movie_ids = np.union1d(
+        np.fromiter(Movie.objects.values_list('tmdb_id', flat=True).iterator(), dtype=np.int64),
+        np.fromiter(MovieRating.objects.values_list('movie_id', flat=True).distinct().iterator(), dtype=np.int64),
+    )
+    vectors = np.hstack([
+        _genre_vectors(movie_ids),
+        _rating_vectors(movie_ids, settings.EMBEDDING_RATING_DIMENSIONS),
+    ])
+    vectors = _normalize_rows(vectors).astype(np.float32)
+
+    path = new_build(settings.EMBEDDINGS_DIR)
+    np.save(os.path.join(path, 'movie_ids.npy'), movie_ids)
+    vectors.tofile(os.path.join(path, 'embeddings.f32'))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'movies': len(movie_ids), 'dimensions': vectors.shape[1]}, f)
+    publish(path)
+
+    application_logger.info(
+        "Built %s-dimensional embeddings of %s movies in %.1fs", vectors.shape[1], len(movie_ids), time.monotonic() - started,
+    )
+    return path
+
+
+class EmbeddingIndex:
+    """
+    Read-only, memory-mapped embeddings of one build.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.movie_ids = np.load(os.path.join(path, 'movie_ids.npy'), mmap_mode='r')
+        self.vectors = np.memmap(
+            os.path.join(path, 'embeddings.f32'), dtype=np.float32, mode='r',
+            shape=(meta['movies'], meta['dimensions']),
+        ) if meta['movies'] and meta['dimensions'] else np.zeros((meta['movies'], 0), dtype=np.float32)
+
+    def similar(self, movie_ids, k):
+        """
+        The ``k`` movies most similar (by cosine) to each of ``movie_ids``.
+
+        :return: One list of ``(movie_id, score)`` per query, best first;
+            ``None`` for movies that are not in the index
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        positions = np.searchsorted(self.movie_ids, movie_ids)
+        clipped = np.minimum(positions, max(len(self.movie_ids) - 1, 0))
+        known = (positions < len(self.movie_ids))
+        if len(self.movie_ids):
+            known &= np.asarray(self.movie_ids)[clipped] == movie_ids
+        results = [None] * len(movie_ids)
+        queries = clipped[known]
+        if not len(queries) or self.vectors.shape[1] == 0:
+            return [[] if is_known else None for is_known in known]
+
+        k = min(k, len(self.movie_ids) - 1)
+        if k < 1:
+            return [[] if is_known else None for is_known in known]
+
+        query_vectors = np.asarray(self.vectors[queries])  # Rows are unit length: dot product = cosine
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.movie_ids), QUERY_BATCH_ROWS):
+            block = np.asarray(self.vectors[start:start + QUERY_BATCH_ROWS])
+            scores = query_vectors @ block.T
+            rows = np.arange(start, start + len(block))
+            scores[rows[None, :] == queries[:, None]] = -np.inf  # A movie is not similar to itself
+            # Keep a running top-k: merge this block's candidates with the best so far
+            candidates = np.hstack([best_scores, scores])
+            candidate_rows = np.hstack([best_rows, np.broadcast_to(rows, scores.shape)])
+            top = np.argpartition(-candidates, min(k, candidates.shape[1]) - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(candidates, top, axis=1)
+            best_rows = np.take_along_axis(candidate_rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        for query, result_index in enumerate(np.flatnonzero(known)):
+            results[result_index] = [
+                (int(self.movie_ids[row]), float(score))
+                for row, score in zip(best_rows[query], best_scores[query]) if score > 0
+            ]
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index():
+    """
+    The current build, memory-mapped; ``None`` until the first build exists.
+    """
+    global _index
+    path = current_build(settings.EMBEDDINGS_DIR)
+    if path is None:
+        return None
+    index = _index
+    if index is None or index.path != path:
+        with _index_lock:
+            if _index is None or _index.path != path:
+                _index = EmbeddingIndex(path)
+                application_logger.info("Loaded movie embeddings %s", path)
+            index = _index
+    return index
+
+
+def similar_movies(movie_id, k=None):
+    """
+    Movies most similar to ``movie_id``.
+
+    :return: List of ``(movie_id, score)``, best first, or ``None`` if the
+        movie is not in the index (or no index was built yet)
+    """
+    index = get_embedding_index()
+    if index is None:
+        return None
+    return index.similar([movie_id], k or settings.SIMILAR_MOVIES_RESULTS)[0]
@@ -0,0 +1,153 @@
+"""
+Process-wide, in-memory genre name -> TMDb id index.
+
+The genre table is tiny and only changes when ``update_tmdb_genres`` runs, so
+request handling looks genre names up in an immutable index instead of
+querying the database. The index is loaded lazily on first use and carries
+the version it was loaded at. When the genres change, the version stored in
+the cache is bumped. Every worker compares its index with that version at most
+every ``VERSION_CHECK_INTERVAL`` seconds, and reloads it if they differ. With
+the local cache tier enabled, the bump is also broadcast on the cache
+invalidation channel, so workers drop their index at once. A version bump can
+also be made by hand (e.g. after editing genres in the database)::
+
+    python manage.py shell -c "from movies.genre_index import bump_version; bump_version()"
+
+In ``redis-cli``, the key carries the cache's key prefix and version
+(``:2:genre_index:version`` with the default settings), while the
+invalidation message names the bare key::
+
+    INCR :2:genre_index:version
+    PUBLISH movies:cache-invalidation "manual genre_index:version"
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from .models import Genre
+from .signals import genres_updated
+from .tiered_cache import tiered_cache
+
+application_logger = logging.getLogger('application')  # For general application logs
+
+VERSION_KEY = 'genre_index:version'
+
+# Seconds between checks of the loaded index against the version in the cache
+VERSION_CHECK_INTERVAL = 5
+
+
+def normalize_name(name):
+    """
+    Lookup form of a genre name: case-folded, with whitespace collapsed.
+    """
+    return ' '.join(name.casefold().split())
+
+
+class GenreIndex:
+    """
+    Immutable mapping of genre names and aliases (translations) to TMDb ids.
+    """
+    __slots__ = ('version', '_ids')
+
+    def __init__(self, version, genres):
+        """
+        :param version: Version of the genre data the index was built from
+        :param genres: Iterable of ``(tmdb_id, name, translations)`` rows
+        """
+        ids = {}
+        for tmdb_id, name, translations in genres:
+            for alias in (translations or {}).values():
+                ids.setdefault(normalize_name(alias), tmdb_id)
+            ids[normalize_name(name)] = tmdb_id  # Primary names win over aliases
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_ids', ids)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GenreIndex is immutable")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, name):
+        """
+        TMDb id for a genre name or alias, or ``None`` if it is unknown.
+        """
+        return self._ids.get(normalize_name(name))
+
+    def ids_for(self, names):
+        """
+        TMDb ids of the known names among ``names``; unknown names are skipped.
+        """
+        ids = []
+        for name in names:
+            tmdb_id = self._ids.get(normalize_name(name))
+            if tmdb_id is not None and tmdb_id not in ids:
+                ids.append(tmdb_id)
+        return ids
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_genre_index():
+    """
+    The current genre index, loading it on first use or after a version bump.
+    """
+    global _checked_at
+    index = _index
+    if index is None:
+        return _load()
+    now = time.monotonic()
+    if now - _checked_at < VERSION_CHECK_INTERVAL:
+        return index
+    _checked_at = now
+    if (cache.get(VERSION_KEY) or 0) == index.version:
+        return index
+    _reset()
+    return _load()
+
+
+def _load():
+    global _index, _checked_at
+    with _lock:
+        if _index is None:
+            version = cache.get(VERSION_KEY) or 0
+            _index = GenreIndex(version, Genre.objects.values_list('tmdb_id', 'name', 'translations'))
+            _checked_at = time.monotonic()
+            application_logger.info("Loaded genre index version %s with %s names", version, len(_index))
+        return _index
+
+
+def _reset():
+    global _index
+    _index = None
+
+
+def bump_version():
+    """
+    Mark the genre data as changed: every worker reloads its index on next use.
+    """
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        # First bump (or the key was evicted); any new value differs from the loaded one.
+        version = 1
+        if not cache.add(VERSION_KEY, version, timeout=None):
+            version = cache.incr(VERSION_KEY)
+    _reset()
+    tiered_cache.invalidate(VERSION_KEY)
+    return version
+
+
+tiered_cache.on_invalidate(VERSION_KEY, _reset)
+
+
+@receiver(genres_updated)
+def reload_genre_index(sender, **kwargs):
+    version = bump_version()
+    application_logger.info("Genres changed; bumped genre index to version %s", version)
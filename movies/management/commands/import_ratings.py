@@ -0,0 +1,129 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, IntegrityError
+from movies.serializers import RatingSerializer
+
+
+def read_rows(path, file_format):
+    """
+    Yield ``(line_number, row)`` from a CSV file with a header row, or a JSONL file.
+    ``row`` is ``None`` for a line that is not valid JSON.
+    """
+    with open(path, newline='') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Empty cells count as missing, as absent keys do in JSONL
+                yield reader.line_num, {key: value for key, value in row.items() if value not in ('', None)}
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError:
+                        yield line_number, None
+
+
+class Command(BaseCommand):
+    help = "Import ratings from a CSV or JSONL file (fields: movie_id, rating and user, unless --user is given)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row, or JSONL file with one rating per line")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="File format (default: guessed from the file extension)")
+        parser.add_argument('--user', help="Username to import the ratings for, instead of each row's user")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows validated and saved per transaction")
+
+    def load_users(self, chunk):
+        """
+        Users of a chunk's rows, loaded in one query.
+
+        :return: Dict of primary keys to users
+        """
+        ids = set()
+        for _, row in chunk:
+            if isinstance(row, dict) and row.get('user') is not None and not isinstance(row['user'], bool):
+                try:
+                    ids.add(User._meta.pk.to_python(row['user']))
+                except ValidationError:
+                    pass  # Reported by the serializer
+        return User.objects.in_bulk(ids)
+
+    def validate(self, chunk, user):
+        """
+        Validate a chunk of ``(line_number, row)`` pairs, reporting the invalid rows.
+
+        :return: A valid ``RatingSerializer`` of the rest of the chunk
+        """
+        context = {'user': user, 'users': self.load_users(chunk)}
+        while True:
+            serializer = RatingSerializer(data=[row for _, row in chunk], many=True, context=context)
+            if serializer.is_valid():
+                return serializer
+            # Errors are a dict of the invalid rows' indexes in the chunk to their error dicts.
+            # Rows are checked against each other only once all of them are valid on their own,
+            # so the rest of the chunk is validated again.
+            valid = []
+            for index, (line_number, row) in enumerate(chunk):
+                errors = serializer.errors.get(index)
+                if errors:
+                    self.stderr.write(f"Line {line_number}: {json.dumps(errors)}")
+                else:
+                    valid.append((line_number, row))
+            if len(valid) == len(chunk):
+                raise CommandError(f"Invalid chunk: {json.dumps(serializer.errors)}")
+            chunk = valid
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or ('csv' if path.suffix.lower() == '.csv' else 'jsonl')
+        overrides = {}
+        if options['user']:
+            try:
+                overrides['user'] = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']!r}")
+
+        rows = read_rows(path, file_format)
+
+        started = time.monotonic()
+        imported = rejected = 0
+        while chunk := list(islice(rows, options['chunk_size'])):
+            parsed = []
+            for line_number, row in chunk:
+                if row is None:
+                    self.stderr.write(f"Line {line_number}: not valid JSON")
+                elif not overrides and isinstance(row, dict) and row.get('user') is None:
+                    # Ratings without a user would never conflict on (user, movie_id), and pile up on re-imports
+                    self.stderr.write(f"Line {line_number}: no user (give each row a user, or use --user)")
+                else:
+                    parsed.append((line_number, row))
+            rejected += len(chunk) - len(parsed)
+            chunk = parsed
+            if not chunk:
+                continue
+
+            serializer = self.validate(chunk, overrides.get('user'))
+            rejected += len(chunk) - len(serializer.initial_data)
+            try:
+                imported += len(serializer.save(**overrides))
+            except (IntegrityError, DataError) as e:
+                # E.g. an idempotency key saved for another movie since the chunk was validated
+                self.stderr.write(f"Lines {chunk[0][0]}-{chunk[-1][0]}: not imported ({e})")
+                rejected += len(serializer.initial_data)
+
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"{imported} rows imported ({imported / elapsed:.0f} rows/sec)")
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} ratings, rejected {rejected}, in {elapsed:.1f}s "
+            f"({imported / elapsed:.0f} rows/sec)."
+        ))
@@ -1,24 +1,61 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from movies.models import Genre
-from decouple import config
+from movies.signals import genres_updated
+from movies.tmdb import get_tmdb_client
+
+
+def fetch_genres(language):
+    data = get_tmdb_client().get_json("genre/movie/list", {'language': language})
+    return language, data.get('genres', [])
 
-TMDB_API_URL = "https://api.themoviedb.org/3"
-TMDB_API_KEY = config("TMDB_API_KEY")
 
 class Command(BaseCommand):
     help = "Update TMDb genre mapping"
 
     def handle(self, *args, **kwargs):
-        url = f"{TMDB_API_URL}/genre/movie/list"
-        params = {'api_key': TMDB_API_KEY, 'language': 'en'}
-        response = requests.get(url, params=params, verify=False)
-        response.raise_for_status()
-        data = response.json()
-
-        for genre in data.get('genres', []):
-            Genre.objects.update_or_create(
-                tmdb_id=genre['id'],
-                defaults={'name': genre['name']}
+        languages = settings.TMDB_GENRE_LANGUAGES
+        primary = languages[0]
+
+        # Genre names for every configured language, fetched concurrently
+        names = {}  # tmdb_id -> {language: name}
+        with ThreadPoolExecutor(max_workers=len(languages)) as executor:
+            for language, genres in executor.map(fetch_genres, languages):
+                for genre in genres:
+                    names.setdefault(genre['id'], {})[language] = genre['name']
+
+        wanted = {}
+        for tmdb_id, by_language in names.items():
+            name = by_language.get(primary) or next(iter(by_language.values()))
+            translations = {language: value for language, value in by_language.items() if language != primary}
+            wanted[tmdb_id] = (name, translations)
+
+        # Diff against the current rows and write only what changed, in one statement
+        existing = {
+            tmdb_id: (name, translations)
+            for tmdb_id, name, translations in Genre.objects.values_list('tmdb_id', 'name', 'translations')
+        }
+        inserted = [tmdb_id for tmdb_id in wanted if tmdb_id not in existing]
+        updated = [tmdb_id for tmdb_id in wanted if tmdb_id in existing and existing[tmdb_id] != wanted[tmdb_id]]
+        unchanged = len(wanted) - len(inserted) - len(updated)
+
+        with transaction.atomic():
+            Genre.objects.bulk_create(
+                [
+                    Genre(tmdb_id=tmdb_id, name=wanted[tmdb_id][0], translations=wanted[tmdb_id][1])
+                    for tmdb_id in inserted + updated
+                ],
+                update_conflicts=True,
+                unique_fields=['tmdb_id'],
+                update_fields=['name', 'translations'],
             )
-        self.stdout.write(self.style.SUCCESS('Successfully updated genre mapping.'))
+
+        if inserted or updated:
+            genres_updated.send(sender=self.__class__, inserted=inserted, updated=updated)
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully updated genre mapping ({', '.join(languages)}): "
+            f"{len(inserted)} inserted, {len(updated)} updated, {unchanged} unchanged."
+        ))
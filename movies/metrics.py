@@ -0,0 +1,227 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters and histograms are kept in memory per process and rendered by
+``MetricsView`` (``/metrics``). Recording a value is a dict update under a
+lock, cheap enough to leave on in production. As with ``cache_stats``, each
+process reports its own numbers: scrape every worker (or sum them).
+
+While ``MetricsMiddleware`` handles a request, the time spent in the
+database, the cache, TMDb (and its rate limit) and response rendering is also added up per
+request (``timer``/``record``), for the ``Server-Timing`` header.
+"""
+import bisect
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in values.items()]
+
+
+class Histogram:
+    """
+    Histogram with optional labels, in fixed buckets (upper bounds, in seconds).
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        samples = []
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                samples.append((
+                    f'{self.name}_bucket', _format_labels((*self.labelnames, 'le'), (*labels, bound)), cumulative,
+                ))
+            samples.append((f'{self.name}_sum', _format_labels(self.labelnames, labels), total))
+            samples.append((f'{self.name}_count', _format_labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+def register_collector(collect):
+    """
+    Add metrics computed at scrape time. ``collect()`` returns a list of
+    ``(name, type, documentation, [(labels dict, value), ...])``.
+    """
+    _collectors.append(collect)
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+    for collect in _collectors:
+        for name, metric_type, documentation, samples in collect():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_DURATION = Histogram(
+    'movieapp_http_request_duration_seconds', 'Time to handle a request, by endpoint.', ['endpoint', 'method'],
+)
+REQUESTS = Counter('movieapp_http_requests_total', 'Requests handled, by endpoint and status.', ['endpoint', 'method', 'status'])
+DB_QUERIES = Counter('movieapp_db_queries_total', 'Database queries run by requests, by endpoint.', ['endpoint'])
+DB_DURATION = Counter(
+    'movieapp_db_query_duration_seconds_total', 'Time requests spent in database queries, by endpoint.', ['endpoint'],
+)
+CACHE_DURATION = Histogram(
+    'movieapp_cache_operation_duration_seconds', 'Time spent in shared cache (Redis) operations.', ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+TMDB_DURATION = Histogram('movieapp_tmdb_request_duration_seconds', 'TMDb API request latency (each attempt).', ['path'])
+TMDB_REQUESTS = Counter('movieapp_tmdb_requests_total', 'TMDb API requests (each attempt), by path and status code.', ['path', 'status'])
+
+
+class RequestTimings:
+    """
+    Time spent (in seconds) and number of operations per component during one request.
+    """
+    __slots__ = ('durations', 'counts')
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+
+    def add(self, component, seconds):
+        self.durations[component] = self.durations.get(component, 0.0) + seconds
+        self.counts[component] = self.counts.get(component, 0) + 1
+
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+def record(component, seconds):
+    """
+    Add time spent in ``component`` to the request being handled, if any.
+    """
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(component, seconds)
+
+
+class timer:
+    """
+    Context manager that records its duration under ``component`` for the current request,
+    and in ``histogram`` (with ``labelvalues``) if given.
+    """
+    __slots__ = ('component', 'histogram', 'labelvalues', 'started')
+
+    def __init__(self, component, histogram=None, *labelvalues):
+        self.component = component
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        record(self.component, elapsed)
+        if self.histogram is not None:
+            self.histogram.observe(elapsed, *self.labelvalues)
+
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def record_tmdb_call(path, status, seconds):
+    """
+    Record one TMDb API request. Numeric path segments are collapsed (``movie/{id}``)
+    to keep the number of label values bounded.
+
+    :param status: HTTP status code, or ``"error"`` if no response was received
+    """
+    path = _ID_SEGMENT.sub('/{id}', '/' + path.strip('/'))
+    TMDB_REQUESTS.inc(path, str(status))
+    TMDB_DURATION.observe(seconds, path)
+    record('tmdb', seconds)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Every connection (one per thread) times the queries run on behalf of a request
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
@@ -0,0 +1,72 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import DB_DURATION, DB_QUERIES, REQUEST_DURATION, REQUESTS, RequestTimings, current_timings
+
+# Components reported in the Server-Timing header, in order
+SERVER_TIMING_COMPONENTS = ('db', 'cache', 'ratelimit', 'tmdb', 'render')
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and status of every request per endpoint (URL name),
+    with the database queries it ran, and optionally reports where the time
+    went in a ``Server-Timing`` header (``METRICS_SERVER_TIMING``).
+
+    Works under both WSGI and ASGI. Put it first in ``MIDDLEWARE`` so that the
+    measured time covers the other middleware too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = settings.METRICS_SERVER_TIMING
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    def _finish(self, request, response, timings, elapsed):
+        match = request.resolver_match
+        endpoint = match.url_name or match.route if match else 'unmatched'
+        REQUEST_DURATION.observe(elapsed, endpoint, request.method)
+        REQUESTS.inc(endpoint, request.method, str(response.status_code))
+        queries = timings.counts.get('db')
+        if queries:
+            DB_QUERIES.inc(endpoint, amount=queries)
+            DB_DURATION.inc(endpoint, amount=timings.durations['db'])
+
+        if self.server_timing:
+            entries = [f'app;dur={elapsed * 1000:.1f}']
+            for component in SERVER_TIMING_COMPONENTS:
+                if component in timings.durations:
+                    count = timings.counts[component]
+                    entries.append(
+                        f'{component};dur={timings.durations[component] * 1000:.1f};'
+                        f'desc="{count} call{"" if count == 1 else "s"}"'
+                    )
+            response['Server-Timing'] = ', '.join(entries)
+        return response
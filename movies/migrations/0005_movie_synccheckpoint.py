@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_alter_movierating_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Movie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tmdb_id', models.IntegerField(unique=True)),
+                ('title', models.CharField(max_length=255)),
+                ('original_title', models.CharField(blank=True, max_length=255)),
+                ('original_language', models.CharField(blank=True, max_length=10)),
+                ('overview', models.TextField(blank=True)),
+                ('release_date', models.DateField(blank=True, null=True)),
+                ('runtime', models.IntegerField(blank=True, null=True)),
+                ('genres', models.JSONField(default=list)),
+                ('poster_path', models.CharField(blank=True, max_length=255)),
+                ('backdrop_path', models.CharField(blank=True, max_length=255)),
+                ('popularity', models.FloatField(default=0)),
+                ('vote_average', models.FloatField(default=0)),
+                ('vote_count', models.IntegerField(default=0)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('synced_until', models.DateField()),
+                ('page', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
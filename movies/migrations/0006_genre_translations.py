@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movie_synccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genre',
+            name='translations',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
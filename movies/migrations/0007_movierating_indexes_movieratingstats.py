@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_genre_translations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRatingStats',
+            fields=[
+                ('movie_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+                ('rating_sum', models.FloatField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('histogram', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movierating',
+            index=models.Index(fields=['user', 'created_at'], name='movies_rating_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='movierating',
+            index=models.Index(fields=['movie_id'], name='movies_rating_movie'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Floor
+
+# Movie ids aggregated per transaction. Each chunk is a range scan on the
+# movie_id index, so the table is never scanned (or locked) in one go.
+CHUNK_SIZE = 5000
+
+
+def backfill_rating_stats(apps, schema_editor):
+    MovieRating = apps.get_model('movies', 'MovieRating')
+    MovieRatingStats = apps.get_model('movies', 'MovieRatingStats')
+
+    bounds = MovieRating.objects.aggregate(low=Min('movie_id'), high=Max('movie_id'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, CHUNK_SIZE):
+        ratings = MovieRating.objects.filter(movie_id__gte=start, movie_id__lt=start + CHUNK_SIZE)
+        stats = {
+            row['movie_id']: MovieRatingStats(
+                movie_id=row['movie_id'],
+                count=row['count'],
+                rating_sum=row['rating_sum'],
+                mean=row['rating_sum'] / row['count'],
+                histogram={},
+            )
+            for row in ratings.values('movie_id').annotate(count=Count('id'), rating_sum=Sum('rating')).order_by()
+        }
+        if not stats:
+            continue
+        buckets = ratings.values('movie_id', bucket=Floor('rating')).annotate(count=Count('id')).order_by('movie_id', 'bucket')
+        for row in buckets:
+            stats[row['movie_id']].histogram[str(int(row['bucket']))] = row['count']
+        with transaction.atomic():
+            # Overwrite rather than skip, so a re-run after an interruption is safe.
+            MovieRatingStats.objects.bulk_create(
+                stats.values(),
+                update_conflicts=True,
+                unique_fields=['movie_id'],
+                update_fields=['count', 'rating_sum', 'mean', 'histogram'],
+            )
+
+
+class Migration(migrations.Migration):
+    # Commit chunk by chunk instead of holding one transaction over the whole table.
+    atomic = False
+
+    dependencies = [
+        ('movies', '0007_movierating_indexes_movieratingstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_backfill_movieratingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movierating',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='movierating',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
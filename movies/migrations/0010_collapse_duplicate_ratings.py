@@ -0,0 +1,81 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Floor
+
+# User ids processed per transaction. Each chunk is a range scan on the
+# (user, created_at) index, so the table is never scanned (or locked) in one go.
+CHUNK_SIZE = 1000
+DELETE_BATCH_SIZE = 5000
+
+
+def recompute_stats(MovieRating, MovieRatingStats, movie_ids):
+    ratings = MovieRating.objects.filter(movie_id__in=movie_ids)
+    stats = {
+        movie_id: MovieRatingStats(movie_id=movie_id, count=0, rating_sum=0, mean=0, histogram={})
+        for movie_id in movie_ids
+    }
+    for row in ratings.values('movie_id').annotate(count=Count('id'), rating_sum=Sum('rating')).order_by():
+        movie = stats[row['movie_id']]
+        movie.count, movie.rating_sum = row['count'], row['rating_sum']
+        movie.mean = row['rating_sum'] / row['count']
+    buckets = ratings.values('movie_id', bucket=Floor('rating')).annotate(count=Count('id')).order_by('movie_id', 'bucket')
+    for row in buckets:
+        stats[row['movie_id']].histogram[str(int(row['bucket']))] = row['count']
+    MovieRatingStats.objects.bulk_create(
+        stats.values(),
+        update_conflicts=True,
+        unique_fields=['movie_id'],
+        update_fields=['count', 'rating_sum', 'mean', 'histogram'],
+    )
+
+
+def collapse_duplicate_ratings(apps, schema_editor):
+    """
+    Keep only each user's latest rating of a movie, and fix the stats of the
+    movies that had duplicates.
+    """
+    MovieRating = apps.get_model('movies', 'MovieRating')
+    MovieRatingStats = apps.get_model('movies', 'MovieRatingStats')
+
+    bounds = MovieRating.objects.filter(user__isnull=False).aggregate(low=Min('user_id'), high=Max('user_id'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, CHUNK_SIZE):
+        ratings = MovieRating.objects.filter(user_id__gte=start, user_id__lt=start + CHUNK_SIZE)
+        duplicated = (
+            ratings.values('user_id', 'movie_id').annotate(count=Count('id')).filter(count__gt=1).order_by()
+        )
+        pairs = {(row['user_id'], row['movie_id']) for row in duplicated}
+        if not pairs:
+            continue
+
+        stale, kept = [], set()
+        candidates = ratings.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            movie_id__in={movie_id for _, movie_id in pairs},
+        ).order_by('user_id', 'movie_id', '-created_at', '-id').values_list('id', 'user_id', 'movie_id')
+        for rating_id, user_id, movie_id in candidates.iterator():
+            if (user_id, movie_id) not in pairs:
+                continue
+            if (user_id, movie_id) in kept:
+                stale.append(rating_id)
+            else:
+                kept.add((user_id, movie_id))
+
+        with transaction.atomic():
+            for offset in range(0, len(stale), DELETE_BATCH_SIZE):
+                MovieRating.objects.filter(id__in=stale[offset:offset + DELETE_BATCH_SIZE]).delete()
+            recompute_stats(MovieRating, MovieRatingStats, {movie_id for _, movie_id in pairs})
+
+
+class Migration(migrations.Migration):
+    # Commit chunk by chunk instead of holding one transaction over the whole table.
+    atomic = False
+
+    dependencies = [
+        ('movies', '0009_movierating_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicate_ratings, migrations.RunPython.noop),
+    ]
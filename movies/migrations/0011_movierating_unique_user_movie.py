@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_collapse_duplicate_ratings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='movierating',
+            constraint=models.UniqueConstraint(fields=('user', 'movie_id'), name='movies_rating_unique_user_movie'),
+        ),
+    ]
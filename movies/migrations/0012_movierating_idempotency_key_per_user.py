@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_movierating_unique_user_movie'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movierating',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='movierating',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='movies_rating_unique_user_key'),
+        ),
+    ]
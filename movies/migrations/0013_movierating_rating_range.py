@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:41
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_movierating_idempotency_key_per_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movierating',
+            name='rating',
+            field=models.FloatField(validators=[django.core.validators.MinValueValidator(0.5), django.core.validators.MaxValueValidator(10)]),
+        ),
+    ]
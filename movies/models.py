@@ -1,19 +1,150 @@
+import datetime
+from functools import partial
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+# Ratings use TMDb's scale
+RATING_MIN = 0.5
+RATING_MAX = 10
+
+
+class RatingQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Delete the ratings and update the stats of their movies, once for all of them.
+        """
+        from .ratings import delete_ratings  # movies.ratings imports the models
+        return delete_ratings(self)
+
+    def update(self, **kwargs):
+        """
+        Update the ratings and the stats of their movies, once for all of them.
+        """
+        from .ratings import update_ratings
+        return update_ratings(self, **kwargs)
+
 
 class MovieRating(models.Model):
     movie_id = models.IntegerField()
-    rating = models.FloatField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    rating = models.FloatField(validators=[MinValueValidator(RATING_MIN), MaxValueValidator(RATING_MAX)])
+    created_at = models.DateTimeField(default=timezone.now)  # Submission time, even if saved later from the buffer
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Optional client-chosen key that makes retried submissions save the rating only once (unique per user)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    objects = RatingQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='movies_rating_user_created'),  # A user's ratings, newest first
+            models.Index(fields=['movie_id'], name='movies_rating_movie'),
+        ]
+        constraints = [
+            # One rating per user and movie; rating again updates it (see movies.ratings.upsert_ratings)
+            models.UniqueConstraint(fields=['user', 'movie_id'], name='movies_rating_unique_user_movie'),
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='movies_rating_unique_user_key'),
+        ]
 
     def __str__(self):
         return f"Movie {self.movie_id} - Rating {self.rating} by {self.user}"
 
+    def save(self, *args, **kwargs):
+        # Through movies.ratings.save_rating, so the movie's stats are updated too (e.g. from the admin)
+        from .ratings import save_rating
+        save_rating(self, partial(super().save, *args, **kwargs), using=kwargs.get('using'))
+
+    def delete(self, using=None, keep_parents=False):
+        # Through RatingQuerySet.delete, so the movie's stats are updated too
+        return MovieRating.objects.db_manager(using).filter(pk=self.pk).delete()
+
+
+class MovieRatingStats(models.Model):
+    """
+    Aggregate of all ratings of one movie, kept up to date incrementally by
+    ``movies.ratings`` on every rating write.
+    """
+    movie_id = models.IntegerField(primary_key=True)
+    count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+    mean = models.FloatField(default=0)
+    histogram = models.JSONField(default=dict)  # {"4": 12, ...}: ratings per whole-number bucket (floor of the rating)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Movie {self.movie_id} - {self.count} ratings, mean {self.mean:.2f}"
+
 class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
     tmdb_id = models.IntegerField(unique=True)
+    translations = models.JSONField(default=dict, blank=True)  # {"fr": "Comédie", ...} for other configured languages
 
     def __str__(self):
         return self.name
+
+
+class Movie(models.Model):
+    """
+    Local mirror of the TMDb movie fields we serve, kept up to date by the
+    ``sync_tmdb_movies`` command from TMDb's change feed.
+    """
+    tmdb_id = models.IntegerField(unique=True)
+    title = models.CharField(max_length=255)
+    original_title = models.CharField(max_length=255, blank=True)
+    original_language = models.CharField(max_length=10, blank=True)
+    overview = models.TextField(blank=True)
+    release_date = models.DateField(null=True, blank=True)
+    runtime = models.IntegerField(null=True, blank=True)
+    genres = models.JSONField(default=list)  # [{"id": 35, "name": "Comedy"}, ...] as returned by TMDb
+    poster_path = models.CharField(max_length=255, blank=True)
+    backdrop_path = models.CharField(max_length=255, blank=True)
+    popularity = models.FloatField(default=0)
+    vote_average = models.FloatField(default=0)
+    vote_count = models.IntegerField(default=0)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    # Fields refreshed on every sync (everything but the keys)
+    SYNCED_FIELDS = [
+        'title', 'original_title', 'original_language', 'overview', 'release_date', 'runtime', 'genres',
+        'poster_path', 'backdrop_path', 'popularity', 'vote_average', 'vote_count', 'synced_at',
+    ]
+
+    def __str__(self):
+        return self.title
+
+    @classmethod
+    def from_tmdb(cls, data):
+        """
+        Build an unsaved instance from a TMDb ``/movie/{id}`` document.
+        """
+        release_date = data.get('release_date')
+        return cls(
+            tmdb_id=data['id'],
+            title=data.get('title') or '',
+            original_title=data.get('original_title') or '',
+            original_language=data.get('original_language') or '',
+            overview=data.get('overview') or '',
+            release_date=datetime.date.fromisoformat(release_date) if release_date else None,
+            runtime=data.get('runtime'),
+            genres=[{'id': genre['id'], 'name': genre['name']} for genre in data.get('genres', [])],
+            poster_path=data.get('poster_path') or '',
+            backdrop_path=data.get('backdrop_path') or '',
+            popularity=data.get('popularity') or 0,
+            vote_average=data.get('vote_average') or 0,
+            vote_count=data.get('vote_count') or 0,
+        )
+
+
+class SyncCheckpoint(models.Model):
+    """
+    Progress of a resumable sync: everything before ``synced_until`` is done,
+    and ``page`` pages of the window starting there have been applied.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    synced_until = models.DateField()
+    page = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} synced until {self.synced_until} (page {self.page})"
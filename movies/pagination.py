@@ -0,0 +1,49 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class RatingCursorPagination(CursorPagination):
+    """
+    Cursor pagination over a user's ratings, newest first.
+
+    Each page is a range scan on the (user, created_at) index starting at the
+    cursor position, so deep pages cost the same as the first one (unlike
+    offset pagination), and rows inserted meanwhile do not shift pages.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.RATINGS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.RATINGS_MAX_PAGE_SIZE
+
+
+# TMDb's discover endpoint serves fixed pages of 20 results, and no page past the 500th
+TMDB_PAGE_SIZE = 20
+TMDB_MAX_PAGES = 500
+
+
+def tmdb_pages(page, page_size):
+    """
+    The TMDb discover pages holding page ``page`` of ``page_size`` recommendations.
+
+    :return: Tuple of ``(pages, offset)``, where ``offset`` is the position of
+             the page's first result in the first TMDb page
+    """
+    first = (page - 1) * page_size
+    last = first + page_size - 1
+    return list(range(first // TMDB_PAGE_SIZE + 1, last // TMDB_PAGE_SIZE + 2)), first % TMDB_PAGE_SIZE
+
+
+def recommendations_page(tmdb_results, page, page_size, offset):
+    """
+    Cut page ``page`` of ``page_size`` recommendations out of consecutive TMDb
+    discover pages (as returned by ``fetch_movie_recommendations``).
+    """
+    results = [movie for tmdb_page in tmdb_results for movie in tmdb_page['results']]
+    total_results = min(tmdb_results[0]['total_results'], TMDB_PAGE_SIZE * TMDB_MAX_PAGES)
+    return {
+        'page': page,
+        'page_size': page_size,
+        'total_pages': -(-total_results // page_size),
+        'total_results': total_results,
+        'results': results[offset:offset + page_size],
+    }
@@ -0,0 +1,141 @@
+"""
+Precomputed recommendations for the most requested preferences.
+
+Every recommendation request counts its normalized preferences in an hourly
+Redis sorted set (``record_request``). ``precompute`` (run by Celery beat
+every ``PRECOMPUTE_INTERVAL`` seconds) takes the ``PRECOMPUTE_WARM_SET_SIZE``
+most requested preferences over the last ``PRECOMPUTE_WINDOW_HOURS`` hours
+and fetches from TMDb, with bounded concurrency, every one whose cache entry
+is missing or would go stale before the next run. Popular queries are thus
+always served fresh from cache.
+
+Each run reports the share of recent traffic its warm set covers.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .caching import is_fresh, store
+from .preferences import RecommendationPreferences
+from .services import fetch_movie_recommendations
+
+application_logger = logging.getLogger('application')  # For general application logs
+error_logger = logging.getLogger('error')              # For error-specific logs
+
+POPULARITY_KEY = 'recommendations:popularity:{hour}'  # Sorted set: preferences -> requests
+REQUESTS_KEY = 'recommendations:requests:{hour}'      # Counter: all requests
+REPORT_KEY = 'recommendations:precompute-report'
+
+
+def _hour(offset=0):
+    return time.strftime('%Y%m%d%H', time.gmtime(time.time() - offset * 3600))
+
+
+def _member(preferences):
+    return json.dumps([list(preferences.genres), preferences.language, preferences.release_year])
+
+
+def record_request(preferences):
+    """
+    Count a recommendation request for ``preferences``. Never raises: losing a
+    count is better than failing the request.
+    """
+    try:
+        redis = get_redis_connection('default')
+    except NotImplementedError:
+        return  # Not a Redis cache; nothing to precompute from
+    hour = _hour()
+    expire = (settings.PRECOMPUTE_WINDOW_HOURS + 1) * 3600
+    try:
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.zincrby(POPULARITY_KEY.format(hour=hour), 1, _member(preferences))
+        pipeline.expire(POPULARITY_KEY.format(hour=hour), expire)
+        pipeline.incr(REQUESTS_KEY.format(hour=hour))
+        pipeline.expire(REQUESTS_KEY.format(hour=hour), expire)
+        pipeline.execute()
+    except Exception as e:
+        error_logger.error("Could not record recommendation request: %s", e)
+
+
+def popular_preferences(limit):
+    """
+    The most requested preferences over the window, and the share of all
+    requests in the window they account for.
+
+    :return: Tuple of ``([(preferences, requests), ...], coverage)``
+    """
+    redis = get_redis_connection('default')
+    hours = [_hour(offset) for offset in range(settings.PRECOMPUTE_WINDOW_HOURS)]
+    union_key = f"{POPULARITY_KEY.format(hour='window')}:{time.time_ns()}"
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.zunionstore(union_key, [POPULARITY_KEY.format(hour=hour) for hour in hours])
+    pipeline.zrevrange(union_key, 0, limit - 1, withscores=True)
+    pipeline.delete(union_key)
+    pipeline.mget([REQUESTS_KEY.format(hour=hour) for hour in hours])
+    _, top, _, counts = pipeline.execute()
+
+    total = sum(int(count) for count in counts if count)
+    popular = []
+    for member, requests in top:
+        genres, language, release_year = json.loads(member)
+        popular.append((RecommendationPreferences(tuple(genres), language, release_year), int(requests)))
+    covered = sum(requests for _, requests in popular)
+    return popular, covered / total if total else 0.0
+
+
+def precompute():
+    """
+    Fetch the warm set's recommendations that are missing or about to go stale.
+
+    :return: Report dict, also stored in the cache for ``CacheStatsView``
+    """
+    started = time.monotonic()
+    popular, coverage = popular_preferences(settings.PRECOMPUTE_WARM_SET_SIZE)
+    by_key = {preferences.cache_key(): preferences for preferences, _ in popular}
+
+    # Entries that stay fresh until after the next run can be left alone
+    fresh_until = time.time() + settings.PRECOMPUTE_INTERVAL * 1.5
+    entries = cache.get_many(list(by_key))
+    due = [cache_key for cache_key in by_key if not is_fresh(entries.get(cache_key), at=fresh_until)]
+
+    def refresh(cache_key):
+        preferences = by_key[cache_key]
+        try:
+            store(cache_key, fetch_movie_recommendations(*preferences))
+            return True
+        except Exception as e:
+            error_logger.error("Could not precompute recommendations for %s: %s", preferences, e)
+            return False
+
+    refreshed = 0
+    if due:
+        with ThreadPoolExecutor(max_workers=min(settings.PRECOMPUTE_CONCURRENCY, len(due))) as executor:
+            refreshed = sum(executor.map(refresh, due))
+
+    report = {
+        'warm_set': len(by_key),
+        'refreshed': refreshed,
+        'failed': len(due) - refreshed,
+        'coverage': round(coverage, 4),
+        'window_hours': settings.PRECOMPUTE_WINDOW_HOURS,
+        'finished_at': time.time(),
+    }
+    cache.set(REPORT_KEY, report, timeout=None)
+    application_logger.info(
+        "Precomputed recommendations: %s/%s due entries of a warm set of %s refreshed in %.1fs; "
+        "the warm set covers %.1f%% of recent requests",
+        refreshed, len(due), len(by_key), time.monotonic() - started, coverage * 100,
+    )
+    return report
+
+
+def precompute_report():
+    """
+    The last run's report, or ``None`` if it never ran.
+    """
+    return cache.get(REPORT_KEY)
@@ -0,0 +1,68 @@
+"""
+Normalized recommendation preferences and their cache keys.
+
+Requests that ask for the same recommendations in different ways (key order,
+genre order, genre names vs. TMDb ids, casing, extra fields) normalize to the
+same ``RecommendationPreferences``, and therefore share one cache entry.
+"""
+import hashlib
+import json
+from typing import NamedTuple
+
+from rest_framework.exceptions import ValidationError
+
+from .serializers import MovieRecommendationSerializer
+from .utils import map_genres_to_ids
+
+# Bump when the normalization or the cached value format changes.
+CACHE_KEY_VERSION = 2
+
+
+def normalize_language(language):
+    """
+    Normalize a language tag to TMDb's ``xx`` / ``xx-YY`` casing.
+    """
+    code, _, region = language.strip().replace('_', '-').partition('-')
+    return f"{code.lower()}-{region.upper()}" if region else code.lower()
+
+
+class RecommendationPreferences(NamedTuple):
+    genres: tuple  # Sorted, de-duplicated TMDb genre ids
+    language: str
+    release_year: int
+
+    @classmethod
+    def from_request_data(cls, data):
+        """
+        Validate request data with ``MovieRecommendationSerializer`` and normalize it.
+        Genres may be given as names or TMDb ids; unknown fields are dropped.
+
+        :raises ValidationError: If the data is invalid or no genre is known
+        """
+        serializer = MovieRecommendationSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        validated = serializer.validated_data
+
+        names = [genre for genre in validated['genres'] if not genre.isdigit()]
+        genre_ids = {int(genre) for genre in validated['genres'] if genre.isdigit()}
+        if names:
+            try:
+                genre_ids.update(map_genres_to_ids(names))
+            except ValueError as e:
+                raise ValidationError({'genres': [str(e)]})
+        if not genre_ids:
+            raise ValidationError({'genres': ["At least one genre is required."]})
+
+        return cls(
+            genres=tuple(sorted(genre_ids)),
+            language=normalize_language(validated['language']),
+            release_year=validated['release_year'],
+        )
+
+    def cache_key(self, page=1):
+        """
+        Fixed-size, versioned cache key for one TMDb discover page of these preferences.
+        """
+        canonical = json.dumps([list(self.genres), self.language, self.release_year], separators=(',', ':'))
+        digest = hashlib.sha256(canonical.encode()).hexdigest()[:32]
+        return f"recommendations:v{CACHE_KEY_VERSION}:{digest}:{page}"
@@ -0,0 +1,238 @@
+"""
+Write-behind buffer for rating submissions (opt-in with ``RATINGS_WRITE_BEHIND``).
+
+Instead of one small transaction per submission, ``RatingView`` appends the
+validated rating to a Redis stream and answers 202. ``drain`` (run by
+``drain_ratings_task``) reads the stream through a consumer group and saves
+the entries in batches with ``upsert_ratings``.
+
+Delivery is at least once: an entry is acknowledged and removed only after
+its batch is committed, and entries left pending by a crashed drainer are
+reclaimed after ``RATINGS_STREAM_CLAIM_IDLE`` seconds. Redelivered entries
+are recognized by their user and idempotency key (chosen by the client or
+generated on submission), so each rating is saved once.
+
+A batch that fails on bad data is saved row by row. Ratings of deleted users
+are dropped; other failed entries are retried, then moved to
+``RATINGS_DEAD_LETTER_STREAM`` after ``RATINGS_STREAM_MAX_DELIVERIES`` deliveries.
+"""
+import datetime
+import json
+import logging
+import os
+import socket
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DataError, IntegrityError
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from .models import MovieRating
+from .ratings import upsert_ratings
+
+application_logger = logging.getLogger('application')  # For general application logs
+error_logger = logging.getLogger('error')              # For error-specific logs
+
+CONSUMER_GROUP = 'rating-writers'
+
+# Errors caused by the data of a row, rather than by the database being unavailable
+ROW_ERRORS = (IntegrityError, DataError, ValueError, TypeError)
+
+
+def enqueue_rating(validated_data, user):
+    """
+    Append a validated rating to the stream.
+
+    :param validated_data: ``RatingSerializer.validated_data``
+    :param user: The submitting user
+    :return: The rating's idempotency key
+    """
+    key = validated_data.get('idempotency_key') or uuid.uuid4().hex
+    entry = {
+        'movie_id': validated_data['movie_id'],
+        'rating': validated_data['rating'],
+        'user_id': user.pk,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'idempotency_key': key,
+    }
+    get_redis_connection('default').xadd(settings.RATINGS_STREAM, {'rating': json.dumps(entry)})
+    return key
+
+
+def _ensure_group(redis):
+    try:
+        redis.xgroup_create(settings.RATINGS_STREAM, CONSUMER_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _decode(entries):
+    """
+    Parse stream entries into ``MovieRating`` field dicts.
+
+    :return: Tuple of ``(rows, malformed)``: ``(entry id, row)`` pairs, and the ids
+             of the entries that cannot be parsed (they would never succeed)
+    """
+    rows, malformed = [], []
+    for entry_id, fields in entries:
+        try:
+            row = json.loads(fields[b'rating'])
+            row['created_at'] = datetime.datetime.fromisoformat(row['created_at'])
+        except (KeyError, ValueError) as e:
+            error_logger.error("Malformed rating stream entry %s: %s", entry_id, e)
+            malformed.append(entry_id)
+            continue
+        rows.append((entry_id, row))
+    return rows, malformed
+
+
+def _pending_rows(rows):
+    """
+    The rows still to be saved: not saved before (a redelivered entry), not
+    older than the user's current rating of the movie, and of existing users.
+    Duplicates within the batch are saved once.
+    """
+    # Idempotency keys are unique per user, so different users may send the same key
+    already_saved = set(
+        MovieRating.objects.filter(
+            user_id__in={row['user_id'] for _, row in rows},
+            idempotency_key__in={row['idempotency_key'] for _, row in rows},
+        ).values_list('user_id', 'idempotency_key')
+    )
+    # A redelivered entry must not overwrite a rating the user changed since
+    saved_at = {
+        (user_id, movie_id): created_at
+        for user_id, movie_id, created_at in MovieRating.objects.filter(
+            user_id__in={row['user_id'] for _, row in rows},
+            movie_id__in={row['movie_id'] for _, row in rows},
+        ).values_list('user_id', 'movie_id', 'created_at')
+    }
+    # Users deleted since they submitted a rating
+    users = set(User.objects.filter(pk__in={row['user_id'] for _, row in rows}).values_list('pk', flat=True))
+
+    pending, seen = [], set()
+    for entry_id, row in rows:
+        key = (row['user_id'], row['idempotency_key'])
+        if key in already_saved or key in seen:
+            continue
+        seen.add(key)
+        if row['user_id'] not in users:
+            application_logger.warning("Dropping rating stream entry %s of deleted user %s", entry_id, row['user_id'])
+        elif saved_at.get((row['user_id'], row['movie_id']), row['created_at']) <= row['created_at']:
+            pending.append((entry_id, row))
+    return pending
+
+
+def _upsert(pending):
+    """
+    Save ``pending`` rows in one transaction or, if that fails on bad data,
+    row by row, so that one bad row does not hold up the others.
+
+    :return: Tuple of ``(saved, failed)``: the number of rows saved, and a dict of
+             the failed entries' ids to their errors
+    """
+    try:
+        upsert_ratings([row for _, row in pending])
+        return len(pending), {}
+    except ROW_ERRORS as e:
+        application_logger.warning("Saving a batch of %s buffered ratings failed (%s); saving them one by one", len(pending), e)
+
+    saved, failed = 0, {}
+    for entry_id, row in pending:
+        try:
+            upsert_ratings([row])
+            saved += 1
+        except ROW_ERRORS as e:
+            error_logger.error("Could not save rating stream entry %s: %s", entry_id, e)
+            failed[entry_id] = e
+    return saved, failed
+
+
+def _dead_letter(redis, entries, errors):
+    """
+    Move ``entries`` to ``RATINGS_DEAD_LETTER_STREAM``, each with its error, for inspection.
+    """
+    pipeline = redis.pipeline(transaction=False)
+    for entry_id, fields in entries:
+        pipeline.xadd(settings.RATINGS_DEAD_LETTER_STREAM, {
+            **fields, 'entry_id': entry_id, 'error': str(errors.get(entry_id, 'malformed entry')),
+        })
+    pipeline.execute()
+    error_logger.error("Moved %s rating stream entries to %s", len(entries), settings.RATINGS_DEAD_LETTER_STREAM)
+
+
+def _delivery_counts(redis, entry_ids):
+    counts = {}
+    for entry_id in entry_ids:
+        pending = redis.xpending_range(settings.RATINGS_STREAM, CONSUMER_GROUP, min=entry_id, max=entry_id, count=1)
+        counts[entry_id] = pending[0]['times_delivered'] if pending else 0
+    return counts
+
+
+def _save(redis, entries):
+    """
+    Save a batch of stream entries and acknowledge those that are done with.
+
+    Entries whose row failed stay pending, to be retried once reclaimed, and
+    are moved to the dead-letter stream after ``RATINGS_STREAM_MAX_DELIVERIES``
+    deliveries. Malformed entries are moved there at once.
+
+    :return: Number of ratings saved
+    """
+    rows, malformed = _decode(entries)
+    saved, failed = _upsert(_pending_rows(rows)) if rows else (0, {})
+
+    # Only now that the ratings are committed may the entries go.
+    deliveries = _delivery_counts(redis, list(failed))
+    given_up = {entry_id for entry_id, count in deliveries.items() if count >= settings.RATINGS_STREAM_MAX_DELIVERIES}
+    dead = [(entry_id, fields) for entry_id, fields in entries if entry_id in given_up or entry_id in malformed]
+    if dead:
+        _dead_letter(redis, dead, failed)
+    entry_ids = [entry_id for entry_id, _ in entries if entry_id not in failed or entry_id in given_up]
+    if entry_ids:
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.xack(settings.RATINGS_STREAM, CONSUMER_GROUP, *entry_ids)
+        pipeline.xdel(settings.RATINGS_STREAM, *entry_ids)
+        pipeline.execute()
+    return saved
+
+
+def drain(max_batches=None):
+    """
+    Save buffered ratings until the stream is empty (or after ``max_batches`` batches).
+
+    :return: Number of ratings saved
+    """
+    redis = get_redis_connection('default')
+    _ensure_group(redis)
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    batch_size = settings.RATINGS_STREAM_BATCH
+    saved = batches = 0
+
+    # First retry entries another drainer read but never acknowledged.
+    start_id = '0-0'
+    while max_batches is None or batches < max_batches:
+        start_id, entries, *_ = redis.xautoclaim(
+            settings.RATINGS_STREAM, CONSUMER_GROUP, consumer,
+            min_idle_time=settings.RATINGS_STREAM_CLAIM_IDLE * 1000, start_id=start_id, count=batch_size,
+        )
+        if entries:
+            application_logger.warning("Retrying %s unacknowledged rating stream entries", len(entries))
+            saved += _save(redis, entries)
+            batches += 1
+        if start_id in (b'0-0', '0-0'):
+            break
+
+    while max_batches is None or batches < max_batches:
+        response = redis.xreadgroup(CONSUMER_GROUP, consumer, {settings.RATINGS_STREAM: '>'}, count=batch_size)
+        if not response:
+            break
+        saved += _save(redis, response[0][1])
+        batches += 1
+
+    if saved:
+        application_logger.info("Saved %s buffered ratings in %s batches", saved, batches)
+    return saved
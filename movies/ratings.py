@@ -0,0 +1,206 @@
+"""
+Rating writes and the per-movie ``MovieRatingStats`` aggregate.
+
+Rating writes update the stats with ``update_stats`` in the same
+transaction, so a movie's count, sum, mean and histogram are read from one
+row instead of scanning its ratings. Ratings are saved with ``upsert_ratings``:
+each user has at most one rating per movie. ``MovieRating.save()`` (so
+``objects.create()`` and the admin too), ``QuerySet.update()`` and deletes (of
+ratings, or of users) update the stats as well, once per call rather than once
+per rating. ``bulk_create()`` and ``bulk_update()`` do not: use
+``upsert_ratings`` instead.
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MovieRating, MovieRatingStats
+
+
+def histogram_bucket(rating):
+    """
+    Histogram bucket of a rating: its whole-number part, as a JSON object key.
+    """
+    return str(math.floor(rating))
+
+
+def lock_stats(movie_ids):
+    """
+    Lock the stats rows of ``movie_ids`` (creating missing ones) until the
+    end of the current transaction.
+
+    Rows are locked in a fixed order, so concurrent writers of the same movies
+    queue up instead of deadlocking.
+
+    :return: Dict of movie id -> ``MovieRatingStats``
+    """
+    movie_ids = sorted(movie_ids)
+    MovieRatingStats.objects.bulk_create(
+        [MovieRatingStats(movie_id=movie_id) for movie_id in movie_ids], ignore_conflicts=True,
+    )
+    return {
+        row.movie_id: row
+        for row in MovieRatingStats.objects.select_for_update().filter(movie_id__in=movie_ids).order_by('movie_id')
+    }
+
+
+def update_stats(changes, stats=None):
+    """
+    Apply rating changes to the per-movie aggregates. Must run inside the
+    transaction that writes the ratings.
+
+    :param changes: Iterable of ``(movie_id, old_rating, new_rating)``; ``old_rating``
+        is ``None`` for a new rating and ``new_rating`` is ``None`` for a deleted one
+    :param stats: Stats rows already locked with ``lock_stats``, if any
+    """
+    counts, sums, buckets = Counter(), Counter(), defaultdict(Counter)
+    for movie_id, old_rating, new_rating in changes:
+        if old_rating is not None:
+            counts[movie_id] -= 1
+            sums[movie_id] -= old_rating
+            buckets[movie_id][histogram_bucket(old_rating)] -= 1
+        if new_rating is not None:
+            counts[movie_id] += 1
+            sums[movie_id] += new_rating
+            buckets[movie_id][histogram_bucket(new_rating)] += 1
+    if not buckets:
+        return
+
+    if stats is None:
+        stats = lock_stats(buckets)
+    now = timezone.now()  # bulk_update() does not apply auto_now
+    changed = []
+    for movie_id in sorted(buckets):
+        row = stats[movie_id]
+        row.count += counts[movie_id]
+        row.rating_sum += sums[movie_id]
+        row.mean = row.rating_sum / row.count if row.count else 0
+        histogram = Counter(row.histogram)
+        histogram.update(buckets[movie_id])
+        row.histogram = {
+            bucket: count for bucket, count in sorted(histogram.items(), key=lambda item: int(item[0])) if count > 0
+        }
+        row.updated_at = now
+        changed.append(row)
+    MovieRatingStats.objects.bulk_update(changed, ['count', 'rating_sum', 'mean', 'histogram', 'updated_at'])
+
+
+def upsert_ratings(rows, batch_size=None):
+    """
+    Save ratings in one transaction with chunked multi-row upserts and update
+    the stats of the rated movies. A user has one rating per movie: rating it
+    again replaces the rating and its timestamp.
+
+    :param rows: List of dicts of ``MovieRating`` field values (e.g. validated serializer data)
+    :param batch_size: Rows per statement; defaults to ``RATINGS_BULK_BATCH_SIZE``
+    :return: The saved ``MovieRating`` instances
+    """
+    latest = {}
+    for row in rows:
+        rating = MovieRating(**row)
+        latest[(rating.user_id, rating.movie_id)] = rating  # A later row for the same movie wins
+    ratings = list(latest.values())
+    if not ratings:
+        return []
+
+    with transaction.atomic():
+        stats = lock_stats({rating.movie_id for rating in ratings})
+        # Ratings being replaced, read after taking the locks so they cannot change meanwhile
+        previous = {
+            (user_id, movie_id): value
+            for user_id, movie_id, value in MovieRating.objects.filter(
+                user_id__in={rating.user_id for rating in ratings},
+                movie_id__in=stats,
+            ).values_list('user_id', 'movie_id', 'rating')
+        }
+        MovieRating.objects.bulk_create(
+            ratings,
+            batch_size=batch_size or settings.RATINGS_BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['user', 'movie_id'],
+            update_fields=['rating', 'created_at', 'idempotency_key'],
+        )
+        update_stats(
+            [(rating.movie_id, previous.get((rating.user_id, rating.movie_id)), rating.rating) for rating in ratings],
+            stats,
+        )
+    return ratings
+
+
+def save_rating(rating, save, using=None):
+    """
+    Save one rating with ``save`` (the model's own ``save``) and update the
+    stats of its movie, and of the movie it was moved from if any, in the same
+    transaction. Used by ``MovieRating.save()``.
+    """
+    manager = MovieRating.objects.db_manager(using)
+    saved = manager.filter(pk=rating.pk) if rating.pk is not None else manager.none()
+    with transaction.atomic(using=using):
+        stats = lock_stats({rating.movie_id, *saved.values_list('movie_id', flat=True)})
+        # The previous rating, read after taking the locks so it cannot change meanwhile
+        previous = saved.values_list('movie_id', 'rating').first()
+        save()
+        changes = [(rating.movie_id, None, rating.rating)]
+        if previous is not None:
+            changes.append((*previous, None))
+        # Unless the rating was moved to another movie between the two reads, its stats are locked already
+        update_stats(changes, stats if previous is None or previous[0] in stats else None)
+
+
+def update_ratings(ratings, **kwargs):
+    """
+    Update a queryset of ratings with ``QuerySet.update(**kwargs)`` and update
+    the stats of their movies in the same transaction, with one stats update
+    for all of them. Used by ``MovieRating.objects.update()``.
+
+    :return: Same as ``QuerySet.update()``
+    """
+    with transaction.atomic(using=ratings.db):
+        stats = lock_stats(set(ratings.values_list('movie_id', flat=True)))
+        # Ratings read after taking the locks, so they cannot change meanwhile
+        before = {
+            pk: (movie_id, rating)
+            for pk, movie_id, rating in ratings.filter(movie_id__in=stats).values_list('pk', 'movie_id', 'rating')
+        }
+        # A plain queryset, so that this is not called again
+        updated_ratings = QuerySet(MovieRating, using=ratings.db).filter(pk__in=before)
+        updated = updated_ratings.update(**kwargs)
+        after = list(updated_ratings.values_list('pk', 'movie_id', 'rating'))
+        stats.update(lock_stats({movie_id for _, movie_id, _ in after} - stats.keys()))  # Ratings moved to other movies
+        update_stats(
+            [(movie_id, rating, None) for movie_id, rating in before.values()]
+            + [(movie_id, None, rating) for _, movie_id, rating in after],
+            stats,
+        )
+    return updated
+
+
+def delete_ratings(ratings):
+    """
+    Delete a queryset of ratings and update the stats of their movies in the
+    same transaction, with one stats update for all of them. Used by
+    ``MovieRating.objects.delete()`` and ``MovieRating.delete()``.
+
+    :return: Same as ``QuerySet.delete()``
+    """
+    with transaction.atomic(using=ratings.db):
+        stats = lock_stats(set(ratings.values_list('movie_id', flat=True)))
+        # Ratings read after taking the locks, so they cannot change meanwhile
+        rows = list(ratings.filter(movie_id__in=stats).values_list('pk', 'movie_id', 'rating'))
+        # A plain queryset: without signal receivers, the ratings are deleted in one query
+        deleted = QuerySet(MovieRating, using=ratings.db).filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        update_stats([(movie_id, rating, None) for _, movie_id, rating in rows], stats)
+    return deleted
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_ratings(sender, instance, **kwargs):
+    # Before the cascade, which would delete the ratings without updating the stats
+    MovieRating.objects.filter(user=instance).delete()
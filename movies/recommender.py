@@ -0,0 +1,225 @@
+"""
+Item-item collaborative filtering over ``MovieRating``.
+
+``build`` (run by ``build_recommender_task``) turns all ratings into a sparse
+user x movie matrix of mean-centered ratings, computes the cosine similarity
+between movies ("adjusted cosine") block by block, and writes the top
+``RECOMMENDER_NEIGHBORS`` neighbors of every movie to ``.npy`` files:
+
+- ``movie_ids.npy``: sorted TMDb ids; a movie's position is its row below
+- ``neighbors.npy``: positions of each movie's neighbors (int32, -1 padded)
+- ``scores.npy``: the matching similarities (float32)
+
+Builds are published with ``movies.artifacts``. Web workers memory-map the
+current build read-only, so all workers on a host share one copy of it in
+the page cache and serving a recommendation is a lookup, not a computation.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Sum
+from scipy import sparse
+
+from .artifacts import current_build, new_build, publish
+from .models import MovieRating, MovieRatingStats
+
+application_logger = logging.getLogger('application')  # For general application logs
+
+BLOCK_CELLS = 1 << 25  # Similarity values computed per block (128 MB of float64)
+
+
+def _watermark():
+    """
+    Summary of the ratings that changes whenever a rating is written.
+    """
+    totals = MovieRatingStats.objects.aggregate(count=Sum('count'), updated_at=Max('updated_at'))
+    updated_at = totals['updated_at'].isoformat() if totals['updated_at'] else None
+    return [totals['count'] or 0, updated_at]
+
+
+def _load_ratings():
+    rows = MovieRating.objects.filter(user__isnull=False).values_list('user_id', 'movie_id', 'rating')
+    return np.fromiter(
+        rows.iterator(chunk_size=10_000), dtype=[('user', np.int64), ('movie', np.int64), ('rating', np.float32)],
+    )
+
+
+def _similarity_matrix(ratings):
+    """
+    Column-normalized user x movie matrix of mean-centered ratings, and the sorted movie ids.
+    """
+    users, user_index = np.unique(ratings['user'], return_inverse=True)
+    movie_ids, movie_index = np.unique(ratings['movie'], return_inverse=True)
+    user_means = np.bincount(user_index, weights=ratings['rating']) / np.bincount(user_index)
+    centered = ratings['rating'] - user_means[user_index]
+
+    matrix = sparse.csc_matrix((centered, (user_index, movie_index)), shape=(len(users), len(movie_ids)))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (matrix @ sparse.diags(scale)).tocsc(), movie_ids
+
+
+def _top_neighbors(matrix, k):
+    """
+    Top-``k`` most similar movies (positions and similarities) for every movie.
+    """
+    movies = matrix.shape[1]
+    k = min(k, movies - 1)
+    neighbors = np.full((movies, max(k, 0)), -1, dtype=np.int32)
+    scores = np.zeros((movies, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return neighbors, scores
+
+    transposed = matrix.T.tocsr()
+    block = max(1, BLOCK_CELLS // movies)
+    for start in range(0, movies, block):
+        end = min(start + block, movies)
+        similarity = (transposed[start:end] @ matrix).toarray()
+        similarity[np.arange(end - start), np.arange(start, end)] = -np.inf  # Not its own neighbor
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        similar = top_scores > 0  # Only movies rated alike are neighbors
+        neighbors[start:end] = np.where(similar, top, -1)
+        scores[start:end] = np.where(similar, top_scores, 0)
+    return neighbors, scores
+
+
+def build(force=False):
+    """
+    Rebuild the neighbor table from all ratings, unless no rating changed since the last build.
+
+    :param force: Rebuild even if the ratings did not change
+    :return: Path of the current build
+    """
+    watermark = _watermark()
+    current = current_build(settings.RECOMMENDER_DIR)
+    if current and not force:
+        try:
+            with open(os.path.join(current, 'meta.json')) as f:
+                if json.load(f)['watermark'] == watermark:
+                    application_logger.info("Ratings unchanged since the last recommender build; skipping")
+                    return current
+        except (FileNotFoundError, KeyError, ValueError):
+            pass
+
+    started = time.monotonic()
+    ratings = _load_ratings()
+    if len(ratings):
+        matrix, movie_ids = _similarity_matrix(ratings)
+        neighbors, scores = _top_neighbors(matrix, settings.RECOMMENDER_NEIGHBORS)
+    else:
+        movie_ids = np.zeros(0, dtype=np.int64)
+        neighbors = np.zeros((0, 0), dtype=np.int32)
+        scores = np.zeros((0, 0), dtype=np.float32)
+
+    path = new_build(settings.RECOMMENDER_DIR)
+    np.save(os.path.join(path, 'movie_ids.npy'), movie_ids)
+    np.save(os.path.join(path, 'neighbors.npy'), neighbors)
+    np.save(os.path.join(path, 'scores.npy'), scores)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'watermark': watermark, 'ratings': len(ratings), 'movies': len(movie_ids)}, f)
+    publish(path)
+
+    application_logger.info(
+        "Built recommender from %s ratings of %s movies in %.1fs", len(ratings), len(movie_ids), time.monotonic() - started,
+    )
+    return path
+
+
+class NeighborIndex:
+    """
+    Read-only, memory-mapped view of one build.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.movie_ids = np.load(os.path.join(path, 'movie_ids.npy'), mmap_mode='r')
+        self.neighbors = np.load(os.path.join(path, 'neighbors.npy'), mmap_mode='r')
+        self.scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+
+    def positions(self, movie_ids):
+        """
+        Row positions of ``movie_ids``, and a mask of the ones that are in the index.
+        """
+        positions = np.searchsorted(self.movie_ids, movie_ids)
+        clipped = np.minimum(positions, len(self.movie_ids) - 1)
+        known = (positions < len(self.movie_ids)) & (np.asarray(self.movie_ids)[clipped] == movie_ids)
+        return clipped, known
+
+    def recommend(self, movie_ids, ratings, limit):
+        """
+        Movies most similar to the ones a user rated, weighted by how much more
+        (or less) than their average they liked each one.
+
+        :return: List of ``(movie_id, score)``, best first
+        """
+        if len(self.movie_ids) == 0 or self.neighbors.shape[1] == 0:
+            return []
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        weights = np.asarray(ratings, dtype=np.float32)
+        weights = weights - weights.mean()
+        if not weights.any():
+            weights = np.ones_like(weights)  # Rated everything alike: treat it all as liked
+        positions, known = self.positions(movie_ids)
+        if not known.any():
+            return []
+
+        neighbors = self.neighbors[positions[known]]
+        contributions = self.scores[positions[known]] * weights[known][:, None]
+        valid = neighbors >= 0
+        if not valid.any():
+            return []
+        candidates, inverse = np.unique(neighbors[valid], return_inverse=True)
+        totals = np.bincount(inverse, weights=contributions[valid])
+
+        rated = np.isin(candidates, positions[known])
+        totals[rated] = -np.inf
+        best = np.argsort(-totals)[:limit]
+        best = best[totals[best] > 0]
+        return [(int(self.movie_ids[candidates[i]]), float(totals[i])) for i in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_neighbor_index():
+    """
+    The current build, memory-mapped; ``None`` until the first build exists.
+    """
+    global _index
+    path = current_build(settings.RECOMMENDER_DIR)
+    if path is None:
+        return None
+    index = _index
+    if index is None or index.path != path:
+        with _index_lock:
+            if _index is None or _index.path != path:
+                _index = NeighborIndex(path)
+                application_logger.info("Loaded recommender build %s", path)
+            index = _index
+    return index
+
+
+def recommend_for_user(user, limit=None):
+    """
+    Personalized recommendations for ``user`` from their ratings.
+
+    :return: List of ``(movie_id, score)``, best first; empty if the user has
+        no ratings or no build exists yet
+    """
+    index = get_neighbor_index()
+    if index is None:
+        return []
+    rated = list(MovieRating.objects.filter(user=user).values_list('movie_id', 'rating'))
+    if not rated:
+        return []
+    movie_ids, ratings = zip(*rated)
+    return index.recommend(movie_ids, ratings, limit or settings.RECOMMENDER_RESULTS)
@@ -0,0 +1,130 @@
+"""
+Compact, typed projection of a movie: the fields MovieApp serves, whether the
+movie comes from the local mirror or from TMDb.
+
+TMDb's ``/movie/{id}`` document carries many fields we never render (budget,
+production companies, spoken languages, ...). Details are projected to a
+``MovieRecord`` before they are cached, so cache entries and responses only
+hold what clients use, in the same shape as ``MovieSerializer``.
+"""
+from typing import Optional
+
+from rest_framework.exceptions import ValidationError
+
+
+class MovieRecord:
+    """
+    One movie's served fields. Build it with ``from_tmdb``, ``from_movie`` or
+    ``from_dict`` (a cached ``to_dict``), and render it with ``to_dict``.
+    """
+    FIELDS = (
+        'id', 'title', 'original_title', 'original_language', 'overview', 'release_date', 'runtime', 'genres',
+        'poster_path', 'backdrop_path', 'popularity', 'vote_average', 'vote_count',
+    )
+    __slots__ = FIELDS
+
+    id: int
+    title: str
+    original_title: str
+    original_language: str
+    overview: str
+    release_date: Optional[str]  # ISO date
+    runtime: Optional[int]
+    genres: list  # [{"id": 35, "name": "Comedy"}, ...]
+    poster_path: str
+    backdrop_path: str
+    popularity: float
+    vote_average: float
+    vote_count: int
+
+    def __init__(self, id, title='', original_title='', original_language='', overview='', release_date=None,
+                 runtime=None, genres=(), poster_path='', backdrop_path='', popularity=0.0, vote_average=0.0,
+                 vote_count=0):
+        self.id = id
+        self.title = title
+        self.original_title = original_title
+        self.original_language = original_language
+        self.overview = overview
+        self.release_date = release_date
+        self.runtime = runtime
+        self.genres = list(genres)
+        self.poster_path = poster_path
+        self.backdrop_path = backdrop_path
+        self.popularity = popularity
+        self.vote_average = vote_average
+        self.vote_count = vote_count
+
+    @classmethod
+    def from_tmdb(cls, data):
+        """
+        Project a TMDb ``/movie/{id}`` document, dropping the fields we do not serve.
+        """
+        return cls(
+            id=data['id'],
+            title=data.get('title') or '',
+            original_title=data.get('original_title') or '',
+            original_language=data.get('original_language') or '',
+            overview=data.get('overview') or '',
+            release_date=data.get('release_date') or None,
+            runtime=data.get('runtime'),
+            genres=[{'id': genre['id'], 'name': genre['name']} for genre in data.get('genres', [])],
+            poster_path=data.get('poster_path') or '',
+            backdrop_path=data.get('backdrop_path') or '',
+            popularity=data.get('popularity') or 0.0,
+            vote_average=data.get('vote_average') or 0.0,
+            vote_count=data.get('vote_count') or 0,
+        )
+
+    @classmethod
+    def from_movie(cls, movie):
+        """
+        Project a mirrored ``Movie``.
+        """
+        return cls(
+            id=movie.tmdb_id,
+            title=movie.title,
+            original_title=movie.original_title,
+            original_language=movie.original_language,
+            overview=movie.overview,
+            release_date=movie.release_date.isoformat() if movie.release_date else None,
+            runtime=movie.runtime,
+            genres=movie.genres,
+            poster_path=movie.poster_path,
+            backdrop_path=movie.backdrop_path,
+            popularity=movie.popularity,
+            vote_average=movie.vote_average,
+            vote_count=movie.vote_count,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a record from ``to_dict`` output (e.g. a cached value). Unknown keys are ignored.
+        """
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+    def to_dict(self, fields=None):
+        """
+        The record as a plain dict, limited to ``fields`` if given (``id`` is always included).
+        """
+        if fields is None:
+            fields = self.FIELDS
+        elif 'id' not in fields:
+            fields = ('id', *fields)
+        return {field: getattr(self, field) for field in fields}
+
+
+def parse_fields(value):
+    """
+    Parse a ``?fields=title,overview`` sparse fieldset.
+
+    :return: Tuple of field names in ``MovieRecord.FIELDS`` order, or ``None`` for all fields
+    :raises ValidationError: If a field is unknown
+    """
+    if not value:
+        return None
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested.difference(MovieRecord.FIELDS)
+    if unknown:
+        raise ValidationError({'fields': [f"Unknown fields: {', '.join(sorted(unknown))}."]})
+    return tuple(field for field in MovieRecord.FIELDS if field in requested) or None
@@ -0,0 +1,13 @@
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import timer
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that reports its time as ``render`` in the request's ``Server-Timing``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer('render'):
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,292 @@
+"""
+Backpressure for TMDb calls: a rate limit shared by every process, and a
+circuit breaker.
+
+``tmdb_rate_limiter`` is a token bucket kept in Redis, refilled at
+``TMDB_RATE_LIMIT`` tokens per second up to ``TMDB_RATE_LIMIT_BURST``. Every
+TMDb attempt (retries included) takes a token, waiting for one if the bucket
+is empty; a call that would wait longer than ``TMDB_RATE_LIMIT_MAX_WAIT``
+fails instead. When TMDb answers 429, the bucket is emptied for the
+``Retry-After`` period, so every worker backs off, not just the one that was
+throttled. Without Redis scripting (e.g. a local-memory cache) or while Redis
+is unreachable, each process limits itself to the same rate on its own.
+
+``tmdb_breaker`` opens after ``TMDB_BREAKER_FAILURE_THRESHOLD`` consecutive
+failed calls (connection errors, timeouts, 429 and 5xx). While open, TMDb
+calls fail at once with ``TMDbUnavailable`` instead of waiting on timeouts;
+cached entries, stale ones included, are still served. After
+``TMDB_BREAKER_RESET_TIMEOUT`` seconds one trial call is let through, and
+closes the breaker if it succeeds. Breaker state is per process.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, ResponseError
+
+from . import metrics
+from .metrics import Counter, Histogram
+
+application_logger = logging.getLogger('application')  # For general application logs
+error_logger = logging.getLogger('error')              # For error-specific logs
+
+RATE_LIMIT_KEY = 'tmdb:rate-limit'
+
+# How long to use the per-process bucket after Redis failed, before trying Redis again
+REDIS_RETRY_INTERVAL = 5
+
+# Takes a token if one is available within ARGV[3] seconds, reserving it ahead of time if need
+# be (the bucket goes negative). Returns the seconds to wait, or -1 if the wait would be too
+# long. ARGV[4] = 1 instead empties the bucket for ARGV[3] seconds. Times come from Redis, so
+# the hosts' clocks do not matter.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, seconds, pause = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4] == '1'
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if pause then
+    tokens = math.min(tokens, -seconds * rate)
+else
+    if tokens < 1 then
+        wait = (1 - tokens) / rate
+    end
+    if wait > seconds then
+        return '-1'
+    end
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+RATE_LIMIT_WAIT = Histogram(
+    'movieapp_tmdb_rate_limit_wait_seconds', 'Time TMDb calls waited for the shared rate limit.',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+REJECTED = Counter('movieapp_tmdb_rejected_total', 'TMDb calls refused before being sent, by reason.', ['reason'])
+BREAKER_OPENED = Counter('movieapp_tmdb_circuit_opened_total', 'Times the TMDb circuit breaker opened.')
+
+
+class TMDbUnavailable(Exception):
+    """
+    A TMDb call was refused without being sent (open circuit breaker or rate limit).
+
+    :param retry_after: Seconds after which calls are likely to be accepted again
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LocalTokenBucket:
+    """
+    In-process version of the Redis token bucket, used when Redis cannot run it.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait):
+        with self._lock:
+            self._refill()
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Token bucket shared through Redis, falling back to a per-process bucket.
+    """
+
+    def __init__(self, rate, burst, max_wait, key=RATE_LIMIT_KEY):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.key = key
+        self.local = LocalTokenBucket(rate, burst)
+        self._script = None
+        self._redis_unavailable_until = 0.0  # float('inf') once Redis turns out not to support scripts
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _run(self, seconds, pause):
+        """
+        Run the bucket script in Redis; ``None`` if it cannot be used right now.
+        """
+        if time.monotonic() < self._redis_unavailable_until:
+            return None
+        try:
+            if self._script is None:
+                self._script = get_redis_connection('default').register_script(TOKEN_BUCKET_SCRIPT)
+            return float(self._script(keys=[self.key], args=[self.rate, self.burst, seconds, int(pause)]))
+        except NotImplementedError:
+            self._redis_unavailable_until = float('inf')  # Not a Redis cache
+        except ResponseError as e:
+            self._redis_unavailable_until = float('inf')
+            application_logger.warning("Redis cannot run the TMDb rate limit script (%s); limiting per process", e)
+        except RedisError as e:
+            self._redis_unavailable_until = time.monotonic() + REDIS_RETRY_INTERVAL
+            error_logger.error("TMDb rate limit unavailable in Redis (%s); limiting per process for %ss", e, REDIS_RETRY_INTERVAL)
+        return None
+
+    def reserve(self):
+        """
+        Take a token.
+
+        :return: Seconds to wait before making the call
+        :raises TMDbUnavailable: If no token is available within ``max_wait`` seconds
+        """
+        wait = self._run(self.max_wait, pause=False)
+        if wait is None:
+            wait = self.local.reserve(self.max_wait)
+        if wait is None or wait < 0:
+            REJECTED.inc('rate_limited')
+            raise TMDbUnavailable("TMDb rate limit reached", retry_after=self.max_wait)
+        RATE_LIMIT_WAIT.observe(wait)
+        metrics.record('ratelimit', wait)
+        return wait
+
+    def acquire(self):
+        """
+        Wait for a token (see ``reserve``).
+        """
+        if not self.enabled:
+            return
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """
+        Async version of ``acquire``.
+        """
+        if not self.enabled:
+            return
+        if time.monotonic() < self._redis_unavailable_until:
+            wait = self.reserve()  # Per-process bucket: no I/O, no need for a thread
+        else:
+            wait = await sync_to_async(self.reserve, thread_sensitive=False)()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Empty the bucket so that no process calls TMDb for ``seconds`` (e.g. after a 429).
+        """
+        if not self.enabled or seconds <= 0:
+            return
+        if self._run(seconds, pause=True) is None:
+            self.local.pause(seconds)
+        application_logger.warning("TMDb throttled us; pausing TMDb calls for %ss", seconds)
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker: closed, open after ``failure_threshold``
+    consecutive failures, half-open (one trial call) ``reset_timeout`` seconds later.
+    """
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, failure_threshold, reset_timeout, name='TMDb'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.failure_threshold > 0
+
+    def before_call(self):
+        """
+        :raises TMDbUnavailable: If the breaker is open, or half-open with a trial call in progress
+        """
+        if not self.enabled or self.state == self.CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_started = None
+            # A trial call that never reported back (e.g. cancelled) is replaced after reset_timeout
+            if self.state == self.HALF_OPEN and (self.trial_started is None or now - self.trial_started >= self.reset_timeout):
+                self.trial_started = now
+                return
+            if self.state == self.CLOSED:
+                return
+            retry_after = max(0.0, self.opened_at + self.reset_timeout - now) if self.state == self.OPEN else self.reset_timeout
+        REJECTED.inc('circuit_open')
+        raise TMDbUnavailable(f"{self.name} circuit breaker is open", retry_after=retry_after)
+
+    def record_success(self):
+        if self.failures == 0 and self.state == self.CLOSED:
+            return
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                application_logger.warning("%s circuit breaker closed", self.name)
+
+    def record_failure(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                BREAKER_OPENED.inc()
+                error_logger.error(
+                    "%s circuit breaker opened after %s consecutive failures; failing fast for %ss",
+                    self.name, self.failures, self.reset_timeout,
+                )
+
+
+tmdb_rate_limiter = RateLimiter(settings.TMDB_RATE_LIMIT, settings.TMDB_RATE_LIMIT_BURST, settings.TMDB_RATE_LIMIT_MAX_WAIT)
+tmdb_breaker = CircuitBreaker(settings.TMDB_BREAKER_FAILURE_THRESHOLD, settings.TMDB_BREAKER_RESET_TIMEOUT)
+
+BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def _collect_metrics():
+    return [
+        ('movieapp_tmdb_circuit_state', 'gauge', 'TMDb circuit breaker state: 0 closed, 1 half-open, 2 open.', [
+            ({}, BREAKER_STATES[tmdb_breaker.state]),
+        ]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
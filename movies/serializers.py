@@ -1,10 +1,106 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import MovieRating
+from .models import MovieRating, MovieRatingStats, Movie
+from .pagination import TMDB_MAX_PAGES, TMDB_PAGE_SIZE
+from .ratings import upsert_ratings
+
+class RatingListSerializer(serializers.ListSerializer):
+    """
+    Saves a list of ratings with chunked bulk upserts instead of one query per row.
+
+    Pass the user the ratings are saved for as ``context['user']`` when it is given
+    to ``save()`` rather than in each row, so that idempotency keys are checked for it.
+    """
+
+    def validate(self, attrs):
+        """
+        Reject idempotency keys that the same user gives to another movie, in this
+        list or in a saved rating: the upsert would fail on their uniqueness.
+
+        :raises ValidationError: Dict of the rejected rows' indexes to their error dicts
+        """
+        user = self.context.get('user')
+        keyed = []
+        for index, row in enumerate(attrs):
+            owner = user or row.get('user')
+            if row.get('idempotency_key') and owner is not None:
+                keyed.append((index, owner.pk, row['idempotency_key'], row['movie_id']))
+        if not keyed:
+            return attrs
+
+        saved = {
+            (user_id, key): movie_id
+            for user_id, key, movie_id in MovieRating.objects.filter(
+                user_id__in={user_id for _, user_id, _, _ in keyed},
+                idempotency_key__in={key for _, _, key, _ in keyed},
+            ).values_list('user_id', 'idempotency_key', 'movie_id')
+        }
+        errors, first = {}, {}
+        for index, user_id, key, movie_id in keyed:
+            if saved.get((user_id, key), movie_id) != movie_id:
+                errors[index] = {'idempotency_key': ["This idempotency key was already used for another movie."]}
+            elif first.setdefault((user_id, key), movie_id) != movie_id:
+                errors[index] = {'idempotency_key': ["This idempotency key is used for another movie in this list."]}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def create(self, validated_data):
+        return upsert_ratings(validated_data)
+
+
+class PrefetchedUserField(serializers.PrimaryKeyRelatedField):
+    """
+    Takes users from ``context['users']`` (a dict of primary keys to users, e.g.
+    from ``User.objects.in_bulk``) when given, instead of one query per row.
+    Users missing from it are looked up as usual.
+    """
+
+    def to_internal_value(self, data):
+        users = self.context.get('users')
+        if users is not None and not isinstance(data, bool):
+            try:
+                user = users.get(self.get_queryset().model._meta.pk.to_python(data))
+            except DjangoValidationError:
+                user = None  # Reported by the usual lookup
+            if user is not None:
+                return user
+        return super().to_internal_value(data)
+
 
 class RatingSerializer(serializers.ModelSerializer):
+    user = PrefetchedUserField(queryset=User.objects.all(), required=False, allow_null=True)
+
     class Meta:
         model = MovieRating
         fields = '__all__'
+        read_only_fields = ['created_at']
+        extra_kwargs = {'idempotency_key': {'write_only': True}}
+        list_serializer_class = RatingListSerializer
+        validators = []  # Rating a movie again replaces the previous rating rather than failing (user, movie_id) uniqueness
+
+    def create(self, validated_data):
+        return upsert_ratings([validated_data])[0]
+
+
+class MovieRatingStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MovieRatingStats
+        fields = ['movie_id', 'count', 'mean', 'histogram']
+
+
+class MovieSerializer(serializers.ModelSerializer):
+    """
+    Serializes a mirrored movie with TMDb's field names, so clients get the
+    same shape whether details come from the mirror or from TMDb.
+    """
+    id = serializers.IntegerField(source='tmdb_id')
+
+    class Meta:
+        model = Movie
+        exclude = ['tmdb_id', 'synced_at']
 
 
 class MovieRecommendationSerializer(serializers.Serializer):
@@ -12,3 +108,25 @@ class MovieRecommendationSerializer(serializers.Serializer):
     genres = serializers.ListField(child=serializers.CharField(max_length=100))
     release_year = serializers.IntegerField()
     language = serializers.CharField(max_length=50)
+
+
+class RecommendationPageSerializer(serializers.Serializer):
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(
+        min_value=1, max_value=settings.RECOMMENDATIONS_MAX_PAGE_SIZE, default=settings.RECOMMENDATIONS_PAGE_SIZE,
+    )
+
+    def validate(self, data):
+        if data['page'] * data['page_size'] > TMDB_PAGE_SIZE * TMDB_MAX_PAGES:
+            raise serializers.ValidationError(
+                {'page': [f"Only the first {TMDB_PAGE_SIZE * TMDB_MAX_PAGES} recommendations can be paged through."]}
+            )
+        return data
+
+
+class MovieBatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MOVIE_BATCH_MAX_IDS,
+    )
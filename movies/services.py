@@ -1,51 +1,80 @@
 import logging
+import httpx
 import requests
-from decouple import config
+from .records import MovieRecord
+from .resilience import TMDbUnavailable
+from .tmdb import get_async_tmdb_client, get_tmdb_client
 
 # Set up loggers for the service layer
 application_logger = logging.getLogger('application')  # For general application logs
 error_logger = logging.getLogger('error')              # For error-specific logs
 
-TMDB_API_URL = "https://api.themoviedb.org/3"
-TMDB_API_KEY = config("TMDB_API_KEY")
-
 
 class MovieRecommendationError(Exception):
     """Custom exception for movie recommendation fetch errors."""
     pass
 
 
-def fetch_movie_recommendations(genres, language, release_year):
+class TMDbUnavailableError(MovieRecommendationError):
+    """TMDb was not called (open circuit breaker or rate limit); retry after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Fields of a TMDb discover result that clients use; the rest is dropped before caching
+RECOMMENDATION_FIELDS = ('id', 'title', 'overview', 'release_date', 'vote_average', 'poster_path')
+
+
+def trim_recommendations(recommendations):
+    """
+    Reduce a TMDb discover response to its paging totals and the fields of
+    ``RECOMMENDATION_FIELDS``, which keeps cache entries and responses small.
+    """
+    return {
+        'page': recommendations.get('page', 1),
+        'total_pages': recommendations.get('total_pages', 0),
+        'total_results': recommendations.get('total_results', 0),
+        'results': [
+            {field: movie.get(field) for field in RECOMMENDATION_FIELDS}
+            for movie in recommendations.get('results', [])
+        ],
+    }
+
+
+def fetch_movie_recommendations(genres, language, release_year, page=1):
     """
     Fetch movie recommendations from TMDb API based on provided criteria.
     
-    :param genres: List of genres
+    :param genres: List of TMDb genre ids
     :param language: Language code
     :param release_year: Release year
-    :return: Dictionary containing recommendations
+    :param page: TMDb discover page (of 20 results)
+    :return: Dictionary containing recommendations, trimmed with ``trim_recommendations``
     """
-    application_logger.info(f"Fetching movie recommendations for genres: {genres}, language: {language}, release_year: {release_year}")
-    url = f"{TMDB_API_URL}/discover/movie"
+    application_logger.info("Fetching movie recommendations for genres: %s, language: %s, release_year: %s, page: %s", genres, language, release_year, page)
     params = {
-        'api_key': TMDB_API_KEY,
         'language': language,
-        'with_genres': ",".join(genres),
-        'primary_release_year': release_year
+        'with_genres': ",".join(str(genre) for genre in genres),
+        'primary_release_year': release_year,
+        'page': page,
     }
     try:
-        response = requests.get(url, params=params, verify=False)
-        response.raise_for_status()
-        recommendations = response.json()
-        application_logger.info(f"Successfully fetched {len(recommendations.get('results', []))} movie recommendations.")
+        recommendations = trim_recommendations(get_tmdb_client().get_json("discover/movie", params))
+        application_logger.info("Successfully fetched %s movie recommendations.", len(recommendations.get('results', [])))
         return recommendations
+    except TMDbUnavailable as e:
+        application_logger.warning("Not fetching recommendations: %s", e)
+        raise TMDbUnavailableError("TMDb is unavailable. Please try again later.", retry_after=e.retry_after)
     except requests.exceptions.HTTPError as e:
-        error_logger.error(f"HTTPError fetching recommendations: {e}", exc_info=True)
+        error_logger.error("HTTPError fetching recommendations: %s", e, exc_info=True)
         raise MovieRecommendationError("Could not fetch movie recommendations. Please try again later.")
     except requests.exceptions.RequestException as e:
-        error_logger.error(f"RequestException fetching recommendations: {e}", exc_info=True)
+        error_logger.error("RequestException fetching recommendations: %s", e, exc_info=True)
         raise MovieRecommendationError("An error occurred while fetching recommendations. Please try again.")
     except Exception as e:
-        error_logger.error(f"Unexpected error fetching recommendations: {e}", exc_info=True)
+        error_logger.error("Unexpected error fetching recommendations: %s", e, exc_info=True)
         raise MovieRecommendationError("An unexpected error occurred. Please try again later.")
 
 
@@ -54,23 +83,83 @@ def fetch_movie_details(movie_id):
     Fetch detailed information about a specific movie using its ID.
     
     :param movie_id: ID of the movie
-    :return: Dictionary containing movie details
+    :return: Dictionary containing movie details, projected with ``MovieRecord``
     """
-    application_logger.info(f"Fetching details for movie ID: {movie_id}")
-    url = f"{TMDB_API_URL}/movie/{movie_id}"
-    params = {'api_key': TMDB_API_KEY}
+    application_logger.info("Fetching details for movie ID: %s", movie_id)
     try:
-        response = requests.get(url, params=params, verify=False)
-        response.raise_for_status()
-        movie_details = response.json()
-        application_logger.info(f"Successfully fetched details for movie ID: {movie_id}.")
+        movie_details = MovieRecord.from_tmdb(get_tmdb_client().get_json(f"movie/{movie_id}")).to_dict()
+        application_logger.info("Successfully fetched details for movie ID: %s.", movie_id)
         return movie_details
+    except TMDbUnavailable as e:
+        application_logger.warning("Not fetching details for movie ID %s: %s", movie_id, e)
+        raise TMDbUnavailableError("TMDb is unavailable. Please try again later.", retry_after=e.retry_after)
     except requests.exceptions.HTTPError as e:
-        error_logger.error(f"HTTPError fetching movie details for ID {movie_id}: {e}", exc_info=True)
+        error_logger.error("HTTPError fetching movie details for ID %s: %s", movie_id, e, exc_info=True)
         raise MovieRecommendationError("Could not fetch movie details. Please try again later.")
     except requests.exceptions.RequestException as e:
-        error_logger.error(f"RequestException fetching movie details for ID {movie_id}: {e}", exc_info=True)
+        error_logger.error("RequestException fetching movie details for ID %s: %s", movie_id, e, exc_info=True)
+        raise MovieRecommendationError("An error occurred while fetching movie details. Please try again.")
+    except Exception as e:
+        error_logger.error("Unexpected error fetching movie details for ID %s: %s", movie_id, e, exc_info=True)
+        raise MovieRecommendationError("An unexpected error occurred. Please try again later.")
+
+
+async def afetch_movie_recommendations(genres, language, release_year, page=1):
+    """
+    Async version of ``fetch_movie_recommendations`` for ASGI views.
+    
+    :param genres: List of TMDb genre ids
+    :param language: Language code
+    :param release_year: Release year
+    :param page: TMDb discover page (of 20 results)
+    :return: Dictionary containing recommendations, trimmed with ``trim_recommendations``
+    """
+    application_logger.info("Fetching movie recommendations for genres: %s, language: %s, release_year: %s, page: %s", genres, language, release_year, page)
+    params = {
+        'language': language,
+        'with_genres': ",".join(str(genre) for genre in genres),
+        'primary_release_year': release_year,
+        'page': page,
+    }
+    try:
+        recommendations = trim_recommendations(await get_async_tmdb_client().get_json("discover/movie", params))
+        application_logger.info("Successfully fetched %s movie recommendations.", len(recommendations.get('results', [])))
+        return recommendations
+    except TMDbUnavailable as e:
+        application_logger.warning("Not fetching recommendations: %s", e)
+        raise TMDbUnavailableError("TMDb is unavailable. Please try again later.", retry_after=e.retry_after)
+    except httpx.HTTPStatusError as e:
+        error_logger.error("HTTPError fetching recommendations: %s", e, exc_info=True)
+        raise MovieRecommendationError("Could not fetch movie recommendations. Please try again later.")
+    except httpx.RequestError as e:
+        error_logger.error("RequestException fetching recommendations: %s", e, exc_info=True)
+        raise MovieRecommendationError("An error occurred while fetching recommendations. Please try again.")
+    except Exception as e:
+        error_logger.error("Unexpected error fetching recommendations: %s", e, exc_info=True)
+        raise MovieRecommendationError("An unexpected error occurred. Please try again later.")
+
+
+async def afetch_movie_details(movie_id):
+    """
+    Async version of ``fetch_movie_details`` for ASGI views.
+    
+    :param movie_id: ID of the movie
+    :return: Dictionary containing movie details, projected with ``MovieRecord``
+    """
+    application_logger.info("Fetching details for movie ID: %s", movie_id)
+    try:
+        movie_details = MovieRecord.from_tmdb(await get_async_tmdb_client().get_json(f"movie/{movie_id}")).to_dict()
+        application_logger.info("Successfully fetched details for movie ID: %s.", movie_id)
+        return movie_details
+    except TMDbUnavailable as e:
+        application_logger.warning("Not fetching details for movie ID %s: %s", movie_id, e)
+        raise TMDbUnavailableError("TMDb is unavailable. Please try again later.", retry_after=e.retry_after)
+    except httpx.HTTPStatusError as e:
+        error_logger.error("HTTPError fetching movie details for ID %s: %s", movie_id, e, exc_info=True)
+        raise MovieRecommendationError("Could not fetch movie details. Please try again later.")
+    except httpx.RequestError as e:
+        error_logger.error("RequestException fetching movie details for ID %s: %s", movie_id, e, exc_info=True)
         raise MovieRecommendationError("An error occurred while fetching movie details. Please try again.")
     except Exception as e:
-        error_logger.error(f"Unexpected error fetching movie details for ID {movie_id}: {e}", exc_info=True)
+        error_logger.error("Unexpected error fetching movie details for ID %s: %s", movie_id, e, exc_info=True)
         raise MovieRecommendationError("An unexpected error occurred. Please try again later.")
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by the update_tmdb_genres command after it changed the Genre table.
+# Receivers get ``inserted`` and ``updated`` (lists of TMDb genre ids).
+genres_updated = Signal()
@@ -0,0 +1,182 @@
+"""
+Request coalescing ("single-flight") for cache misses.
+
+When a popular cache entry expires, every concurrent request would otherwise
+call TMDb for the same data. ``fetch_once`` makes sure only one fetch per key
+runs at a time:
+
+- within a process, concurrent callers for the same key share one call and
+  all receive its result (or its exception);
+- across processes, the caller that wins a short-lived lock in the cache does
+  the fetch, while the others poll the cache until the value appears or the
+  lease runs out (after which they fetch themselves, so a crashed holder never
+  blocks anyone for longer than the lease).
+
+Fetched values are written through the two-tier cache, so the fetching
+process also keeps a local copy.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .tiered_cache import in_thread_pool, tiered_cache
+
+application_logger = logging.getLogger('application')  # For general application logs
+
+POLL_INTERVAL = 0.05  # Seconds between cache checks while another process fetches
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def _lock_key(cache_key):
+    return f"lock:{cache_key}"
+
+
+def _release(lock_key, token):
+    # Only drop the lock if we still hold it; if our lease ran out, another
+    # process may own it now.
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _fetch_with_lease(cache_key, fetch, timeout):
+    lease = settings.SINGLEFLIGHT_LOCK_LEASE
+    lock_key = _lock_key(cache_key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + lease
+
+    while not cache.add(lock_key, token, timeout=lease):
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(cache_key)
+        if value is not None:
+            application_logger.debug("Received %s fetched by another process", cache_key)
+            return value
+        if time.monotonic() >= deadline:
+            application_logger.warning("Lock on %s not released within %ss; fetching anyway", cache_key, lease)
+            token = None
+            break
+
+    try:
+        # Another process may have filled the entry just before we took the lock.
+        value = cache.get(cache_key)
+        if value is None:
+            value = fetch()
+            tiered_cache.set(cache_key, value, timeout=timeout)
+        return value
+    finally:
+        if token is not None:
+            _release(lock_key, token)
+
+
+def fetch_once(cache_key, fetch, timeout):
+    """
+    Fetch and cache the value for ``cache_key``, coalescing concurrent callers.
+
+    :param cache_key: Cache key the value is stored under
+    :param fetch: Callable returning the value (e.g. a TMDb service call)
+    :param timeout: Cache timeout for the fetched value, in seconds
+    :return: The fetched (or concurrently fetched) value
+    """
+    with _calls_lock:
+        call = _calls.get(cache_key)
+        leader = call is None
+        if leader:
+            call = _calls[cache_key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _fetch_with_lease(cache_key, fetch, timeout)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[cache_key]
+        call.done.set()
+
+
+async def _afetch_with_lease(cache_key, afetch, timeout):
+    lease = settings.SINGLEFLIGHT_LOCK_LEASE
+    lock_key = _lock_key(cache_key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + lease
+
+    while not await in_thread_pool(cache.add, lock_key, token, timeout=lease):
+        await asyncio.sleep(POLL_INTERVAL)
+        value = await in_thread_pool(cache.get, cache_key)
+        if value is not None:
+            application_logger.debug("Received %s fetched by another process", cache_key)
+            return value
+        if time.monotonic() >= deadline:
+            application_logger.warning("Lock on %s not released within %ss; fetching anyway", cache_key, lease)
+            token = None
+            break
+
+    try:
+        value = await in_thread_pool(cache.get, cache_key)
+        if value is None:
+            value = await afetch()
+            await tiered_cache.aset(cache_key, value, timeout=timeout)
+        return value
+    finally:
+        if token is not None and await in_thread_pool(cache.get, lock_key) == token:
+            await in_thread_pool(cache.delete, lock_key)
+
+
+# In-flight async calls, per event loop (futures cannot be awaited from another loop).
+_async_calls = weakref.WeakKeyDictionary()
+
+
+async def afetch_once(cache_key, afetch, timeout):
+    """
+    Async version of ``fetch_once``; ``afetch`` is a coroutine function.
+
+    If the caller making the call is cancelled (e.g. its client disconnected),
+    the callers waiting on it are not: one of them makes the call instead.
+    """
+    calls = _async_calls.setdefault(asyncio.get_running_loop(), {})
+    while (future := calls.get(cache_key)) is not None:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # This caller was cancelled, not the one making the call
+
+    future = calls[cache_key] = asyncio.get_running_loop().create_future()
+    try:
+        value = await _afetch_with_lease(cache_key, afetch, timeout)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark as retrieved when nobody was waiting
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        del calls[cache_key]
@@ -1,6 +1,68 @@
 from celery import shared_task
 from django.core.management import call_command
+from . import embeddings
+from .caching import store
+from .precompute import precompute
+from .preferences import RecommendationPreferences
+from .rating_buffer import drain
+from .recommender import build
+from .services import fetch_movie_details, fetch_movie_recommendations
 
 @shared_task
 def update_genres_task():
     call_command('update_tmdb_genres')
+
+
+@shared_task
+def sync_movies_task():
+    call_command('sync_tmdb_movies')
+
+
+@shared_task
+def refresh_movie_details_task(movie_id):
+    """
+    Refresh a stale movie details cache entry from TMDb.
+    """
+    store(f"movie_{movie_id}", fetch_movie_details(movie_id))
+
+
+@shared_task
+def refresh_recommendations_task(genres, language, release_year, page=1):
+    """
+    Refresh a stale (or prefetch a missing) recommendations page cache entry from TMDb.
+    """
+    preferences = RecommendationPreferences(tuple(genres), language, release_year)
+    store(preferences.cache_key(page), fetch_movie_recommendations(genres, language, release_year, page))
+
+
+@shared_task
+def drain_ratings_task():
+    """
+    Save ratings buffered in write-behind mode (see ``RATINGS_WRITE_BEHIND``).
+    """
+    return drain()
+
+
+@shared_task
+def build_recommender_task(force=False):
+    """
+    Rebuild the item-item neighbor table used for personalized recommendations.
+    Skipped when no rating changed since the last build, so it can run often.
+    """
+    return build(force=force)
+
+
+@shared_task
+def build_embeddings_task():
+    """
+    Rebuild the movie embeddings used for similar-movie lookups.
+    """
+    return embeddings.build()
+
+
+@shared_task
+def precompute_recommendations_task():
+    """
+    Fetch the recommendations of the most requested preferences ahead of time.
+    """
+    return precompute()
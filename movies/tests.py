@@ -1,3 +1,1555 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import logging
+import queue
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import msgpack
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from benchmarks.tmdb_stub import StubTMDbServer, movie_details
+from benchmarks.utils import percentile
+from movieapp.logging_handlers import (
+    BatchingFileHandler, BatchingQueueListener, DeferredFormattingQueueHandler, RateLimitFilter, SamplingFilter,
+)
+
+from . import embeddings, genre_index, recommender
+from .caching import HIT, MISS, STALE, acached_fetch, cached_fetch, store
+from .models import Genre, Movie, MovieRating, MovieRatingStats, SyncCheckpoint
+from .pagination import recommendations_page, tmdb_pages
+from .precompute import popular_preferences, precompute, precompute_report, record_request
+from .preferences import RecommendationPreferences
+from .ratings import upsert_ratings
+from .records import MovieRecord, parse_fields
+from .resilience import REDIS_RETRY_INTERVAL, CircuitBreaker, LocalTokenBucket, RateLimiter, TMDbUnavailable
+from .serializers import MovieSerializer
+from .services import MovieRecommendationError, fetch_movie_details
+from .singleflight import afetch_once, fetch_once
+from .tasks import refresh_movie_details_task
+from .tiered_cache import LocalCache, TieredCache, tiered_cache
+from .tmdb import AsyncTMDbClient, TMDbClient, get_tmdb_client
+
+try:
+    import fakeredis
+except ImportError:  # Only needed by the rating buffer tests
+    fakeredis = None
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def fake_redis_caches():
+    return {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://fakeredis:6379/0',
+            'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection}},
+        }
+    }
+
+
+def start_stub(test, **kwargs):
+    """
+    Serve a fake TMDb for the test, as ``TMDB_API_URL`` of fresh shared clients,
+    with TMDb backpressure reset: no rate limit and a closed breaker.
+
+    :return: The running ``StubTMDbServer``
+    """
+    stub = StubTMDbServer(latency=0, **kwargs)
+    stub.start()
+    test.addCleanup(stub.stop)
+    settings_override = override_settings(TMDB_API_URL=stub.base_url, TMDB_RETRY_BACKOFF=0)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    for name, value in [
+        ('tmdb_rate_limiter', RateLimiter(0, 1, 2)), ('tmdb_breaker', CircuitBreaker(5, 30)), ('_client', None),
+    ]:
+        patcher = mock.patch(f'movies.tmdb.{name}', value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return stub
+
+
+def stats_of(movie_id):
+    return MovieRatingStats.objects.filter(movie_id=movie_id).values('count', 'rating_sum', 'mean', 'histogram').first()
+
+
+class UpsertRatingsTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def test_rerating_replaces_the_rating(self):
+        upsert_ratings([{'user': self.alice, 'movie_id': 1, 'rating': 3.0}])
+        upsert_ratings([{'user': self.alice, 'movie_id': 1, 'rating': 5.0}])
+
+        self.assertEqual(list(MovieRating.objects.values_list('movie_id', 'rating')), [(1, 5.0)])
+        self.assertEqual(stats_of(1), {'count': 1, 'rating_sum': 5.0, 'mean': 5.0, 'histogram': {'5': 1}})
+
+    def test_later_row_for_the_same_movie_wins_within_a_batch(self):
+        upsert_ratings([
+            {'user': self.alice, 'movie_id': 1, 'rating': 2.0},
+            {'user': self.bob, 'movie_id': 1, 'rating': 3.5},
+            {'user': self.alice, 'movie_id': 1, 'rating': 4.0},
+        ])
+
+        self.assertEqual(MovieRating.objects.filter(user=self.alice).get().rating, 4.0)
+        self.assertEqual(stats_of(1), {'count': 2, 'rating_sum': 7.5, 'mean': 3.75, 'histogram': {'3': 1, '4': 1}})
+
+    def test_deletes_update_the_stats(self):
+        upsert_ratings([
+            {'user': user, 'movie_id': movie_id, 'rating': 4.0}
+            for user in (self.alice, self.bob) for movie_id in (1, 2)
+        ])
+
+        MovieRating.objects.filter(user=self.bob, movie_id=1).delete()
+        self.assertEqual(stats_of(1), {'count': 1, 'rating_sum': 4.0, 'mean': 4.0, 'histogram': {'4': 1}})
+
+        self.alice.delete()
+        self.assertEqual(stats_of(1), {'count': 0, 'rating_sum': 0.0, 'mean': 0.0, 'histogram': {}})
+        self.assertEqual(stats_of(2), {'count': 1, 'rating_sum': 4.0, 'mean': 4.0, 'histogram': {'4': 1}})
+
+    def test_save_create_and_update_update_the_stats(self):
+        rating = MovieRating.objects.create(user=self.alice, movie_id=1, rating=3.0)
+        self.assertEqual(stats_of(1), {'count': 1, 'rating_sum': 3.0, 'mean': 3.0, 'histogram': {'3': 1}})
+
+        rating.movie_id, rating.rating = 2, 5.0
+        rating.save()
+        self.assertEqual(stats_of(1), {'count': 0, 'rating_sum': 0.0, 'mean': 0.0, 'histogram': {}})
+        self.assertEqual(stats_of(2), {'count': 1, 'rating_sum': 5.0, 'mean': 5.0, 'histogram': {'5': 1}})
+
+        upsert_ratings([{'user': self.bob, 'movie_id': 2, 'rating': 1.0}])
+        self.assertEqual(MovieRating.objects.filter(movie_id=2).update(rating=F('rating') + 1), 2)
+        self.assertEqual(stats_of(2), {'count': 2, 'rating_sum': 8.0, 'mean': 4.0, 'histogram': {'2': 1, '6': 1}})
+
+    def test_admin_edits_update_the_stats(self):
+        admin_user = User.objects.create_superuser('admin', password='secret')
+        rating = MovieRating.objects.create(user=self.alice, movie_id=1, rating=3.0)
+        client = APIClient()
+        client.force_login(admin_user)
+
+        response = client.post(
+            reverse('admin:movies_movierating_change', args=[rating.pk]),
+            {'movie_id': 1, 'rating': 4.5, 'created_at_0': '2024-01-01', 'created_at_1': '00:00:00', 'user': self.alice.pk},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(stats_of(1), {'count': 1, 'rating_sum': 4.5, 'mean': 4.5, 'histogram': {'4': 1}})
+
+    def test_ratings_outside_the_scale_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+
+        for rating in (-1e9, 0, 10.5):
+            response = client.post(reverse('ratings'), {'movie_id': 1, 'rating': rating}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('rating', response.json())
+        self.assertFalse(MovieRating.objects.exists())
+
+
+class CollapseDuplicateRatingsMigrationTests(TransactionTestCase):
+    """
+    0009-0011: duplicate ratings of a movie by a user are collapsed to the
+    latest one, with the stats recomputed, before the unique constraint is added.
+    """
+    migrate_from = [('movies', '0009_movierating_idempotency_key')]
+    migrate_to = [('movies', '0011_movierating_unique_user_movie')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()  # Reload, as the executor above changed the applied migrations
+        executor.migrate(self.migrate_to)
+
+    def test_keeps_the_latest_rating_and_recomputes_stats(self):
+        User = self.apps.get_model('auth', 'User')
+        MovieRating = self.apps.get_model('movies', 'MovieRating')
+        MovieRatingStats = self.apps.get_model('movies', 'MovieRatingStats')
+        alice, bob = User.objects.create(username='alice'), User.objects.create(username='bob')
+        now = timezone.now()
+        MovieRating.objects.bulk_create([
+            MovieRating(user=alice, movie_id=1, rating=2.0, created_at=now - timezone.timedelta(days=2)),
+            MovieRating(user=alice, movie_id=1, rating=5.0, created_at=now),
+            MovieRating(user=alice, movie_id=1, rating=3.0, created_at=now - timezone.timedelta(days=1)),
+            MovieRating(user=bob, movie_id=1, rating=4.0, created_at=now),
+            MovieRating(user=bob, movie_id=2, rating=1.0, created_at=now),
+        ])
+        # As the per-row stats updates left them: counting every duplicate
+        MovieRatingStats.objects.create(movie_id=1, count=4, rating_sum=14.0, mean=3.5,
+                                        histogram={'2': 1, '3': 1, '4': 1, '5': 1})
+
+        self.migrate()
+
+        self.assertEqual(
+            sorted(MovieRating.objects.values_list('user__username', 'movie_id', 'rating')),
+            [('alice', 1, 5.0), ('bob', 1, 4.0), ('bob', 2, 1.0)],
+        )
+        self.assertEqual(stats_of(1), {'count': 2, 'rating_sum': 9.0, 'mean': 4.5, 'histogram': {'4': 1, '5': 1}})
+        with self.assertRaises(IntegrityError):
+            MovieRating.objects.create(user_id=User.objects.get(username='bob').pk, movie_id=2, rating=2.0)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_retry_returns_the_saved_rating(self):
+        data = {'movie_id': 1, 'rating': 4.0, 'idempotency_key': 'k1'}
+        first = self.client.post(reverse('ratings'), data, format='json')
+        retry = self.client.post(reverse('ratings'), {**data, 'rating': 2.0}, format='json')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry.data['rating'], 4.0)
+        self.assertEqual(MovieRating.objects.count(), 1)
+
+    def test_keys_are_unique_per_user(self):
+        bob = User.objects.create_user('bob')
+        self.client.post(reverse('ratings'), {'movie_id': 1, 'rating': 4.0, 'idempotency_key': 'k1'}, format='json')
+        self.client.force_authenticate(bob)
+        response = self.client.post(reverse('ratings'), {'movie_id': 1, 'rating': 3.0, 'idempotency_key': 'k1'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MovieRating.objects.filter(idempotency_key='k1').count(), 2)
+
+    def test_database_rejects_a_reused_key(self):
+        MovieRating.objects.create(user=self.alice, movie_id=1, rating=4.0, idempotency_key='k1')
+        with self.assertRaises(IntegrityError):
+            MovieRating.objects.create(user=self.alice, movie_id=2, rating=4.0, idempotency_key='k1')
+
+    def test_batch_rejects_a_key_given_to_two_movies(self):
+        response = self.client.post(reverse('ratings_batch'), [
+            {'movie_id': 1, 'rating': 4.0, 'idempotency_key': 'k1'},
+            {'movie_id': 2, 'rating': 3.0, 'idempotency_key': 'k1'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), [1])
+        self.assertIn('idempotency_key', response.data[1])
+        self.assertFalse(MovieRating.objects.exists())
+
+    def test_batch_rejects_a_key_saved_for_another_movie(self):
+        MovieRating.objects.create(user=self.alice, movie_id=1, rating=4.0, idempotency_key='k1')
+        response = self.client.post(reverse('ratings_batch'), [
+            {'movie_id': 1, 'rating': 5.0, 'idempotency_key': 'k1'},  # Re-rating with its own key is fine
+            {'movie_id': 2, 'rating': 3.0, 'idempotency_key': 'k1'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), [1])
+
+    def test_import_reports_conflicting_keys(self):
+        MovieRating.objects.create(user=self.alice, movie_id=1, rating=4.0, idempotency_key='k1')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'ratings.jsonl'
+        path.write_text(''.join(json.dumps(row) + '\n' for row in [
+            {'movie_id': 2, 'rating': 3.0, 'idempotency_key': 'k1'},
+            {'movie_id': 3, 'rating': 3.0, 'idempotency_key': 'k2'},
+            {'movie_id': 4, 'rating': 3.0, 'idempotency_key': 'k2'},
+            {'movie_id': 5, 'rating': 'bad'},
+            {'movie_id': 6, 'rating': 2.0},
+        ]))
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_ratings', str(path), user='alice', stdout=stdout, stderr=stderr)
+
+        self.assertEqual(sorted(MovieRating.objects.values_list('movie_id', flat=True)), [1, 3, 6])
+        self.assertIn("Imported 2 ratings, rejected 3", stdout.getvalue())
+        self.assertEqual([line.split(':')[0] for line in stderr.getvalue().splitlines()], ['Line 4', 'Line 1', 'Line 3'])
+
+
+class ImportRatingsTests(TestCase):
+    def import_file(self, name, content, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / name
+        path.write_text(content)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_ratings', str(path), stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_users_are_loaded_once_per_chunk(self):
+        users = [User.objects.create_user(f'user{index}') for index in range(5)]
+        rows = [f"{users[index % 5].pk},{index + 1},4.5" for index in range(40)] + ["999,41,4.5", "x,42,4.5"]
+
+        with CaptureQueriesContext(connection) as queries:
+            stdout, stderr = self.import_file('ratings.csv', "user,movie_id,rating\n" + "\n".join(rows) + "\n", chunk_size=20)
+
+        user_queries = [query for query in queries if 'FROM "auth_user"' in query['sql']]
+        # One per chunk, plus one for the unknown user (which the serializer looks up to report it)
+        self.assertEqual(len(user_queries), 4)
+        self.assertIn("Imported 40 ratings, rejected 2", stdout)
+        self.assertEqual([line.split(':')[0] for line in stderr.splitlines()], ['Line 42', 'Line 43'])
+        self.assertEqual(MovieRating.objects.filter(user=users[0]).count(), 8)
+
+    def test_jsonl_import_for_one_user(self):
+        alice = User.objects.create_user('alice')
+        rows = [
+            '{"movie_id": 1, "rating": 4}', 'not json', '{"movie_id": 2, "rating": 11}',
+            '', '{"movie_id": 3, "rating": 2.5, "idempotency_key": "k"}', '{"movie_id": 1, "rating": 5}',
+        ]
+        stdout, stderr = self.import_file('ratings.jsonl', "\n".join(rows) + "\n", user='alice')
+
+        self.assertIn("Imported 2 ratings, rejected 2", stdout)  # The later rating of movie 1 replaced the first
+        self.assertEqual([line.split(':')[0] for line in stderr.splitlines()], ['Line 2', 'Line 3'])
+        self.assertEqual(dict(MovieRating.objects.filter(user=alice).values_list('movie_id', 'rating')), {1: 5, 3: 2.5})
+        self.assertEqual(stats_of(1)['count'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+        self.client = APIClient()
+
+    def get(self, url, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(url, params, headers=headers)
+
+    def test_mirrored_movie(self):
+        Movie.objects.create(tmdb_id=10, title="Alien")
+        url = reverse('movie_detail', args=[10])
+        response = self.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(self.get(url, response['ETag']).status_code, 304)
+        # Another fieldset is another representation
+        self.assertEqual(self.get(url, response['ETag'], fields='title').status_code, 200)
+
+        Movie.objects.get(tmdb_id=10).save()  # Synced again
+        self.assertEqual(self.get(url, response['ETag']).status_code, 200)
+
+    @mock.patch('movies.views.fetch_movie_details')
+    def test_cached_movie(self, fetch_movie_details):
+        fetch_movie_details.return_value = {'id': 11, 'title': "Heat"}
+        url = reverse('movie_detail', args=[11])
+        response = self.get(url)
+        not_modified = self.get(url, response['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], "Heat")
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(fetch_movie_details.call_count, 1)
+        self.assertEqual(self.get(url, 'W/"other"').status_code, 200)
+
+    @mock.patch('movies.views.refresh_recommendations_task')
+    @mock.patch('movies.views.fetch_movie_recommendations')
+    def test_recommendations(self, fetch_movie_recommendations, refresh_recommendations_task):
+        Genre.objects.create(name="Action", tmdb_id=28)
+        genre_index._reset()
+        fetch_movie_recommendations.return_value = {'results': [{'id': 1}, {'id': 2}], 'total_results': 2}
+        self.client.force_authenticate(User.objects.create_user('alice'))
+        url = reverse('recommendations')
+        params = {'genres': 'Action', 'release_year': 2020, 'language': 'en'}
+        response = self.get(url, **params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['id'] for movie in response.data['results']], [1, 2])
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')  # Authenticated: not for shared caches
+        not_modified = self.get(url, response['ETag'], **params)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['Cache-Control'], 'private, max-age=60')
+        self.assertEqual(self.get(url, response['ETag'], **params, page_size=1).status_code, 200)
+        self.assertEqual(fetch_movie_recommendations.call_count, 1)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RatingBufferTests(TestCase):
+    def setUp(self):
+        settings_override = override_settings(
+            CACHES=fake_redis_caches(), RATINGS_STREAM_CLAIM_IDLE=0, RATINGS_STREAM_MAX_DELIVERIES=3,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.redis.flushall()
+        self.alice = User.objects.create_user('alice')
+
+    def enqueue(self, **fields):
+        from .rating_buffer import enqueue_rating
+        return enqueue_rating({'movie_id': 1, 'rating': 4.0, **fields}, self.alice)
+
+    def drain(self):
+        from .rating_buffer import drain
+        return drain()
+
+    def dead_letters(self):
+        return self.redis.xrange('movies:ratings:dead')
+
+    def test_drain_saves_and_removes_entries(self):
+        self.enqueue(movie_id=1)
+        self.enqueue(movie_id=2, rating=3.0)
+
+        self.assertEqual(self.drain(), 2)
+        self.assertEqual(sorted(MovieRating.objects.values_list('movie_id', 'rating')), [(1, 4.0), (2, 3.0)])
+        self.assertEqual(stats_of(2)['count'], 1)
+        self.assertEqual(self.redis.xlen('movies:ratings'), 0)
+
+    def test_redelivered_entry_is_saved_once(self):
+        self.enqueue(idempotency_key='k1')
+        self.drain()
+        self.enqueue(idempotency_key='k1', rating=1.0)
+
+        self.assertEqual(self.drain(), 0)
+        self.assertEqual(MovieRating.objects.get().rating, 4.0)
+
+    def test_failing_row_does_not_block_the_others(self):
+        self.enqueue(movie_id=1, rating=None)  # Cannot be saved
+        self.enqueue(movie_id=2)
+
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(list(MovieRating.objects.values_list('movie_id', flat=True)), [2])
+        # Retried until its last delivery, then moved to the dead-letter stream
+        self.assertEqual(self.redis.xlen('movies:ratings'), 1)
+        self.drain()
+        self.drain()
+        self.assertEqual(self.redis.xlen('movies:ratings'), 0)
+        [(_, fields)] = self.dead_letters()
+        self.assertEqual(json.loads(fields[b'rating'])['movie_id'], 1)
+        self.assertIn(b'error', fields)
+
+    def test_malformed_and_orphaned_entries_are_removed(self):
+        self.redis.xadd('movies:ratings', {'rating': 'not json'})
+        bob = User.objects.create_user('bob')
+        from .rating_buffer import enqueue_rating
+        enqueue_rating({'movie_id': 1, 'rating': 4.0}, bob)
+        bob.delete()
+        self.enqueue(movie_id=2)
+
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(self.redis.xlen('movies:ratings'), 0)
+        self.assertEqual(len(self.dead_letters()), 1)
+
+
+class TMDbClientTests(SimpleTestCase):
+    def test_service_calls_share_one_keep_alive_connection(self):
+        stub = start_stub(self)
+
+        for movie_id in range(1, 6):
+            self.assertEqual(fetch_movie_details(movie_id)['id'], movie_id)
+        self.assertIs(get_tmdb_client(), get_tmdb_client())
+        self.assertEqual(stub.connections_opened, 1)
+
+    def test_client_is_rebuilt_after_a_fork(self):
+        start_stub(self)
+        client = get_tmdb_client()
+
+        with mock.patch('movies.tmdb.os.getpid', return_value=-1):
+            self.assertIsNot(get_tmdb_client(), client)
+
+    def test_errors_are_retried(self):
+        stub = start_stub(self, error_rate=0.5, error_status=503, seed=7)  # Fails the first two requests
+
+        self.assertEqual(get_tmdb_client().get_json('movie/1')['id'], 1)
+        self.assertEqual(stub.errors_injected, 2)
+
+    def test_client_errors_are_not_retried(self):
+        stub = start_stub(self)
+
+        with self.assertRaises(MovieRecommendationError):
+            fetch_movie_details('unknown')
+        self.assertEqual(stub.requests_served, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecommendationPreferencesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Genre.objects.create(tmdb_id=28, name="Action")
+        Genre.objects.create(tmdb_id=12, name="Adventure", translations={'fr': "Aventure"})
+        genre_index._reset()
+        self.addCleanup(genre_index._reset)
+
+    def test_equivalent_requests_share_a_cache_key(self):
+        requests = [
+            {'genres': ["Action", "Adventure"], 'language': "en-US", 'release_year': 2020},
+            {'release_year': "2020", 'genres': ["adventure", " ACTION "], 'language': "en_us"},
+            {'genres': ["28", "Aventure", "12"], 'language': "EN-us", 'release_year': 2020, 'title': "ignored"},
+        ]
+        preferences = [RecommendationPreferences.from_request_data(data) for data in requests]
+
+        self.assertEqual(preferences[0], RecommendationPreferences((12, 28), "en-US", 2020))
+        self.assertEqual({p.cache_key() for p in preferences}, {preferences[0].cache_key()})
+        self.assertNotEqual(preferences[0].cache_key(2), preferences[0].cache_key())
+        self.assertRegex(preferences[0].cache_key(), r'^recommendations:v\d+:[0-9a-f]{32}:1$')
+
+    def test_unknown_genres_are_rejected(self):
+        for genres in (["Western"], []):
+            with self.assertRaises(ValidationError) as raised:
+                RecommendationPreferences.from_request_data({'genres': genres, 'language': "en", 'release_year': 2020})
+            self.assertIn('genres', raised.exception.detail)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+
+    def test_miss_is_fetched_once_then_served_from_cache(self):
+        fetch, refresh = mock.Mock(return_value={'id': 1}), mock.Mock()
+
+        self.assertEqual(cached_fetch('movie_1', fetch, refresh), ({'id': 1}, MISS))
+        self.assertEqual(cached_fetch('movie_1', fetch, refresh), ({'id': 1}, HIT))
+        fetch.assert_called_once()
+        refresh.assert_not_called()
+
+    def test_stale_entry_is_served_while_one_refresh_is_scheduled(self):
+        store('movie_1', {'id': 1, 'title': "Old"}, soft_timeout=-1)  # Already stale
+        fetch, refresh = mock.Mock(), mock.Mock()
+
+        self.assertEqual(cached_fetch('movie_1', fetch, refresh), ({'id': 1, 'title': "Old"}, STALE))
+        self.assertEqual(asyncio.run(acached_fetch('movie_1', fetch, refresh)), ({'id': 1, 'title': "Old"}, STALE))
+        fetch.assert_not_called()
+        refresh.assert_called_once()  # The second request finds it scheduled
+
+    def test_stale_entry_is_served_when_the_refresh_cannot_be_scheduled(self):
+        store('movie_1', {'id': 1}, soft_timeout=-1)
+        refresh = mock.Mock(side_effect=ConnectionError("Broker down"))
+
+        self.assertEqual(cached_fetch('movie_1', mock.Mock(), refresh), ({'id': 1}, STALE))
+
+    def test_refresh_task_stores_a_fresh_entry(self):
+        start_stub(self)
+        store('movie_5', {'id': 5, 'title': "Old"}, soft_timeout=-1)
+
+        refresh_movie_details_task(5)
+        value, state = cached_fetch('movie_5', mock.Mock(), mock.Mock())
+        self.assertEqual((value['title'], state), ("Movie 5", HIT))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+        self.stub = start_stub(self)
+
+    async def test_movie_details(self):
+        url = reverse('async_movie_detail', args=[5])
+        response = await self.async_client.get(url)
+        cached = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], "Movie 5")
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.stub.requests_served, 1)
+
+    @mock.patch('movies.views.refresh_recommendations_task')
+    async def test_recommendations(self, refresh_recommendations_task):
+        user = await User.objects.acreate(username='alice')
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        url = reverse('async_recommendations')
+        params = {'genres': '28', 'language': 'en', 'release_year': 2020}
+
+        self.assertEqual((await self.async_client.get(url, params)).status_code, 401)
+        response = await self.async_client.get(url, params, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), settings.RECOMMENDATIONS_PAGE_SIZE)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+        refresh_recommendations_task.delay.assert_called_once()  # Prefetch of the next page
+
+    def test_client_spreads_requests_over_small_pools(self):
+        self.stub.latency = 0.05
+
+        async def get_all():
+            client = AsyncTMDbClient(self.stub.base_url, 'key', pool_size=6, shard_size=2)
+            try:
+                responses = await asyncio.gather(*(client.get_json(f'movie/{movie_id}') for movie_id in range(1, 13)))
+            finally:
+                await client.aclose()
+            return len(client.clients), [response['id'] for response in responses]
+
+        self.assertEqual(asyncio.run(get_all()), (3, list(range(1, 13))))
+        self.assertEqual(self.stub.connections_opened, 6)  # Two per pool, reused once the first requests finish
+
+
+class TMDbRetryTests(SimpleTestCase):
+    def test_short_retry_after_is_waited_for(self):
+        stub = start_stub(self, error_rate=1.0, error_status=429, retry_after=0)
+        client = TMDbClient(stub.base_url, 'key', max_retries=2)
+
+        with self.assertRaises(requests.HTTPError):
+            client.get('movie/1')
+        self.assertEqual(stub.errors_injected, 3)
+
+    def test_long_retry_after_fails_at_once(self):
+        stub = start_stub(self, error_rate=1.0, error_status=429, retry_after=30)
+        client = TMDbClient(stub.base_url, 'key', max_retry_delay=2)
+
+        with self.assertRaises(TMDbUnavailable) as raised:
+            client.get('movie/1')
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertEqual(stub.errors_injected, 1)
+
+    def test_long_retry_after_fails_at_once_async(self):
+        stub = start_stub(self, error_rate=1.0, error_status=503, retry_after=30)
+
+        async def get():
+            client = AsyncTMDbClient(stub.base_url, 'key', max_retry_delay=2)
+            try:
+                await client.get('movie/1')
+            finally:
+                await client.aclose()
+
+        with self.assertRaises(TMDbUnavailable):
+            asyncio.run(get())
+        self.assertEqual(stub.errors_injected, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+
+    def test_waiters_fetch_themselves_when_the_caller_fetching_is_cancelled(self):
+        fetches = []
+
+        async def afetch():
+            fetches.append(1)
+            await asyncio.sleep(0.1 if len(fetches) == 1 else 0)
+            return {'fetch': len(fetches)}
+
+        async def run():
+            leader = asyncio.create_task(afetch_once('movie_1', afetch, 60))
+            await asyncio.sleep(0.01)
+            waiters = [asyncio.create_task(afetch_once('movie_1', afetch, 60)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(*waiters)
+
+        self.assertEqual(asyncio.run(run()), [{'fetch': 2}] * 3)
+        self.assertEqual(len(fetches), 2)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        fetches = []
+        started = threading.Event()
+
+        def fetch():
+            fetches.append(1)
+            started.set()
+            time.sleep(0.1)
+            return {'id': 1}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            leader = executor.submit(fetch_once, 'movie_1', fetch, 60)
+            started.wait()
+            waiters = [executor.submit(fetch_once, 'movie_1', fetch, 60) for _ in range(4)]
+            results = [future.result() for future in [leader, *waiters]]
+
+        self.assertEqual(results, [{'id': 1}] * 5)
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(cache.get('movie_1'), {'id': 1})
+
+    def test_concurrent_async_callers_share_one_fetch_and_its_error(self):
+        fetches = []
+
+        async def afetch():
+            fetches.append(1)
+            await asyncio.sleep(0.05)
+            raise ValueError("TMDb is down")
+
+        async def run():
+            return await asyncio.gather(*(afetch_once('movie_1', afetch, 60) for _ in range(5)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual([type(result) for result in results], [ValueError] * 5)
+        self.assertEqual(len(fetches), 1)
+        self.assertIsNone(cache.get('lock:movie_1'))  # Released despite the error
+
+    def test_waits_for_another_process_holding_the_lock(self):
+        cache.add('lock:movie_1', 'other-process', timeout=60)
+        threading.Timer(0.1, cache.set, args=('movie_1', {'id': 1})).start()
+        fetch = mock.Mock()
+
+        self.assertEqual(fetch_once('movie_1', fetch, 60), {'id': 1})
+        fetch.assert_not_called()
+
+    @override_settings(SINGLEFLIGHT_LOCK_LEASE=0.2)
+    def test_fetches_anyway_when_the_lease_runs_out(self):
+        cache.add('lock:movie_1', 'crashed-process', timeout=60)
+
+        self.assertEqual(fetch_once('movie_1', lambda: {'id': 1}, 60), {'id': 1})
+        self.assertEqual(cache.get('lock:movie_1'), 'crashed-process')  # Not ours to release
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.settings_override = override_settings(CACHES=fake_redis_caches())
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.clear()
+        tiered_cache.local.clear()
+        self.addCleanup(tiered_cache.local.clear)
+
+    def test_redis_hits_are_sized_by_their_payload_without_serializing(self):
+        value = {'results': [{'id': movie_id, 'overview': 'A story. ' * 50} for movie_id in range(20)]}
+        cache.set('movie_1', value)
+        payload = cache.client.get_client().get(cache.make_key('movie_1'))
+
+        with mock.patch('movies.tiered_cache.pickle.dumps') as dumps, \
+                mock.patch.object(cache.client, 'encode') as encode:
+            self.assertEqual(tiered_cache.get('movie_1'), value)
+        dumps.assert_not_called()
+        encode.assert_not_called()
+        self.assertEqual(tiered_cache.local.size, len(payload))
+
+        tiered_cache.set('movie_1', value, timeout=60)
+        self.assertEqual(tiered_cache.local.size, len(payload))
+
+    def test_writes_invalidate_other_workers_local_copies(self):
+        other_worker = TieredCache(max_bytes=1024 * 1024, timeout=60)
+        cache.set('movie_1', {'title': "Old"})
+        self.assertEqual(other_worker.get('movie_1'), {'title': "Old"})  # Now in its local tier; starts its listener
+
+        deadline = time.monotonic() + 5
+        while other_worker.local.get('movie_1') is not None and time.monotonic() < deadline:
+            tiered_cache.set('movie_1', {'title': "New"}, timeout=60)  # Until the listener is subscribed
+            time.sleep(0.05)
+        self.assertEqual(other_worker.get('movie_1'), {'title': "New"})
+        self.assertEqual(tiered_cache.local.get('movie_1'), {'title': "New"})  # Its own write is kept
+
+
+class LocalCacheTests(SimpleTestCase):
+    def test_least_recently_used_entries_are_evicted_past_the_size_cap(self):
+        local = LocalCache(max_bytes=100, timeout=60)
+        local.set('a', 'A', 40)
+        local.set('b', 'B', 40)
+        local.get('a')
+        local.set('c', 'C', 40)
+
+        self.assertEqual([local.get(key) for key in 'abc'], ['A', None, 'C'])
+        self.assertEqual(local.size, 80)
+        local.set('d', 'D', 101)  # Larger than the whole tier
+        self.assertIsNone(local.get('d'))
+
+    def test_entries_expire(self):
+        local = LocalCache(max_bytes=100, timeout=-1)
+        local.set('a', 'A', 10)
+
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(local.size, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MovieBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+        self.client = APIClient()
+        self.url = reverse('movie_batch')
+
+    def test_mirrored_cached_and_fetched_movies_in_request_order(self):
+        stub = start_stub(self)
+        Movie.objects.create(tmdb_id=2, title="Alien")
+        response = self.client.post(self.url, {'ids': [3, 2, 1, 3]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.data['results']], [3, 2, 1])
+        self.assertEqual(
+            [result['data']['title'] for result in response.data['results']], ["Movie 3", "Alien", "Movie 1"],
+        )
+        self.assertEqual(stub.requests_served, 2)  # Duplicates and mirrored movies are not fetched
+
+        self.client.post(self.url, {'ids': [1, 3]}, format='json')
+        self.assertEqual(stub.requests_served, 2)  # Served from the cache
+
+    def test_failed_fetches_do_not_fail_the_batch(self):
+        start_stub(self, error_rate=1.0, error_status=404)
+        Movie.objects.create(tmdb_id=2, title="Alien")
+        response = self.client.post(self.url, {'ids': [1, 2]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('error', response.data['results'][0])
+        self.assertEqual(response.data['results'][1]['data']['title'], "Alien")
+
+    def test_invalid_batches_are_rejected(self):
+        for ids in ([], [0], list(range(1, settings.MOVIE_BATCH_MAX_IDS + 2))):
+            self.assertEqual(self.client.post(self.url, {'ids': ids}, format='json').status_code, 400)
+
+
+class SyncTMDbMoviesTests(TestCase):
+    def setUp(self):
+        self.stub = start_stub(self)
+        self.today = timezone.now().date()
+
+    def changed_ids(self, start, end):
+        ids = []
+        for page in range(1, 100):
+            data = self.stub.changes({'start_date': start.isoformat(), 'end_date': end.isoformat(), 'page': page})
+            ids.extend(change['id'] for change in data['results'])
+            if page >= data['total_pages']:
+                return set(ids)
+
+    def sync(self, *args):
+        call_command('sync_tmdb_movies', *args, stdout=StringIO())
+
+    def test_first_sync_mirrors_the_changes_since_yesterday(self):
+        yesterday = self.today - datetime.timedelta(days=1)
+        self.sync()
+
+        self.assertEqual(set(Movie.objects.values_list('tmdb_id', flat=True)), self.changed_ids(yesterday, self.today))
+        movie = Movie.objects.order_by('tmdb_id').first()
+        self.assertEqual(movie.title, f"Movie {movie.tmdb_id}")
+        self.assertEqual(len(movie.genres), 2)
+        checkpoint = SyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.synced_until, checkpoint.page), (self.today, 0))
+
+    def test_next_sync_only_fetches_changes_since_the_checkpoint(self):
+        SyncCheckpoint.objects.create(name='tmdb_movies', synced_until=self.today)
+        changed = self.changed_ids(self.today, self.today)
+        self.sync()
+        requests_served = self.stub.requests_served
+        synced_at = dict(Movie.objects.values_list('tmdb_id', 'synced_at'))
+        self.sync()
+
+        self.assertEqual(set(synced_at), changed)
+        self.assertEqual(self.stub.requests_served, 2 * requests_served)  # The same day's changes, again
+        self.assertEqual(Movie.objects.count(), len(changed))
+        self.assertTrue(all(
+            synced_at[tmdb_id] < synced for tmdb_id, synced in Movie.objects.values_list('tmdb_id', 'synced_at')
+        ))
+
+    def test_movies_gone_from_tmdb_are_deleted(self):
+        gone = min(self.changed_ids(self.today, self.today))
+        Movie.objects.create(tmdb_id=gone, title="Removed")
+        SyncCheckpoint.objects.create(name='tmdb_movies', synced_until=self.today)
+        route = self.stub.route
+        self.stub.route = lambda path, params: (404, {}) if path == f'/movie/{gone}' else route(path, params)
+        self.sync()
+
+        self.assertFalse(Movie.objects.filter(tmdb_id=gone).exists())
+        self.assertTrue(Movie.objects.exists())
+
+    def test_interrupted_sync_resumes_after_the_last_applied_page(self):
+        SyncCheckpoint.objects.create(name='tmdb_movies', synced_until=self.today - datetime.timedelta(days=1), page=1)
+        self.sync()
+
+        first_page = self.stub.changes({
+            'start_date': (self.today - datetime.timedelta(days=1)).isoformat(), 'end_date': self.today.isoformat(),
+        })
+        self.assertFalse(Movie.objects.filter(tmdb_id__in=[change['id'] for change in first_page['results']]).exists())
+        self.assertTrue(Movie.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_GENRE_LANGUAGES=['en', 'fr'])
+class UpdateTMDbGenresTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        start_stub(self)
+        self.addCleanup(genre_index._reset)
+
+    def update_genres(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('update_tmdb_genres', stdout=out)
+        writes = [query['sql'] for query in queries if not query['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        return out.getvalue(), writes
+
+    def test_genres_are_upserted_in_one_statement(self):
+        output, writes = self.update_genres()
+
+        self.assertIn("19 inserted, 0 updated, 0 unchanged", output)
+        self.assertEqual(len(writes), 1)
+        genre = Genre.objects.get(tmdb_id=878)
+        self.assertEqual((genre.name, genre.translations), ("Science Fiction", {'fr': "Science Fiction"}))
+
+    def test_only_changed_genres_are_written(self):
+        self.update_genres()
+        Genre.objects.filter(tmdb_id=28).update(name="Action!")
+        version = cache.get(genre_index.VERSION_KEY)
+
+        output, writes = self.update_genres()
+        self.assertIn("0 inserted, 1 updated, 18 unchanged", output)
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(Genre.objects.get(tmdb_id=28).name, "Action")
+        self.assertEqual(cache.get(genre_index.VERSION_KEY), version + 1)
+
+        output, writes = self.update_genres()
+        self.assertIn("0 inserted, 0 updated, 19 unchanged", output)
+        self.assertEqual(writes, [])
+        self.assertEqual(cache.get(genre_index.VERSION_KEY), version + 1)  # Nothing changed: indexes are kept
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GenreIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Genre.objects.create(tmdb_id=35, name="Comedy", translations={'fr': "Comédie", 'de': "Komödie"})
+        Genre.objects.create(tmdb_id=18, name="Drama", translations={'fr': "Drame", 'es': "Comedy"})
+        genre_index._reset()
+        self.addCleanup(genre_index._reset)
+
+    def test_names_and_aliases_are_looked_up_without_queries(self):
+        genre_index.get_genre_index()
+
+        with self.assertNumQueries(0):
+            index = genre_index.get_genre_index()
+            self.assertEqual(index.get("  comédie "), 35)
+            self.assertEqual(index.get("COMEDY"), 35)  # Primary names win over another genre's alias
+            self.assertIsNone(index.get("Western"))
+            self.assertEqual(index.ids_for(["Drame", "Western", "drama", "Komödie"]), [18, 35])
+        with self.assertRaises(AttributeError):
+            index.version = 2
+
+    @mock.patch('movies.genre_index.VERSION_CHECK_INTERVAL', 0)
+    def test_index_is_reloaded_after_a_version_bump(self):
+        index = genre_index.get_genre_index()
+        Genre.objects.create(tmdb_id=27, name="Horror")
+
+        self.assertIs(genre_index.get_genre_index(), index)  # Unchanged version
+        genre_index.bump_version()
+        reloaded = genre_index.get_genre_index()
+        self.assertEqual(reloaded.version, index.version + 1)
+        self.assertEqual(reloaded.get("horror"), 27)
+
+    def test_index_is_reloaded_when_another_worker_bumps_the_version(self):
+        index = genre_index.get_genre_index()
+        cache.set(genre_index.VERSION_KEY, 5, timeout=None)  # As done by another worker
+
+        self.assertIs(genre_index.get_genre_index(), index)  # Until the next check
+        with mock.patch('movies.genre_index.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertEqual(genre_index.get_genre_index().version, 5)
+
+
+class RatingListTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        now = timezone.now()
+        MovieRating.objects.bulk_create(
+            [
+                MovieRating(user=self.alice, movie_id=movie_id, rating=4.0, created_at=now - datetime.timedelta(minutes=age))
+                for movie_id, age in [(1, 5), (2, 4), (3, 3), (4, 3), (5, 1)]  # 3 and 4 were rated at the same time
+            ]
+            + [MovieRating(user=User.objects.create_user('bob'), movie_id=6, rating=2.0, created_at=now)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_pages_follow_cursors_newest_first(self):
+        response = self.client.get(reverse('ratings'), {'page_size': 2})
+        movie_ids = [rating['movie_id'] for rating in response.data['results']]
+        MovieRating.objects.create(user=self.alice, movie_id=7, rating=3.0)  # Does not shift the next pages
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            movie_ids.extend(rating['movie_id'] for rating in response.data['results'])
+
+        self.assertEqual(movie_ids, [5, 4, 3, 2, 1])
+        self.assertNotIn('count', response.data)
+
+    def test_export_streams_all_ratings_as_ndjson(self):
+        response = self.client.get(reverse('ratings_export'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        listed = self.client.get(reverse('ratings')).data['results']
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([row['movie_id'] for row in rows], [5, 4, 3, 2, 1])
+        self.assertEqual(rows, [dict(rating) for rating in listed])  # Same fields and formats as the list
+
+    def test_ratings_require_authentication(self):
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get(reverse('ratings')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('ratings_export')).status_code, 401)
+
+
+class RatingBatchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.url = reverse('ratings_batch')
+
+    def test_batch_is_saved_in_bulk(self):
+        rows = [{'movie_id': movie_id, 'rating': 4.0} for movie_id in range(1, 51)]
+
+        with CaptureQueriesContext(connection) as single:
+            self.client.post(self.url, rows[:1], format='json')
+        with CaptureQueriesContext(connection) as batch:
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(len(batch), len(single))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 50})
+        self.assertEqual(MovieRating.objects.filter(user=self.alice).count(), 50)
+        self.assertEqual(stats_of(50)['count'], 1)
+
+    def test_invalid_rows_reject_the_whole_batch(self):
+        rows = [
+            {'movie_id': 1, 'rating': 4.0, 'idempotency_key': 'a'},
+            {'movie_id': 2, 'rating': 40},
+            {'movie_id': 3, 'rating': 4.0, 'idempotency_key': 'a'},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {1})
+        self.assertIn('rating', response.data[1])
+        del rows[1]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('idempotency_key', response.data[1])  # Key reused for another movie
+        self.assertFalse(MovieRating.objects.exists())
+
+    @override_settings(RATINGS_BATCH_MAX_ROWS=2)
+    def test_oversized_batches_are_rejected(self):
+        rows = [{'movie_id': movie_id, 'rating': 4.0} for movie_id in range(1, 4)]
+
+        self.assertEqual(self.client.post(self.url, rows, format='json').status_code, 400)
+
+
+class RecommenderTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(RECOMMENDER_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Users who like movie 1 like 2 and 4; who like 3 like 5
+        self.rate({1: 5, 2: 5, 3: 1}, {1: 4, 2: 5, 3: 2}, {1: 5, 2: 4, 3: 1, 4: 5}, {1: 1, 3: 5, 5: 5})
+        self.alice = self.rate({1: 5, 3: 1})[0]
+
+    def rate(self, *users):
+        created = []
+        for ratings in users:
+            user = User.objects.create_user(f'user{User.objects.count()}')
+            upsert_ratings([{'user': user, 'movie_id': movie_id, 'rating': rating} for movie_id, rating in ratings.items()])
+            created.append(user)
+        return created
+
+    def test_movies_like_the_liked_ones_are_recommended(self):
+        self.assertEqual(recommender.recommend_for_user(self.alice), [])  # No build yet
+        recommender.build()
+
+        recommendations = recommender.recommend_for_user(self.alice)
+        self.assertEqual([movie_id for movie_id, _ in recommendations], [2, 4])  # Not 5, which is like the disliked 3
+        self.assertGreater(recommendations[0][1], recommendations[1][1])
+        self.assertEqual(recommender.recommend_for_user(self.alice, limit=1), recommendations[:1])
+        self.assertEqual(recommender.recommend_for_user(User.objects.create_user('new')), [])
+
+    def test_build_is_skipped_until_ratings_change(self):
+        path = recommender.build()
+        index = recommender.get_neighbor_index()
+
+        self.assertEqual(recommender.build(), path)
+        self.assertNotEqual(recommender.build(force=True), path)
+        self.rate({6: 5, 1: 5})
+        path = recommender.build()
+        self.assertEqual(recommender.get_neighbor_index().path, path)
+        self.assertIsNot(recommender.get_neighbor_index(), index)
+        self.assertIn(6, recommender.get_neighbor_index().movie_ids)
+
+
+class EmbeddingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(EMBEDDINGS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        action, comedy, drama = {'id': 28, 'name': "Action"}, {'id': 35, 'name': "Comedy"}, {'id': 18, 'name': "Drama"}
+        for tmdb_id, name in [(28, "Action"), (35, "Comedy"), (18, "Drama")]:
+            Genre.objects.create(tmdb_id=tmdb_id, name=name)
+        for tmdb_id, genres in [(1, [action, comedy]), (2, [action, comedy]), (3, [action]), (4, [drama])]:
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", genres=genres)
+
+    def test_similar_movies_by_genre(self):
+        self.assertIsNone(embeddings.similar_movies(1))  # No build yet
+        embeddings.build()
+
+        self.assertEqual([movie_id for movie_id, _ in embeddings.similar_movies(1)], [2, 3])  # Not the drama
+        self.assertEqual(embeddings.similar_movies(1, k=1), embeddings.similar_movies(1)[:1])
+        self.assertIsNone(embeddings.similar_movies(99))
+        with mock.patch('movies.embeddings.QUERY_BATCH_ROWS', 1):  # Top k merged across blocks
+            self.assertEqual(embeddings.similar_movies(1), embeddings.get_embedding_index().similar([1], 20)[0])
+            self.assertEqual([movie_id for movie_id, _ in embeddings.similar_movies(3)], [1, 2])
+
+    def test_movies_rated_by_the_same_users_are_similar(self):
+        users = [User.objects.create_user(f'user{index}') for index in range(4)]
+        upsert_ratings(
+            [{'user': user, 'movie_id': movie_id, 'rating': 4.0} for user in users[:3] for movie_id in (4, 5)]
+            + [{'user': users[3], 'movie_id': movie_id, 'rating': 4.0} for movie_id in (1, 2, 3)]
+        )
+        embeddings.build()
+
+        self.assertEqual(embeddings.similar_movies(5)[0][0], 4)  # Rated, but not in the mirror
+        response = APIClient().get(reverse('similar_movies', args=[5]), {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        movie = MovieSerializer(Movie.objects.get(tmdb_id=4)).data
+        self.assertEqual(response.data['results'], [{**movie, 'score': mock.ANY}])
+        self.assertEqual(APIClient().get(reverse('similar_movies', args=[99])).status_code, 404)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class PrecomputeTests(SimpleTestCase):
+    def setUp(self):
+        settings_override = override_settings(CACHES=fake_redis_caches(), PRECOMPUTE_WARM_SET_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        tiered_cache.local.clear()
+        self.addCleanup(tiered_cache.local.clear)
+        self.stub = start_stub(self)
+
+        self.preferences = [RecommendationPreferences((28,), 'en', 2020 + offset) for offset in range(3)]
+        for preferences, requests_made in zip(self.preferences, (3, 2, 1)):
+            for _ in range(requests_made):
+                record_request(preferences)
+
+    def test_most_requested_preferences_and_their_coverage(self):
+        popular, coverage = popular_preferences(2)
+
+        self.assertEqual(popular, [(self.preferences[0], 3), (self.preferences[1], 2)])
+        self.assertAlmostEqual(coverage, 5 / 6)
+
+    def test_warm_set_is_fetched_until_it_is_about_to_go_stale(self):
+        report = precompute()
+
+        self.assertEqual((report['warm_set'], report['refreshed'], report['failed']), (2, 2, 0))
+        self.assertEqual(precompute_report(), report)
+        self.assertEqual(self.stub.requests_served, 2)
+        for preferences in self.preferences[:2]:
+            self.assertEqual(cached_fetch(preferences.cache_key(), mock.Mock(), mock.Mock())[1], HIT)
+        self.assertEqual(precompute()['refreshed'], 0)
+        with override_settings(PRECOMPUTE_INTERVAL=settings.CACHE_SOFT_TIMEOUT):
+            self.assertEqual(precompute()['refreshed'], 2)  # Would be stale before the next run
+        self.assertEqual(self.stub.requests_served, 4)
+
+    def test_counting_failures_do_not_fail_requests(self):
+        with mock.patch('movies.precompute.get_redis_connection') as get_redis_connection, \
+                self.assertLogs('error') as logs:
+            get_redis_connection.return_value.pipeline.return_value.execute.side_effect = ConnectionError("down")
+            record_request(self.preferences[0])
+        self.assertIn("Could not record recommendation request", logs.output[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecommendationPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+        Genre.objects.create(tmdb_id=28, name="Action")
+        genre_index._reset()
+        self.addCleanup(genre_index._reset)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice'))
+
+    def test_pages_map_onto_tmdb_pages(self):
+        self.assertEqual(tmdb_pages(1, 20), ([1], 0))
+        self.assertEqual(tmdb_pages(3, 20), ([3], 0))
+        self.assertEqual(tmdb_pages(2, 15), ([1, 2], 15))
+        self.assertEqual(tmdb_pages(2, 30), ([2, 3], 10))
+
+        tmdb_results = [
+            {'results': [{'id': movie_id} for movie_id in range(first, first + 20)], 'total_results': 20_000}
+            for first in (1, 21)
+        ]
+        page = recommendations_page(tmdb_results, 2, 15, 15)
+        self.assertEqual([movie['id'] for movie in page['results']], list(range(16, 31)))
+        self.assertEqual((page['total_results'], page['total_pages']), (10_000, 667))  # TMDb serves 500 pages
+
+    @mock.patch('movies.views.refresh_recommendations_task')
+    def test_page_spanning_two_tmdb_pages(self, refresh_recommendations_task):
+        stub = start_stub(self)
+        params = {'genres': 'Action', 'language': 'en', 'release_year': 2020}
+        response = self.client.get(reverse('recommendations'), {**params, 'page': 2, 'page_size': 15})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stub.requests_served, 2)
+        preferences = RecommendationPreferences((28,), 'en', 2020)
+        refresh_recommendations_task.delay.assert_called_once_with(*preferences, 3)  # Holds the rest of the next page
+
+        tmdb_pages_served = [
+            self.client.get(reverse('recommendations'), {**params, 'page': page}).data['results'] for page in (1, 2)
+        ]
+        self.assertEqual(stub.requests_served, 2)  # Cached one TMDb page at a time
+        self.assertEqual(response.data['results'], (tmdb_pages_served[0] + tmdb_pages_served[1])[15:30])
+
+    def test_pages_past_tmdb_last_page_are_rejected(self):
+        params = {'genres': 'Action', 'language': 'en', 'release_year': 2020, 'page': 101, 'page_size': 100}
+
+        self.assertEqual(self.client.get(reverse('recommendations'), params).status_code, 400)
+
+
+class MovieRecordTests(TestCase):
+    def test_tmdb_documents_are_projected_to_the_served_fields(self):
+        document = movie_details(7)
+        record = MovieRecord.from_tmdb(document).to_dict()
+
+        self.assertEqual(tuple(record), MovieRecord.FIELDS)
+        self.assertEqual({field: record[field] for field in ('id', 'title', 'genres')}, {
+            'id': 7, 'title': "Movie 7", 'genres': document['genres'],
+        })
+        self.assertEqual(MovieRecord.from_dict({**record, 'budget': 1}).to_dict(), record)
+
+    def test_mirrored_movies_have_the_same_shape(self):
+        document = movie_details(7)
+        Movie.from_tmdb(document).save()
+        movie = Movie.objects.get(tmdb_id=7)
+
+        self.assertEqual(MovieRecord.from_movie(movie).to_dict(), MovieRecord.from_tmdb(document).to_dict())
+        self.assertEqual(MovieRecord.from_movie(movie).to_dict(), MovieSerializer(movie).data)
+
+    def test_sparse_fieldsets(self):
+        self.assertEqual(parse_fields("overview, title,"), ('title', 'overview'))
+        self.assertIsNone(parse_fields(""))
+        with self.assertRaises(ValidationError):
+            parse_fields("title,budget")
+        self.assertEqual(MovieRecord(7, title="Alien").to_dict(('title',)), {'id': 7, 'title': "Alien"})
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_movie_details_fields(self):
+        cache.clear()
+        tiered_cache.local.clear()
+        start_stub(self)
+        url = reverse('movie_detail', args=[7])
+
+        self.assertEqual(APIClient().get(url, {'fields': 'title'}).data, {'id': 7, 'title': "Movie 7"})
+        self.assertEqual(tuple(APIClient().get(url).data), MovieRecord.FIELDS)
+        self.assertEqual(APIClient().get(url, {'fields': 'budget'}).status_code, 400)
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_cache_values_are_stored_as_compressed_msgpack(self):
+        caches = fake_redis_caches()
+        caches['default']['OPTIONS'] = {**settings.CACHE_OPTIONS, **caches['default']['OPTIONS']}
+        with override_settings(CACHES=caches):
+            cache.set('large', MovieRecord.from_tmdb(movie_details(7)).to_dict())
+            cache.set('small', 'x')
+            redis = cache.client.get_client()
+            large, small = redis.get(cache.make_key('large')), redis.get(cache.make_key('small'))
+
+            self.assertEqual(msgpack.unpackb(zlib.decompress(large)), cache.get('large'))
+            self.assertLess(len(large), len(json.dumps(movie_details(7))) / 2)
+            self.assertEqual(msgpack.unpackb(small), 'x')  # Below COMPRESS_MIN_LENGTH
+
+
+class LoggingPipelineTests(SimpleTestCase):
+    def record(self, msg='Fetched %s', level=logging.INFO, name='application'):
+        return logging.LogRecord(name, level, __file__, 1, msg, (1,), None)
+
+    def test_sampling_lets_warnings_through(self):
+        sampling = SamplingFilter(rate=0.25)
+
+        with mock.patch('movieapp.logging_handlers.random.random', side_effect=[0.1, 0.5]):
+            self.assertTrue(sampling.filter(self.record()))
+            self.assertFalse(sampling.filter(self.record()))
+        self.assertTrue(SamplingFilter(rate=0).filter(self.record(level=logging.WARNING)))
+        self.assertTrue(SamplingFilter().filter(self.record()))
+
+    @mock.patch('movieapp.logging_handlers.time.monotonic', return_value=100.5)
+    def test_rate_limit_per_message_template(self, monotonic):
+        rate_limit = RateLimitFilter(per_second=2)
+
+        self.assertEqual([rate_limit.filter(self.record()) for _ in range(4)], [True, True, False, False])
+        self.assertTrue(rate_limit.filter(self.record(level=logging.ERROR)))
+        self.assertTrue(rate_limit.filter(self.record('Fetched %s again')))
+        self.assertTrue(rate_limit.filter(self.record(name='error')))
+
+        monotonic.return_value = 101.5
+        record = self.record()
+        self.assertTrue(rate_limit.filter(record))
+        self.assertEqual(record.getMessage(), "Fetched 1 (2 similar messages suppressed)")
+        self.assertTrue(all(RateLimitFilter().filter(self.record()) for _ in range(10)))
+
+    def test_queued_records_are_formatted_and_flushed_in_batches(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        file_handler = BatchingFileHandler(Path(directory.name) / 'application.log')
+        self.addCleanup(file_handler.close)
+        log_queue = queue.SimpleQueue()
+        handler = DeferredFormattingQueueHandler(log_queue)
+        listener = BatchingQueueListener(log_queue, file_handler, batch_size=10)
+
+        args = [1]
+        record = logging.LogRecord('application', logging.INFO, __file__, 1, "Fetched %s", (args,), None)
+        handler.handle(record)
+        self.assertIs(log_queue.get_nowait(), record)  # Queued as is, formatted later
+        self.assertEqual(record.msg, "Fetched %s")
+        for index in range(3):
+            handler.handle(self.record(f"Record {index} of %s"))
+        listener.enqueue_sentinel()  # Queued with the records, so the listener takes them all in one batch
+
+        with mock.patch.object(file_handler, 'flush', wraps=file_handler.flush) as flush:
+            listener.start()
+            listener.stop()
+        self.assertEqual(flush.call_count, 1)
+        self.assertEqual((Path(directory.name) / 'application.log').read_text().splitlines(), [
+            "Record 0 of 1", "Record 1 of 1", "Record 2 of 1",
+        ])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+
+    def scrape(self, token='secret'):
+        return self.client.get(reverse('metrics'), headers={'Authorization': f"Bearer {token}"} if token else {})
+
+    def sample(self, line):
+        """
+        Value of the sample on ``line`` (a metric name with its labels), or 0 if there is none.
+        """
+        for sample in self.scrape().content.decode().splitlines():
+            if sample.startswith(line + ' '):
+                return float(sample.split()[-1])
+        return 0
+
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.scrape(None).status_code, 401)
+        self.assertEqual(self.scrape('wrong')['WWW-Authenticate'], 'Bearer')
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICS_TOKEN='')
+    def test_admins_only_without_a_token(self):
+        alice, admin = User.objects.create_user('alice'), User.objects.create_user('admin', is_staff=True)
+
+        self.assertEqual(self.scrape(None).status_code, 401)
+        self.assertEqual(self.scrape(AccessToken.for_user(alice)).status_code, 403)
+        self.assertEqual(self.scrape(AccessToken.for_user(admin)).status_code, 200)
+        self.client.force_login(admin)
+        self.assertEqual(self.scrape(None).status_code, 200)
+
+    def test_requests_and_tmdb_calls_are_counted(self):
+        start_stub(self)
+        request_line = 'movieapp_http_requests_total{endpoint="movie_detail",method="GET",status="200"}'
+        tmdb_line = 'movieapp_tmdb_requests_total{path="/movie/{id}",status="200"}'
+        requests_before, tmdb_before = self.sample(request_line), self.sample(tmdb_line)
+        for movie_id in (7, 8, 7):
+            self.client.get(reverse('movie_detail', args=[movie_id]))
+
+        self.assertEqual(self.sample(request_line), requests_before + 3)
+        self.assertEqual(self.sample(tmdb_line), tmdb_before + 2)  # Movie 7 was cached
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing(self):
+        start_stub(self)
+        response = self.client.get(reverse('movie_detail', args=[7]))
+
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, ')
+        self.assertRegex(response['Server-Timing'], r'tmdb;dur=[\d.]+;desc="1 call"')
+
+
+class StubTMDbServerTests(SimpleTestCase):
+    def start(self, **kwargs):
+        stub = StubTMDbServer(latency=0, **kwargs)
+        stub.start()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def test_responses_are_deterministic(self):
+        stub = self.start()
+        with requests.Session() as session:
+            details = [session.get(f"{stub.base_url}/movie/7", params={'api_key': 'x'}).json() for _ in range(2)]
+            discover = session.get(f"{stub.base_url}/discover/movie", params={'with_genres': '28', 'page': 2}).json()
+            missing = session.get(f"{stub.base_url}/tv/7")
+
+        self.assertEqual(details[0], details[1])
+        self.assertEqual(details[0], movie_details(7))
+        self.assertEqual((discover['page'], len(discover['results'])), (2, 20))
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual((stub.requests_served, stub.connections_opened), (4, 1))  # Kept alive
+
+    def test_injected_errors_are_reproducible(self):
+        def statuses(stub):
+            with requests.Session() as session:
+                return [session.get(f"{stub.base_url}/movie/{movie_id}").status_code for movie_id in range(20)]
+
+        first = statuses(self.start(error_rate=0.3, error_status=429, seed=3))
+        self.assertEqual(statuses(self.start(error_rate=0.3, error_status=429, seed=3)), first)
+        self.assertEqual(set(first), {200, 429})
+
+        stub = self.start(error_rate=1.0, retry_after=2)
+        self.assertEqual(requests.get(f"{stub.base_url}/movie/1").headers['Retry-After'], '2')
+
+    def test_stop_closes_open_connections(self):
+        stub = self.start()
+        session = requests.Session()
+        self.addCleanup(session.close)
+        session.get(f"{stub.base_url}/movie/1")
+        stub.stop()
+
+        self.assertFalse(stub._thread.is_alive())
+        with self.assertRaises(requests.ConnectionError):
+            session.get(f"{stub.base_url}/movie/1")
+
+    def test_percentile_is_nearest_rank(self):
+        values = [5, 1, 4, 2, 3]
+
+        self.assertEqual([percentile(values, pct) for pct in (20, 50, 95, 100)], [1, 3, 5, 5])
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('movies.resilience.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_bucket(self):
+        bucket = LocalTokenBucket(rate=10, burst=2)
+
+        self.assertEqual([bucket.reserve(0), bucket.reserve(0), bucket.reserve(0)], [0.0, 0.0, None])
+        self.assertAlmostEqual(bucket.reserve(0.5), 0.1)  # Reserved ahead: the next token is the caller's
+        self.assertAlmostEqual(bucket.reserve(0.5), 0.2)
+        self.now += 10
+        self.assertAlmostEqual(bucket.tokens, -2)  # Refilled on the next call only, and up to the burst
+        self.assertEqual(bucket.reserve(0), 0.0)
+        self.assertEqual(bucket.tokens, 1)
+
+        bucket.pause(2)
+        self.assertIsNone(bucket.reserve(1))
+        self.assertAlmostEqual(bucket.reserve(5), 2.1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_limiter_falls_back_to_the_local_bucket_without_redis(self):
+        limiter = RateLimiter(rate=1, burst=1, max_wait=0.5)
+
+        self.assertEqual(limiter.reserve(), 0.0)
+        with self.assertRaises(TMDbUnavailable) as raised:
+            limiter.reserve()
+        self.assertEqual(raised.exception.retry_after, 0.5)
+        self.assertEqual(limiter._redis_unavailable_until, float('inf'))
+
+    def test_limiter_retries_redis_after_an_outage(self):
+        limiter = RateLimiter(rate=10, burst=10, max_wait=1)
+
+        with mock.patch('movies.resilience.get_redis_connection', side_effect=RedisConnectionError("down")) as connect, \
+                self.assertLogs('error'):
+            limiter.reserve()
+            limiter.reserve()  # Local bucket, without trying Redis
+            self.assertEqual(connect.call_count, 1)
+            self.now += REDIS_RETRY_INTERVAL
+            limiter.reserve()
+            self.assertEqual(connect.call_count, 2)
+
+    def test_disabled_limiter_never_waits(self):
+        limiter = RateLimiter(rate=0, burst=0, max_wait=0)
+
+        with mock.patch.object(limiter, 'reserve') as reserve:
+            limiter.acquire()
+            asyncio.run(limiter.aacquire())
+        reserve.assert_not_called()
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('movies.resilience.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def fail(self, times=1):
+        with self.assertLogs('error'):
+            for _ in range(times):
+                self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()  # Not consecutive
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.fail()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 10
+        with self.assertRaises(TMDbUnavailable) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 20)
+
+    def test_one_trial_call_after_the_reset_timeout(self):
+        self.fail(2)
+        self.now += 30
+
+        self.breaker.before_call()  # The trial call
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(TMDbUnavailable):
+            self.breaker.before_call()
+        self.fail()  # The trial failed: open again
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.now += 30
+        self.breaker.before_call()
+        with self.assertLogs('application'):
+            self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.before_call()
+
+    def test_lost_trial_call_is_replaced(self):
+        self.fail(2)
+        self.now += 30
+        self.breaker.before_call()  # Never reports back
+
+        self.now += 30
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_client_fails_fast_while_open(self):
+        stub = start_stub(self, error_rate=1.0, error_status=503)
+        client = TMDbClient(stub.base_url, 'key', max_retries=0)
+
+        with mock.patch('movies.tmdb.tmdb_breaker', self.breaker), self.assertLogs('error'):
+            for _ in range(2):
+                with self.assertRaises(requests.HTTPError):
+                    client.get('movie/1')
+            with self.assertRaises(TMDbUnavailable):
+                client.get('movie/1')
+        self.assertEqual(stub.requests_served, 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_throttled_client_pauses_the_rate_limit(self):
+        stub = start_stub(self, error_rate=1.0, error_status=429, retry_after=5)
+        client = TMDbClient(stub.base_url, 'key', max_retries=0)
+
+        with mock.patch('movies.tmdb.tmdb_rate_limiter', RateLimiter(rate=10, burst=10, max_wait=1)), \
+                self.assertLogs('application'):
+            with self.assertRaises(requests.HTTPError):
+                client.get('movie/1')
+            with self.assertRaises(TMDbUnavailable):
+                client.get('movie/1')
+        self.assertEqual(stub.requests_served, 1)
@@ -0,0 +1,341 @@
+"""
+Two-tier cache: a small in-process LRU in front of the shared Django cache (Redis).
+
+Hot entries (popular movie details and recommendation sets) are served from
+process memory without a Redis round trip or unpickling. The local tier is
+bounded by total size and by a short TTL. Writes go to both tiers and are
+broadcast over Redis pub/sub, so every other worker drops its local copy
+instead of serving an outdated one until the TTL runs out.
+
+Values returned from the local tier are shared between requests; callers
+must not mutate them. Entries are sized by their payload as stored in Redis
+(msgpack, compressed if large), which values read from Redis come with, so
+the local tier serializes nothing on reads.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from django_redis.client import DefaultClient
+
+from . import metrics
+from .metrics import CACHE_DURATION, timer
+
+application_logger = logging.getLogger('application')  # For general application logs
+error_logger = logging.getLogger('error')              # For error-specific logs
+
+INVALIDATION_CHANNEL = 'movies:cache-invalidation'
+
+
+def in_thread_pool(func, *args, **kwargs):
+    """
+    Await a blocking cache (or Redis) call from async code, run in the default thread pool.
+
+    Django's async cache methods (``cache.aget`` and co.) wrap the sync ones with
+    ``sync_to_async(thread_sensitive=True)``, which runs them all on one shared
+    thread: an ASGI worker's cache I/O would queue up behind it. The cache
+    backends used here are thread-safe, so calls can run side by side instead.
+    """
+    return sync_to_async(func, thread_sensitive=False)(*args, **kwargs)
+
+
+def stored_size(value):
+    """
+    Size in bytes of ``value`` as the shared cache stores it, for values this
+    process writes. Pickled size with caches other than django-redis.
+    """
+    client = getattr(cache, 'client', None)
+    if not isinstance(client, DefaultClient):
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    payload = client.encode(value)
+    return len(payload) if isinstance(payload, bytes) else len(str(payload))  # Integers are stored as-is
+
+
+def read_many(keys):
+    """
+    Read ``keys`` from the shared cache with the size of their stored payloads,
+    which django-redis reads anyway: unlike ``stored_size``, this costs no
+    serialization.
+
+    :return: Dict of the keys found to ``(value, size)``
+    """
+    client = getattr(cache, 'client', None)
+    if not isinstance(client, DefaultClient):
+        return {key: (value, stored_size(value)) for key, value in cache.get_many(keys).items()}
+    payloads = client.get_client(write=False).mget([client.make_key(key) for key in keys])
+    return {key: (client.decode(payload), len(payload)) for key, payload in zip(keys, payloads) if payload is not None}
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache with per-entry TTL and a cap on total size.
+    """
+
+    def __init__(self, max_bytes, timeout):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size):
+        """
+        :param size: Size of the value in bytes, as counted against ``max_bytes``
+        """
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return  # Would evict everything else; leave it in Redis only
+            while self.size + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = (value, size, time.monotonic() + self.timeout)
+            self.size += size
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+
+class TieredCache:
+    """
+    Read-through local tier in front of ``django.core.cache``.
+    """
+
+    def __init__(self, max_bytes, timeout):
+        self.local = LocalCache(max_bytes, timeout)
+        self.node_id = uuid.uuid4().hex  # Lets a worker ignore its own invalidations
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self._callbacks = {}  # key -> callables run when another worker invalidates it
+
+    @property
+    def enabled(self):
+        return self.local.max_bytes > 0
+
+    def _record(self, outcome):
+        with self._stats_lock:
+            self._stats[outcome] += 1
+
+    def stats(self):
+        """
+        Lookup counts and hit ratios per tier for this process.
+        """
+        with self._stats_lock:
+            local_hits, redis_hits, misses = self._stats['local'], self._stats['redis'], self._stats['miss']
+        lookups = local_hits + redis_hits + misses
+        return {
+            'lookups': lookups,
+            'local_hits': local_hits,
+            'redis_hits': redis_hits,
+            'misses': misses,
+            'local_hit_ratio': local_hits / lookups if lookups else 0.0,
+            'redis_hit_ratio': redis_hits / (lookups - local_hits) if lookups > local_hits else 0.0,
+            'local_entries': len(self.local),
+            'local_bytes': self.local.size,
+        }
+
+    def get(self, key):
+        if self.enabled:
+            self._ensure_listener()
+            value = self.local.get(key)
+            if value is not None:
+                self._record('local')
+                return value
+        with timer('cache', CACHE_DURATION, 'get'):
+            found = read_many([key])
+        self._remember(key, found.get(key))
+        return found[key][0] if key in found else None
+
+    def set(self, key, value, timeout):
+        with timer('cache', CACHE_DURATION, 'set'):
+            cache.set(key, value, timeout=timeout)
+        if self.enabled:
+            self.local.set(key, value, stored_size(value))
+            self._publish(key)
+
+    def delete(self, key):
+        with timer('cache', CACHE_DURATION, 'delete'):
+            cache.delete(key)
+        if self.enabled:
+            self.local.delete(key)
+            self._publish(key)
+
+    def get_many(self, keys):
+        """
+        Look up several keys with at most one Redis round trip.
+        Returns a dict of the keys that were found.
+        """
+        found = {}
+        if self.enabled:
+            self._ensure_listener()
+            for key in keys:
+                value = self.local.get(key)
+                if value is not None:
+                    self._record('local')
+                    found[key] = value
+        remaining = [key for key in keys if key not in found]
+        if remaining:
+            with timer('cache', CACHE_DURATION, 'get_many'):
+                from_redis = read_many(remaining)
+            for key in remaining:
+                self._remember(key, from_redis.get(key))
+            found.update({key: value for key, (value, _) in from_redis.items()})
+        return found
+
+    def set_many(self, mapping, timeout):
+        with timer('cache', CACHE_DURATION, 'set_many'):
+            cache.set_many(mapping, timeout=timeout)
+        if self.enabled:
+            for key, value in mapping.items():
+                self.local.set(key, value, stored_size(value))
+            self._publish(*mapping)
+
+    def invalidate(self, key):
+        """
+        Drop ``key`` from the local tier of every worker, leaving the shared value as is.
+        """
+        if self.enabled:
+            self.local.delete(key)
+            self._publish(key)
+
+    def on_invalidate(self, key, callback):
+        """
+        Call ``callback()`` whenever another worker invalidates ``key``, and
+        after the listener reconnects (when invalidations may have been missed).
+        """
+        self._callbacks.setdefault(key, []).append(callback)
+
+    async def aget(self, key):
+        if self.enabled:
+            self._ensure_listener()
+            value = self.local.get(key)
+            if value is not None:
+                self._record('local')
+                return value
+        with timer('cache', CACHE_DURATION, 'get'):
+            found = await in_thread_pool(read_many, [key])
+        self._remember(key, found.get(key))
+        return found[key][0] if key in found else None
+
+    async def aset(self, key, value, timeout):
+        with timer('cache', CACHE_DURATION, 'set'):
+            await in_thread_pool(cache.set, key, value, timeout=timeout)
+        if self.enabled:
+            self.local.set(key, value, stored_size(value))
+            await in_thread_pool(self._publish, key)
+
+    async def adelete(self, key):
+        with timer('cache', CACHE_DURATION, 'delete'):
+            await in_thread_pool(cache.delete, key)
+        if self.enabled:
+            self.local.delete(key)
+            await in_thread_pool(self._publish, key)
+
+    def _remember(self, key, item):
+        """
+        :param item: ``(value, size)`` read from the shared cache, or ``None`` on a miss
+        """
+        if item is None:
+            self._record('miss')
+            return
+        self._record('redis')
+        if self.enabled:
+            self.local.set(key, *item)
+
+    def _publish(self, *keys):
+        try:
+            pipeline = get_redis_connection('default').pipeline(transaction=False)
+            for key in keys:
+                pipeline.publish(INVALIDATION_CHANNEL, f"{self.node_id} {key}")
+            pipeline.execute()
+        except NotImplementedError:
+            pass  # Not a Redis cache; the local TTL bounds staleness instead
+        except Exception as e:
+            error_logger.error("Could not publish invalidation of %s: %s", keys, e, exc_info=True)
+
+    def _ensure_listener(self):
+        # One listener thread per process; started lazily so forked workers get their own.
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            try:
+                get_redis_connection('default')
+            except NotImplementedError:
+                return
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    origin, _, key = message['data'].decode().partition(' ')
+                    if origin != self.node_id:
+                        self.local.delete(key)
+                        for callback in self._callbacks.get(key, ()):
+                            callback()
+            except Exception as e:
+                # Invalidations may have been missed while disconnected.
+                error_logger.error("Cache invalidation listener failed, clearing local tier: %s", e, exc_info=True)
+                self.local.clear()
+                for callbacks in self._callbacks.values():
+                    for callback in callbacks:
+                        callback()
+                time.sleep(1)
+
+
+tiered_cache = TieredCache(settings.LOCAL_CACHE_MAX_BYTES, settings.LOCAL_CACHE_TIMEOUT)
+
+
+def _collect_metrics():
+    stats = tiered_cache.stats()
+    return [
+        ('movieapp_cache_tier_lookups_total', 'counter', 'Shared-cache lookups, by the tier that answered.', [
+            ({'tier': 'local'}, stats['local_hits']),
+            ({'tier': 'redis'}, stats['redis_hits']),
+            ({'tier': 'miss'}, stats['misses']),
+        ]),
+        ('movieapp_local_cache_bytes', 'gauge', 'Size of the in-process cache tier.', [({}, stats['local_bytes'])]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
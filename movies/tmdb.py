@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import record_tmdb_call
+from .resilience import TMDbUnavailable, tmdb_breaker, tmdb_rate_limiter
+
+# Set up loggers for the TMDb client
+application_logger = logging.getLogger('application')  # For general application logs
+
+# TMDb answers 429 when we exceed the rate limit and 5xx when it is degraded;
+# both are worth retrying, anything else is returned to the caller as-is.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def retry_delay(attempt, response, backoff_factor):
+    """
+    Seconds to wait before retrying a 429/5xx response: TMDb's ``Retry-After``
+    if given, exponential backoff otherwise.
+    """
+    retry_after = response.headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        return int(retry_after)
+    return backoff_factor * (2 ** attempt)
+
+
+def check_retry_delay(delay, max_delay):
+    """
+    Fail a call whose retry would wait longer than ``max_delay`` seconds.
+
+    :raises TMDbUnavailable: If ``delay`` exceeds ``max_delay``
+    """
+    if delay > max_delay:
+        tmdb_breaker.record_failure()
+        raise TMDbUnavailable(f"TMDb asked to retry after {delay}s", retry_after=delay)
+
+
+class TMDbClient:
+    """
+    Pooled, keep-alive HTTP client for the TMDb API.
+
+    A single ``requests.Session`` is shared by every caller in the process so
+    that connections (and their TLS handshakes) are reused between cache
+    misses. The underlying urllib3 pool is thread-safe, so one instance can be
+    used concurrently from gunicorn threads and Celery worker threads.
+
+    Every attempt goes through the shared rate limit and every call through
+    the circuit breaker (see ``resilience``). urllib3 only retries failed
+    connections; 429/5xx responses are retried here, so that retries take a
+    rate limit token too. Read timeouts are not retried. A retry that would
+    have to wait longer than ``max_retry_delay`` (e.g. a long ``Retry-After``)
+    is not made: the call fails with ``TMDbUnavailable`` instead of holding
+    the request thread.
+    """
+
+    def __init__(self, base_url, api_key, pool_size=20, connect_timeout=3.05, read_timeout=10,
+                 max_retries=3, backoff_factor=0.5, max_retry_delay=2, verify=True):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_delay = max_retry_delay
+
+        retry = Retry(
+            total=max_retries,
+            read=0,
+            status=0,
+            respect_retry_after_header=False,  # Otherwise urllib3 raises RetryError on a 429/503 with Retry-After
+            backoff_factor=backoff_factor,
+            allowed_methods=frozenset(['GET']),
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, path, params=None):
+        """
+        Perform a GET request against the TMDb API.
+
+        :param path: API path relative to the base URL, e.g. ``movie/550``
+        :param params: Optional query parameters (the API key is added automatically)
+        :return: ``requests.Response`` whose status has already been checked
+        :raises requests.exceptions.RequestException: On connection errors or non-2xx responses
+        :raises resilience.TMDbUnavailable: If the call was refused by the circuit breaker or the rate limit,
+            or TMDb asked to wait longer than ``max_retry_delay`` before retrying
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        query = {'api_key': self.api_key}
+        query.update(params or {})
+        tmdb_breaker.before_call()
+        for attempt in range(self.max_retries + 1):
+            tmdb_rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=query, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                record_tmdb_call(path, 'error', time.perf_counter() - started)
+                tmdb_breaker.record_failure()
+                raise
+            record_tmdb_call(path, response.status_code, time.perf_counter() - started)
+            if response.status_code not in RETRY_STATUS_CODES:
+                tmdb_breaker.record_success()
+                break
+            delay = retry_delay(attempt, response, self.backoff_factor)
+            if response.status_code == 429:
+                tmdb_rate_limiter.pause(delay)
+            if attempt == self.max_retries:
+                tmdb_breaker.record_failure()
+                break
+            check_retry_delay(delay, self.max_retry_delay)
+            time.sleep(delay)
+        response.raise_for_status()
+        return response
+
+    def get_json(self, path, params=None):
+        """
+        Perform a GET request and decode the JSON body.
+        """
+        return self.get(path, params).json()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_tmdb_client():
+    """
+    Return the process-wide TMDb client, creating it on first use.
+
+    The client is rebuilt after a fork (Celery prefork workers, gunicorn with
+    ``--preload``) so that child processes never share sockets with their
+    parent.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = TMDbClient(
+                base_url=settings.TMDB_API_URL,
+                api_key=settings.TMDB_API_KEY,
+                pool_size=settings.TMDB_POOL_SIZE,
+                connect_timeout=settings.TMDB_CONNECT_TIMEOUT,
+                read_timeout=settings.TMDB_READ_TIMEOUT,
+                max_retries=settings.TMDB_MAX_RETRIES,
+                backoff_factor=settings.TMDB_RETRY_BACKOFF,
+                max_retry_delay=settings.TMDB_MAX_RETRY_DELAY,
+                verify=settings.TMDB_VERIFY_SSL,
+            )
+            _client_pid = pid
+            application_logger.info("Created TMDb client with a pool of %s connections (pid %s).", settings.TMDB_POOL_SIZE, pid)
+    return _client
+
+
+class AsyncTMDbClient:
+    """
+    Async counterpart of ``TMDbClient`` built on ``httpx.AsyncClient``.
+
+    Up to ``pool_size`` requests are in flight at once; more queue on a
+    semaphore for a free connection instead of failing. The connections are
+    split into ``httpx.AsyncClient`` pools of at most ``shard_size``, and each
+    request goes to the least busy one: httpcore scans every connection of a
+    pool for every request, so a single pool of hundreds of connections spends
+    more CPU on that bookkeeping than on the requests themselves.
+
+    Like ``TMDbClient``, it goes through the shared rate limit and the
+    circuit breaker, and retries 429/5xx responses itself (up to ``max_retry_delay``).
+    """
+
+    def __init__(self, base_url, api_key, pool_size=500, shard_size=10, connect_timeout=3.05, read_timeout=10,
+                 max_retries=3, backoff_factor=0.5, max_retry_delay=2, verify=True):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_delay = max_retry_delay
+        self._slots = asyncio.Semaphore(pool_size)
+
+        shard_size = max(1, min(shard_size, pool_size))
+        self.clients = [
+            self._make_client(base_url, shard_size, connect_timeout, read_timeout, max_retries, verify)
+            for _ in range(-(-pool_size // shard_size))
+        ]
+        self._active = [0] * len(self.clients)  # Requests in flight per client
+
+    @staticmethod
+    def _make_client(base_url, size, connect_timeout, read_timeout, max_retries, verify):
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+        transport = httpx.AsyncHTTPTransport(
+            limits=limits,
+            verify=verify,
+            retries=max_retries,  # httpx only retries failed connection attempts
+        )
+        return httpx.AsyncClient(
+            base_url=base_url,
+            transport=transport,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+        )
+
+    async def _send(self, path, params):
+        async with self._slots:
+            shard = min(range(len(self.clients)), key=self._active.__getitem__)
+            self._active[shard] += 1
+            try:
+                return await self.clients[shard].get(path, params=params)
+            finally:
+                self._active[shard] -= 1
+
+    async def get(self, path, params=None):
+        """
+        Perform a GET request against the TMDb API, retrying on 429/5xx.
+
+        :param path: API path relative to the base URL, e.g. ``movie/550``
+        :param params: Optional query parameters (the API key is added automatically)
+        :return: ``httpx.Response`` whose status has already been checked
+        :raises httpx.HTTPError: On connection errors or non-2xx responses
+        :raises resilience.TMDbUnavailable: If the call was refused by the circuit breaker or the rate limit,
+            or TMDb asked to wait longer than ``max_retry_delay`` before retrying
+        """
+        query = {'api_key': self.api_key}
+        query.update(params or {})
+        tmdb_breaker.before_call()
+        for attempt in range(self.max_retries + 1):
+            await tmdb_rate_limiter.aacquire()
+            started = time.perf_counter()
+            try:
+                response = await self._send(path.lstrip('/'), query)
+            except httpx.HTTPError:
+                record_tmdb_call(path, 'error', time.perf_counter() - started)
+                tmdb_breaker.record_failure()
+                raise
+            record_tmdb_call(path, response.status_code, time.perf_counter() - started)
+            if response.status_code not in RETRY_STATUS_CODES:
+                tmdb_breaker.record_success()
+                break
+            delay = retry_delay(attempt, response, self.backoff_factor)
+            if response.status_code == 429:
+                await sync_to_async(tmdb_rate_limiter.pause, thread_sensitive=False)(delay)
+            if attempt == self.max_retries:
+                tmdb_breaker.record_failure()
+                break
+            check_retry_delay(delay, self.max_retry_delay)
+            await asyncio.sleep(delay)
+        response.raise_for_status()
+        return response
+
+    async def get_json(self, path, params=None):
+        """
+        Perform a GET request and decode the JSON body.
+        """
+        response = await self.get(path, params)
+        return response.json()
+
+    async def aclose(self):
+        await asyncio.gather(*(client.aclose() for client in self.clients))
+
+
+# httpx connections are bound to the event loop that opened them, so keep one
+# client per running loop (in practice, one per ASGI worker).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_tmdb_client():
+    """
+    Return the TMDb async client for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncTMDbClient(
+            base_url=settings.TMDB_API_URL,
+            api_key=settings.TMDB_API_KEY,
+            pool_size=settings.TMDB_ASYNC_POOL_SIZE,
+            shard_size=settings.TMDB_ASYNC_POOL_SHARD_SIZE,
+            connect_timeout=settings.TMDB_CONNECT_TIMEOUT,
+            read_timeout=settings.TMDB_READ_TIMEOUT,
+            max_retries=settings.TMDB_MAX_RETRIES,
+            backoff_factor=settings.TMDB_RETRY_BACKOFF,
+            max_retry_delay=settings.TMDB_MAX_RETRY_DELAY,
+            verify=settings.TMDB_VERIFY_SSL,
+        )
+        _async_clients[loop] = client
+        application_logger.info("Created async TMDb client with a pool of %s connections.", settings.TMDB_ASYNC_POOL_SIZE)
+    return client
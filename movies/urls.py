@@ -1,9 +1,21 @@
 # movies/urls.py
 from django.urls import path
-from .views import RecommendationView, MovieDetailView, RatingView
+from .views import RecommendationView, MovieDetailView, SimilarMoviesView, MovieBatchView, RatingView, RatingBatchView, RatingExportView, CacheStatsView, MovieRatingStatsView, MetricsView
+from .async_views import AsyncRecommendationView, AsyncMovieDetailView
 
 urlpatterns = [
     path('api/recommendations/', RecommendationView.as_view(), name='recommendations'),
     path('api/movie/<int:movie_id>/', MovieDetailView.as_view(), name='movie_detail'),
+    path('api/movie/<int:movie_id>/similar/', SimilarMoviesView.as_view(), name='similar_movies'),
+    path('api/movies/batch/', MovieBatchView.as_view(), name='movie_batch'),
     path('api/ratings/', RatingView.as_view(), name='ratings'),
+    path('api/ratings/batch/', RatingBatchView.as_view(), name='ratings_batch'),
+    path('api/ratings/export/', RatingExportView.as_view(), name='ratings_export'),
+    path('api/movie/<int:movie_id>/ratings/stats/', MovieRatingStatsView.as_view(), name='movie_rating_stats'),
+    path('api/cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+
+    # Async variants, intended to be served by an ASGI server (see movieapp/asgi.py)
+    path('api/async/recommendations/', AsyncRecommendationView.as_view(), name='async_recommendations'),
+    path('api/async/movie/<int:movie_id>/', AsyncMovieDetailView.as_view(), name='async_movie_detail'),
 ]
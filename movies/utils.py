@@ -1,5 +1,5 @@
 from rest_framework.response import Response
-from movies.models import Genre
+from movies.genre_index import get_genre_index
 
 
 def build_response(data=None, errors=None, status_code=200, message=None):
@@ -16,7 +16,11 @@ def build_response(data=None, errors=None, status_code=200, message=None):
 
 
 def map_genres_to_ids(genre_names):
-    genres = Genre.objects.filter(name__in=genre_names).values_list('tmdb_id', flat=True)
+    """
+    Map genre names or aliases (case-insensitively) to TMDb genre ids,
+    using the in-memory genre index.
+    """
+    genres = get_genre_index().ids_for(genre_names)
     if not genres:
         raise ValueError("Invalid genres provided.")
-    return list(genres)
+    return genres
@@ -1,19 +1,144 @@
 
-from .serializers import RatingSerializer, MovieRecommendationSerializer
+from functools import partial
+from .serializers import (
+    RatingSerializer, MovieRecommendationSerializer, MovieBatchSerializer, MovieSerializer, MovieRatingStatsSerializer,
+    RecommendationPageSerializer,
+)
+import json
 import logging
-from django.core.cache import cache
+import math
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views import View
 from rest_framework.generics import ListCreateAPIView, RetrieveAPIView
+from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from .services import fetch_movie_recommendations, fetch_movie_details
-from rest_framework.exceptions import PermissionDenied
-from .models import MovieRating
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from . import metrics
+from .caching import ERROR, HIT, MISS, STALE, cache_stats, cached_etags, cached_fetch, cached_fetch_many, prefetch
+from .conditional import cache_headers, etag_matches, not_modified, request_etags, response_etag
+from .precompute import precompute_report, record_request
+from .preferences import RecommendationPreferences
+from .records import MovieRecord, parse_fields
+from .rating_buffer import enqueue_rating
+from .recommender import recommend_for_user
+from .embeddings import similar_movies
+from .services import TMDbUnavailableError, fetch_movie_recommendations, fetch_movie_details
+from .tasks import refresh_movie_details_task, refresh_recommendations_task
+from .tiered_cache import tiered_cache
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .models import MovieRating, MovieRatingStats, Movie
+from .pagination import RatingCursorPagination, recommendations_page, tmdb_pages
 
 # Configure loggers for the views module
 application_logger = logging.getLogger('application')  # For general application logs
 error_logger = logging.getLogger('error')              # For error-specific logs
 
+def scored_movie_results(scored_movies):
+    """
+    Mirrored details of ``(movie_id, score)`` pairs, in order. Movies not in
+    the mirror yet are returned with their id only.
+    """
+    movies = Movie.objects.in_bulk([movie_id for movie_id, _ in scored_movies], field_name='tmdb_id')
+    results = []
+    for movie_id, score in scored_movies:
+        movie = movies.get(movie_id)
+        data = MovieSerializer(movie).data if movie is not None else {"id": movie_id}
+        results.append({**data, "score": round(score, 4)})
+    return results
+
+
+def fetch_failure(error):
+    """
+    Status and headers of the response to a failed TMDb fetch: 503 with
+    ``Retry-After`` if TMDb calls are being refused (see ``resilience``), 500 otherwise.
+    """
+    if isinstance(error, TMDbUnavailableError):
+        return status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': str(max(1, math.ceil(error.retry_after)))}
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, {}
+
+
+def recommendation_query(params):
+    """
+    Recommendation request data from a query string: ``?genres=28,12&language=en&release_year=2020&page=2``
+    (genres may also be repeated). Missing parameters are left out, for the serializers to report.
+    """
+    data = {key: params[key] for key in ('language', 'release_year', 'page', 'page_size', 'personalized') if key in params}
+    if 'genres' in params:
+        data['genres'] = [genre.strip() for value in params.getlist('genres') for genre in value.split(',') if genre.strip()]
+    return data
+
+
+def recommendations_etag(page_etags, page, page_size):
+    """
+    ETag of a page of recommendations built from TMDb pages with ``page_etags``.
+    """
+    return response_etag(*page_etags, page, page_size)
+
+
+def fetch_recommendation_pages(preferences, pages):
+    """
+    TMDb discover pages of recommendations for ``preferences``, each cached on its own.
+
+    :return: Tuple of ``(values, states, etags)`` in ``pages`` order
+    :raises Exception: If any of the pages could not be fetched
+    """
+    if len(pages) == 1:
+        value, state, etag = cached_fetch(
+            preferences.cache_key(pages[0]),
+            lambda: fetch_movie_recommendations(*preferences, pages[0]),
+            refresh=lambda: refresh_recommendations_task.delay(*preferences, pages[0]),
+            with_etag=True,
+        )
+        return [value], [state], [etag]
+
+    # Pages spanning several TMDb pages read them in one round trip and fetch the misses concurrently
+    fetched = cached_fetch_many(
+        {
+            preferences.cache_key(tmdb_page): (
+                partial(fetch_movie_recommendations, *preferences, tmdb_page),
+                partial(refresh_recommendations_task.delay, *preferences, tmdb_page),
+            )
+            for tmdb_page in pages
+        },
+        max_concurrency=settings.TMDB_FANOUT_CONCURRENCY,
+        with_etag=True,
+    )
+    values, states, etags = zip(*(fetched[preferences.cache_key(tmdb_page)] for tmdb_page in pages))
+    for value, state in zip(values, states):
+        if state == ERROR:
+            raise value
+    return list(values), list(states), list(etags)
+
+
+def cached_recommendations_etag(preferences, pages, page, page_size):
+    """
+    ETag of a page of recommendations from the ETags of its cached TMDb pages,
+    without reading them; ``None`` unless all of them are cached.
+    """
+    cache_keys = [preferences.cache_key(tmdb_page) for tmdb_page in pages]
+    etags = cached_etags({
+        cache_key: partial(refresh_recommendations_task.delay, *preferences, tmdb_page)
+        for cache_key, tmdb_page in zip(cache_keys, pages)
+    })
+    if len(etags) < len(cache_keys):
+        return None
+    return recommendations_etag([etags[cache_key] for cache_key in cache_keys], page, page_size)
+
+
+def prefetch_recommendation_pages(preferences, pages):
+    """
+    Schedule background fetches of the TMDb discover pages of ``preferences``
+    that are not fresh in the cache yet.
+    """
+    for tmdb_page in pages:
+        prefetch(preferences.cache_key(tmdb_page), partial(refresh_recommendations_task.delay, *preferences, tmdb_page))
+
+
 class RecommendationView(ListCreateAPIView):
     permission_classes = [IsAuthenticated]  # Ensure the user must be authenticated
     serializer_class = MovieRecommendationSerializer
@@ -22,32 +147,84 @@ class RecommendationView(ListCreateAPIView):
         # Since this view doesn't need a queryset, return an empty list or a custom response
         return []
 
+    def get(self, request, *args, **kwargs):
+        """
+        Same as ``post``, with the preferences in the query string (see ``recommendation_query``),
+        so that responses can be cached by browsers and CDNs and revalidated with ``If-None-Match``.
+        """
+        return self.recommend(request, recommendation_query(request.query_params), conditional=True)
+
     def post(self, request, *args, **kwargs):
-        preferences = request.data
-        cache_key = f"recommendations_{preferences}"
-        
-        # Check cache first
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            application_logger.info(f"Cache hit for recommendations with preferences: {preferences}")
-            return Response(cached_data)
-        
-        # If not in cache, fetch recommendations from TMDb API
+        if not isinstance(request.data, dict):
+            return Response({"error": "Request body must be a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+        return self.recommend(request, request.data)
+
+    def recommend(self, request, data, conditional=False):
+        """
+        :param data: Preferences and paging of the request
+        :param conditional: Whether to send ``ETag``/``Cache-Control`` and answer ``If-None-Match``
+        """
+        if data.get('personalized') in (True, 'true', '1', 1):
+            recommendations = recommend_for_user(request.user)
+            if recommendations or 'genres' not in data:
+                application_logger.info("Served %s personalized recommendations to user %s", len(recommendations), request.user.pk)
+                headers = cache_headers(public=False) if conditional else None
+                return Response(self.personalized_response(recommendations), headers=headers)
+            # No ratings from this user (or no recommender build yet): fall back to the given preferences
+
+        # Equivalent requests normalize to the same preferences, and so share cache entries
+        preferences = RecommendationPreferences.from_request_data(data)
+        paging = RecommendationPageSerializer(data=data)
+        paging.is_valid(raise_exception=True)
+        page, page_size = paging.validated_data['page'], paging.validated_data['page_size']
+        record_request(preferences)  # Popular preferences are precomputed ahead of time
+
+        # Clients revalidating a page that is still cached get a 304, without the pages being read
+        pages, offset = tmdb_pages(page, page_size)
+        etags = request_etags(request) if conditional else []
+        if etags:
+            etag = cached_recommendations_etag(preferences, pages, page, page_size)
+            if etag is not None and etag_matches(etag, etags):
+                application_logger.info("Recommendations not modified for preferences: %s, page %s", preferences, page)
+                return not_modified(etag, public=False)
+
+        # Each TMDb page is cached on its own, served from cache while fresh, or stale while
+        # a background task refreshes it. On a miss, concurrent requests share one TMDb call.
         try:
-            application_logger.info(f"Fetching movie recommendations for preferences: {preferences}")
-            recommendations = fetch_movie_recommendations(
-                preferences["genres"],
-                preferences["language"],
-                preferences["release_year"]
-            )
+            tmdb_results, states, page_etags = fetch_recommendation_pages(preferences, pages)
         except Exception as e:
-            error_logger.error(f"Error fetching recommendations: {e}", exc_info=True)
-            return Response({"error": "Failed to fetch movie recommendations. Please try again later."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Cache the recommendations for 10 minutes
-        cache.set(cache_key, recommendations, timeout=600)
-        application_logger.info(f"Successfully fetched and cached movie recommendations for preferences: {preferences}")
-        return Response(recommendations)
+            error_logger.error("Error fetching recommendations: %s", e, exc_info=not isinstance(e, TMDbUnavailableError))
+            failure_status, headers = fetch_failure(e)
+            return Response({"error": "Failed to fetch movie recommendations. Please try again later."}, status=failure_status, headers=headers)
+        recommendations = recommendations_page(tmdb_results, page, page_size, offset)
+
+        # Clients usually page on, so the next page is fetched in the background
+        if page < recommendations['total_pages']:
+            next_pages, _ = tmdb_pages(page + 1, page_size)
+            prefetch_recommendation_pages(preferences, [tmdb_page for tmdb_page in next_pages if tmdb_page not in pages])
+
+        if MISS in states:
+            application_logger.info("Successfully fetched and cached movie recommendations for preferences: %s, page %s", preferences, page)
+        else:
+            application_logger.info("Cache %s for recommendations with preferences: %s, page %s", STALE if STALE in states else HIT, preferences, page)
+        if not conditional:
+            return Response(recommendations)
+        etag = recommendations_etag(page_etags, page, page_size)
+        # Private: the endpoint requires authentication, so shared caches must not serve it to other clients
+        if etag_matches(etag, etags):
+            return not_modified(etag, public=False)
+        return Response(recommendations, headers=cache_headers(etag, public=False))
+
+    @staticmethod
+    def personalized_response(recommendations):
+        return {"personalized": True, "results": scored_movie_results(recommendations)}
+
+
+def mirrored_movie_etag(movie, fields):
+    """
+    ETag of a mirrored movie's details: the mirror row changes only when it is synced.
+    """
+    return response_etag(movie.tmdb_id, movie.synced_at.isoformat(), fields)
 
 
 class MovieDetailView(RetrieveAPIView):
@@ -55,26 +232,164 @@ class MovieDetailView(RetrieveAPIView):
 
     def get(self, request, *args, **kwargs):
         movie_id = kwargs["movie_id"]
+        fields = parse_fields(request.query_params.get('fields'))  # Sparse fieldset, e.g. ?fields=title,overview
+        etags = request_etags(request)
+
+        # Movies in the local mirror are served without touching the cache or TMDb
+        movie = Movie.objects.filter(tmdb_id=movie_id).first()
+        if movie is not None:
+            etag = mirrored_movie_etag(movie, fields)
+            if etag_matches(etag, etags):
+                return not_modified(etag)
+            application_logger.info("Served movie details for ID %s from the local mirror", movie_id)
+            return Response(MovieRecord.from_movie(movie).to_dict(fields), headers=cache_headers(etag))
+
         cache_key = f"movie_{movie_id}"
-        
-        # Check cache first
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            application_logger.info(f"Cache hit for movie details with ID: {movie_id}")
-            return Response(cached_data)
-        
-        # If not in cache, fetch movie details from TMDb API
+        refresh = partial(refresh_movie_details_task.delay, movie_id)
+
+        # Clients revalidating details that are still cached get a 304, without the details being read
+        if etags:
+            entry_etag = cached_etags({cache_key: refresh}).get(cache_key)
+            etag = response_etag(entry_etag, fields) if entry_etag is not None else None
+            if etag is not None and etag_matches(etag, etags):
+                application_logger.info("Movie details not modified for ID: %s", movie_id)
+                return not_modified(etag)
+
+        # Served from cache while fresh, or stale while a background task refreshes it.
+        # On a miss, concurrent requests for the same movie share one TMDb call.
         try:
-            application_logger.info(f"Fetching details for movie ID: {movie_id}")
-            movie_details = fetch_movie_details(movie_id)
+            movie_details, state, entry_etag = cached_fetch(
+                cache_key,
+                lambda: fetch_movie_details(movie_id),
+                refresh=refresh,
+                with_etag=True,
+            )
         except Exception as e:
-            error_logger.error(f"Error fetching movie details for ID {movie_id}: {e}", exc_info=True)
-            return Response({"error": "Failed to fetch movie details. Please try again later."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Cache the movie details for 10 minutes
-        cache.set(cache_key, movie_details, timeout=600)
-        application_logger.info(f"Successfully fetched and cached details for movie ID: {movie_id}")
-        return Response(movie_details)
+            error_logger.error("Error fetching movie details for ID %s: %s", movie_id, e, exc_info=not isinstance(e, TMDbUnavailableError))
+            failure_status, headers = fetch_failure(e)
+            return Response({"error": "Failed to fetch movie details. Please try again later."}, status=failure_status, headers=headers)
+
+        if state == MISS:
+            application_logger.info("Successfully fetched and cached details for movie ID: %s", movie_id)
+        else:
+            application_logger.info("Cache %s for movie details with ID: %s", state, movie_id)
+        etag = response_etag(entry_etag, fields)
+        if etag_matches(etag, etags):
+            return not_modified(etag)
+        return Response(MovieRecord.from_dict(movie_details).to_dict(fields), headers=cache_headers(etag))
+
+
+class SimilarMoviesView(APIView):
+    """
+    Movies most similar to a movie by genres and by who rated them, from the
+    memory-mapped embedding index. ``?limit=`` sets the number of results.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        movie_id = kwargs["movie_id"]
+        try:
+            limit = min(max(int(request.query_params.get('limit', settings.SIMILAR_MOVIES_RESULTS)), 1), 100)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        similar = similar_movies(movie_id, limit)
+        if similar is None:
+            application_logger.info("No embedding for movie ID %s", movie_id)
+            return Response({"error": "No similar movies known for this movie."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"id": movie_id, "results": scored_movie_results(similar)})
+
+
+class MovieBatchView(APIView):
+    """
+    Fetch details for a list of movies in one request, e.g. for a grid of tiles.
+    Results are returned in request order, each with either its data or an error.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        serializer = MovieBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        movie_ids = list(dict.fromkeys(serializer.validated_data["ids"]))  # De-duplicated, in order
+
+        # Mirrored movies come from one query; the rest from one cache read,
+        # then concurrent TMDb calls for the misses
+        mirrored = {
+            movie.tmdb_id: MovieSerializer(movie).data
+            for movie in Movie.objects.filter(tmdb_id__in=movie_ids)
+        }
+        fetches = {
+            f"movie_{movie_id}": (
+                partial(fetch_movie_details, movie_id),
+                partial(refresh_movie_details_task.delay, movie_id),
+            )
+            for movie_id in movie_ids if movie_id not in mirrored
+        }
+        fetched = cached_fetch_many(fetches, max_concurrency=settings.TMDB_FANOUT_CONCURRENCY) if fetches else {}
+
+        results = []
+        for movie_id in movie_ids:
+            if movie_id in mirrored:
+                results.append({"id": movie_id, "data": mirrored[movie_id]})
+                continue
+            value, state = fetched[f"movie_{movie_id}"]
+            if state == ERROR:
+                error_logger.error("Error fetching movie details for ID %s in batch: %s", movie_id, value)
+                results.append({"id": movie_id, "error": "Failed to fetch movie details. Please try again later."})
+            else:
+                results.append({"id": movie_id, "data": value})
+        application_logger.info("Served batch of %s movie details", len(movie_ids))
+        return Response({"results": results})
+
+
+class CacheStatsView(APIView):
+    """
+    Report this process's hit/stale/miss counters for TMDb-backed cache entries,
+    the hit ratio of each cache tier, and the last recommendation precompute run.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({**cache_stats(), "tiers": tiered_cache.stats(), "precomputed": precompute_report()})
+
+
+class MetricsView(View):
+    """
+    This process's metrics in the Prometheus text format, for scraping.
+    If ``METRICS_TOKEN`` is set, scrapers must send it as a bearer token;
+    otherwise only admin users (session or JWT) may read them.
+    """
+
+    def get(self, request, *args, **kwargs):
+        token = settings.METRICS_TOKEN
+        if token:
+            if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+                return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+        else:
+            user = self.authenticate(request)
+            if not user.is_authenticated:
+                return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+            if not user.is_staff:
+                return HttpResponse(status=403)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @staticmethod
+    def authenticate(request):
+        """
+        The user of the session, or of the request's JWT (as for ``IsAdminUser`` API views).
+        """
+        if request.user.is_authenticated:
+            return request.user
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            result = None
+        return result[0] if result else request.user
+
+
+# Columns returned for a rating, in RatingSerializer's field order (``user`` is the user id)
+RATING_EXPORT_FIELDS = ('id', 'movie_id', 'rating', 'created_at', 'user')
 
 
 class RatingView(ListCreateAPIView):
@@ -83,6 +398,7 @@ class RatingView(ListCreateAPIView):
     """
     serializer_class = RatingSerializer
     permission_classes = [IsAuthenticated]  # Require authentication for creating ratings
+    pagination_class = RatingCursorPagination  # Newest first; follow "next" for older ratings
 
     def get_queryset(self):
         """
@@ -91,7 +407,8 @@ class RatingView(ListCreateAPIView):
         user = self.request.user
         # Ensure user is authenticated before returning ratings
         if user.is_authenticated:
-            return MovieRating.objects.filter(user=user)
+            # Load only the serialized columns, so rating columns added later are not fetched for every row
+            return MovieRating.objects.filter(user=user).only(*RATING_EXPORT_FIELDS)
         else:
             # Return an empty queryset or raise an error if the user is not authenticated
             return MovieRating.objects.none()
@@ -103,12 +420,21 @@ class RatingView(ListCreateAPIView):
         """
         user = self.request.user
         if user.is_authenticated:
-            serializer.save(user=user)
-            application_logger.info(f"Saved rating: {serializer.data}")
+            rating = serializer.save(user=user)
+            application_logger.info("Saved rating %s of movie %s by user %s", rating.pk, rating.movie_id, user.pk)
         else:
             error_logger.error("Anonymous user attempted to save a rating", exc_info=True)
             raise PermissionDenied("You must be logged in to submit a rating.")
 
+    @staticmethod
+    def saved_rating(user, idempotency_key):
+        """
+        The rating ``user`` already saved with ``idempotency_key``, if any.
+        """
+        if not idempotency_key:
+            return None
+        return MovieRating.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
     def post(self, request, *args, **kwargs):
         """
         Save a user's rating for a movie and return a confirmation response.
@@ -120,9 +446,97 @@ class RatingView(ListCreateAPIView):
 
         serializer = RatingSerializer(data=request.data)
         if serializer.is_valid():
-            self.perform_create(serializer)
-            application_logger.info(f"Successfully created rating: {serializer.data}")
+            if settings.RATINGS_WRITE_BEHIND:
+                # Buffered; drain_ratings_task saves it shortly
+                key = enqueue_rating(serializer.validated_data, request.user)
+                return Response({"status": "accepted", "idempotency_key": key}, status=status.HTTP_202_ACCEPTED)
+            key = serializer.validated_data.get('idempotency_key')
+            # A retried submission returns the rating saved the first time
+            existing = self.saved_rating(request.user, key)
+            if existing is not None:
+                return Response(RatingSerializer(existing).data, status=status.HTTP_200_OK)
+            try:
+                self.perform_create(serializer)
+            except IntegrityError:
+                # A concurrent retry with the same key saved it first
+                existing = self.saved_rating(request.user, key)
+                if existing is None:
+                    raise
+                return Response(RatingSerializer(existing).data, status=status.HTTP_200_OK)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
-            error_logger.error(f"Failed to create rating. Errors: {serializer.errors}", exc_info=True)
+            error_logger.error("Failed to create rating. Errors: %s", serializer.errors, exc_info=True)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RatingBatchView(APIView):
+    """
+    Save a list of ratings for the user in one request.
+    Either all rows are saved or, if any row is invalid, none is.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = RatingSerializer(
+            data=request.data, many=True, max_length=settings.RATINGS_BATCH_MAX_ROWS, context={'user': request.user},
+        )
+        if not serializer.is_valid():
+            # A dict of the invalid rows' indexes to their error dicts, or a non-field error for the whole body
+            error_logger.error("Rejected rating batch of user %s", request.user.pk)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            ratings = serializer.save(user=request.user)
+        except IntegrityError:
+            # A concurrent request saved one of the idempotency keys for another movie
+            error_logger.error("Conflicting idempotency keys in rating batch of user %s", request.user.pk)
+            return Response(
+                {"error": "An idempotency key in this batch was just used for another movie."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        application_logger.info("Saved %s ratings in a batch by user %s", len(ratings), request.user.pk)
+        return Response({"created": len(ratings)}, status=status.HTTP_201_CREATED)
+
+
+class RatingExportView(APIView):
+    """
+    Stream all of the user's ratings as NDJSON (one JSON object per line), newest first.
+
+    Rows are read with a server-side cursor where the database supports it and
+    written out as they arrive, so memory use does not grow with the number of ratings.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        rows = (
+            MovieRating.objects.filter(user=request.user)
+            .order_by('-created_at', '-id')
+            .values_list(*RATING_EXPORT_FIELDS)
+            .iterator(chunk_size=2000)
+        )
+        application_logger.info("Exporting ratings of user %s", request.user.pk)
+        response = StreamingHttpResponse(self.render(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="ratings.ndjson"'
+        return response
+
+    @staticmethod
+    def render(rows):
+        for row in rows:
+            rating = dict(zip(RATING_EXPORT_FIELDS, row))
+            # Same datetime format as the paginated list (DRF's ISO 8601 with "Z" for UTC)
+            created_at = rating['created_at'].isoformat()
+            rating['created_at'] = created_at[:-6] + 'Z' if created_at.endswith('+00:00') else created_at
+            yield json.dumps(rating) + '\n'
+
+
+class MovieRatingStatsView(RetrieveAPIView):
+    """
+    Rating count, mean and histogram of a movie, read from its precomputed aggregate.
+    """
+    serializer_class = MovieRatingStatsSerializer
+    permission_classes = [AllowAny]
+
+    def get_object(self):
+        movie_id = self.kwargs['movie_id']
+        # A movie nobody has rated yet has empty stats rather than a 404
+        return MovieRatingStats.objects.filter(movie_id=movie_id).first() or MovieRatingStats(movie_id=movie_id)